@@ -1,16 +1,215 @@
+import contextlib
 import datetime
-import mailbox
+import functools
+import os
 
+from archive.maildirindex import MaildirIndex
+from archive.mboxindex import MboxIndex
+from archive.mimeparse import parse_message, parse_headers, record_to_email, get_header_values, header_key
 from jmap.modules.mail import EmailModule
 from jmap.models.models import MailboxGetArgs, MailboxGetResponse, Mailbox, EmailQueryArgs, EmailQueryResponse, \
-    EmailGetArgs, EmailGetResponse, ThreadGetArgs, ThreadGetResponse
+    EmailGetArgs, EmailGetResponse, ThreadGetArgs, ThreadGetResponse, Thread, Email, HeaderFieldQuery
+
+
+@contextlib.contextmanager
+def updated(index):
+    """
+    Bring `index`, an `MboxIndex`, up to date, and keep any other request
+    from changing it within the block. Do only the reads which must see the
+    same version of the index in it, and build the response after, so that
+    requests do not wait for each other otherwise.
+    """
+    with index.lock:
+        index.update()
+        yield index
+
+
+def with_snapshot(handler):
+    """
+    Run a handler on a snapshot of the up to date `self.index`, given to it
+    as `index`. The index is only locked while it is updated, so requests
+    do not wait for each other otherwise.
+    """
+    @functools.wraps(handler)
+    def wrapped(self, context, args):
+        with self.index.lock:
+            self.index.update()
+            index = self.index.snapshot()
+        return handler(self, context, args, index)
+    return wrapped
+
+
+# The properties of an email which the index gives us without reading the
+# message, or which only need the file to be looked at.
+INDEX_PROPERTIES = {'id', 'blob_id', 'thread_id', 'mailbox_ids', 'keywords'}
+STAT_PROPERTIES = {'size', 'received_at'}
+
+# The properties of an email which an mbox `IndexEntry` gives us, without
+# the record of the message.
+MBOX_INDEX_PROPERTIES = {'id', 'blob_id', 'thread_id', 'mailbox_ids', 'size'}
+
+
+def get_email_keys(names):
+    """The JSON keys of the `Email` attributes `names`."""
+    return {Email.__json_keys__[name] for name in names}
+
+
+def project_email(result: dict, keys) -> dict:
+    """
+    Only the properties of the email `result` the client asked for. The
+    response passes dicts through as they are, so we have to do this here.
+    """
+    return {key: value for key, value in result.items() if key in keys}
 
 
 class MailboxEmailModule(EmailModule):
     """
-    Works on top of the traditional mailbox format.
+    Works on top of the traditional mailbox format: serves JMAP email from a
+    Maildir (see `MaildirIndex` for how it is read).
+
+    - The folders of the Maildir are the mailboxes.
+    - The flags in the filenames of the messages are their keywords.
+    - Every email is its own thread.
     """
 
+    def __init__(self, maildir, *, cache_file=None, **kwargs):
+        self.index = MaildirIndex(maildir, cache_file)
+        self.index.update()
+        super().__init__(**kwargs)
+
+    def get_state_for(self, type: str):
+        return str(self.index.state)
+
+    @staticmethod
+    def iter_emails(index: MaildirIndex, mailbox_id=None):
+        for folder in index.folders.values():
+            if mailbox_id is not None and folder.id != mailbox_id:
+                continue
+            for message in sorted(folder.messages.values(), key=lambda message: message.uid):
+                yield folder, message
+
+    @with_snapshot
+    def handle_mailbox_get(self, context, args: MailboxGetArgs, index: MaildirIndex):
+        folders = index.folders
+
+        ids = args.ids if args.ids is not None else list(folders)
+        return MailboxGetResponse(
+            account_id=args.account_id,
+            state=str(index.state),
+            list=[
+                Mailbox.Properties(
+                    id=folder.id,
+                    name=folder.display_name,
+                    parent_id=folder.parent_id,
+                    role=folder.role,
+                    sort_order=0,
+                    total_emails=len(folder.messages),
+                    unread_emails=folder.unread,
+                    total_threads=len(folder.messages),
+                    unread_threads=folder.unread,
+                    is_subscribed=True,
+                )
+                for folder in (folders[id] for id in ids if id in folders)
+            ],
+            not_found=[id for id in ids if id not in folders]
+        )
+
+    @with_snapshot
+    def handle_email_query(self, context, args: EmailQueryArgs, index: MaildirIndex) -> EmailQueryResponse:
+        mailbox_id = args.filter.in_mailbox if args.filter else None
+        ids = [index.get_email_id(folder, message) for folder, message in self.iter_emails(index, mailbox_id)]
+        position = args.position or 0
+        end = None if args.limit is None else position + args.limit
+
+        return EmailQueryResponse(
+            account_id=args.account_id,
+            collapse_threads=args.collapse_threads,
+            total=len(ids),
+            query_state=str(index.state),
+            position=position,
+            ids=ids[position:end],
+            can_calculate_changes=False,
+        )
+
+    @with_snapshot
+    def handle_email_get(self, context, args: EmailGetArgs, index: MaildirIndex) -> EmailGetResponse:
+        if args.ids is None:
+            ids = [index.get_email_id(folder, message) for folder, message in self.iter_emails(index)]
+        else:
+            ids = args.ids
+
+        # Only read the messages if the client asked for something in them, and
+        # only parse all of them if it is not just headers (`HeaderFieldQuery`).
+        names = {name for name in args.properties if isinstance(name, str)} | {'id'}
+        header_queries = [query for query in args.properties if isinstance(query, HeaderFieldQuery)]
+        parse = not names <= INDEX_PROPERTIES | STAT_PROPERTIES
+        read = parse or bool(header_queries)
+        stat = not read and bool(names & STAT_PROPERTIES)
+        keys = get_email_keys(names) | {header_key(query) for query in header_queries}
+
+        emails = []
+        not_found = []
+        for id in ids:
+            folder, message = index.get_message(id)
+            if message is None:
+                not_found.append(id)
+                continue
+
+            result = {}
+            try:
+                if read:
+                    with open(folder.get_path(message), 'rb') as file:
+                        data = file.read()
+                        mtime = os.fstat(file.fileno()).st_mtime
+                    if parse:
+                        result = record_to_email(parse_message(data))
+                    result.update(get_header_values(parse_headers(data), header_queries))
+                    size = len(data)
+                elif stat:
+                    file_stat = os.stat(folder.get_path(message))
+                    size, mtime = file_stat.st_size, file_stat.st_mtime
+            except OSError:
+                # Deleted since we last looked
+                not_found.append(id)
+                continue
+
+            result.update({
+                'id': id,
+                'blobId': id,
+                'threadId': id,
+                'mailboxIds': {folder.id: True},
+                'keywords': message.keywords,
+            })
+            if read or stat:
+                result.update({
+                    'size': size,
+                    # The message was delivered when the file was written
+                    'receivedAt': datetime.datetime.fromtimestamp(mtime, datetime.timezone.utc),
+                })
+            emails.append(project_email(result, keys))
+
+        return EmailGetResponse(
+            account_id=args.account_id,
+            state=str(index.state),
+            list=emails,
+            not_found=not_found
+        )
+
+    @with_snapshot
+    def handle_thread_get(self, context, args: ThreadGetArgs, index: MaildirIndex) -> ThreadGetResponse:
+        if args.ids is None:
+            ids = [index.get_email_id(folder, message) for folder, message in self.iter_emails(index)]
+        else:
+            ids = args.ids
+        found = {id for id in ids if index.get_message(id)[1] is not None}
+
+        return ThreadGetResponse(
+            account_id=args.account_id,
+            state=str(index.state),
+            list=[Thread(id=id, email_ids=[id]) for id in ids if id in found],
+            not_found=[id for id in ids if id not in found]
+        )
+
 
 class MboxModule(EmailModule):
     """This serves JMAP email from a particular mbox file.
@@ -48,20 +247,32 @@ class MboxModule(EmailModule):
     Related links:
 
     - https://wiki.dovecot.org/Design/Indexes/MailIndexApi
+
+    We keep our own index, in a file next to the mbox (see `MboxIndex`). It is
+    built on startup, if the mbox file changed since the last time, and lets us
+    answer queries without reading the messages. Mail appended to the file
+    later is added to the index on the next request. The file is accessed
+    through `mmap` (see `MboxReader`), so reading a message only reads that
+    message. When indexed, the messages are parsed into the properties
+    Email/get returns (see `archive.mimeparse`), by a pool of processes.
     """
 
-    def __init__(self, mbox_file, **kwargs):
-        self.mbox = mailbox.mbox(mbox_file)
+    def __init__(self, mbox_file, *, index_file=None, workers=None, **kwargs):
+        self.index = MboxIndex(mbox_file, index_file, workers=workers)
+        self.index.update()
         super().__init__(**kwargs)
 
     def get_state_for(self, type: str):
-        return len(self.mbox)
+        return str(self.index.state)
 
     def handle_mailbox_get(self, context, args: MailboxGetArgs):
+        with updated(self.index) as index:
+            state = str(index.state)
+
         # mbox does not support folders itself, so we just pretend there is a single one.
         return MailboxGetResponse(
             account_id=args.account_id,
-            state=self.get_state_for(Mailbox),
+            state=state,
             list=[
                 Mailbox(
                     id='default',
@@ -75,20 +286,19 @@ class MboxModule(EmailModule):
     def handle_email_query(self, context, args: EmailQueryArgs) -> EmailQueryResponse:
         """Return ids of emails that match the given filters.
         """
-
-        filtered = self.mbox.items()
-        result = filtered[args.position:args.limit]
+        with updated(self.index) as index:
+            result = index.get_range(args.position or 0, args.limit)
+            total = index.count()
+            state = str(index.state)
         # TODO: Apply the sort
 
         return EmailQueryResponse(
             account_id=args.account_id,
             collapse_threads=args.collapse_threads,
-            filter=args.filter,
-            #sort=args.sort,
-            total=1000,
-            query_state='none',
-            position=0,
-            ids=[x[0] for x in result],
+            total=total,
+            query_state=state,
+            position=args.position or 0,
+            ids=[entry.id for entry in result],
             can_calculate_changes=False, # TODO: We probably can
         )
 
@@ -96,75 +306,65 @@ class MboxModule(EmailModule):
         """
         Query the given emails.
         """
-        if not args.ids:
-            matching = self.mbox.items()
-        else:
-            matching = filter(lambda x: str(x[0]) in args.ids, self.mbox.items())
+        names = {name for name in args.properties if isinstance(name, str)} | {'id'}
+        header_queries = [query for query in args.properties if isinstance(query, HeaderFieldQuery)]
+        keys = get_email_keys(names) | {header_key(query) for query in header_queries}
+
+        with updated(self.index) as index:
+            if args.ids is None:
+                matching = index.get_range(0, None)
+            else:
+                matching = index.get_many(args.ids)
+            # The messages were parsed when they were indexed. Only load their
+            # records if the client asked for more than the index entries have.
+            records = None if names <= MBOX_INDEX_PROPERTIES else index.get_records(matching)
+            # The entries give where the messages are in this version of the file.
+            headers = {entry.seq: index.read_headers(entry) for entry in matching} if header_queries else None
+            state = str(index.state)
+        found = {entry.id for entry in matching}
+
+        emails = []
+        for entry in matching:
+            result = {}
+            if records is not None:
+                result = record_to_email(records[entry.seq])
+                result['receivedAt'] = result['receivedAt'] or result['sentAt']
+            if headers is not None:
+                result.update(get_header_values(headers[entry.seq], header_queries))
+            result.update({
+                'id': entry.id,
+                'blobId': entry.id,
+                'threadId': entry.thread_id,
+                'mailboxIds': {'default': True},
+                'size': entry.size,
+            })
+            emails.append(project_email(result, keys))
 
         return EmailGetResponse(
             account_id=args.account_id,
-            state=self.get_state_for(Mailbox),
-            list=[
-                python_message_to_jmap_message(message, id=id, query_thread='threadId' in args.properties)
-                for id, message in matching
-            ],
-            not_found=[]
+            state=state,
+            list=emails,
+            not_found=[id for id in args.ids or [] if id not in found]
         )
 
     def handle_thread_get(self, context, args: ThreadGetArgs) -> ThreadGetResponse:
-        if not args.ids:
-            matching = self.mbox.items()
-        else:
-            matching = filter(lambda x: str(x[0]) in args.ids, self.mbox.items())
+        with updated(self.index) as index:
+            if args.ids is None:
+                matching = index.get_range(0, None)
+            else:
+                matching = index.get_threads(args.ids)
+            state = str(index.state)
+
+        threads = {}
+        for entry in matching:
+            threads.setdefault(entry.thread_id, []).append(entry.id)
 
         return ThreadGetResponse(
             account_id=args.account_id,
-            state=self.get_state_for(Mailbox),
+            state=state,
             list=[
-                dict(
-                    id='k' +str(id),
-                    emailIds=[str(id)],
-                    accountId='default'
-                )
-                for id, m in matching
+                Thread(id=thread_id, email_ids=email_ids)
+                for thread_id, email_ids in threads.items()
             ],
-            not_found=[]
+            not_found=[id for id in args.ids or [] if id not in threads]
         )
-
-
-def python_message_to_jmap_message(pymsg, id, query_thread):
-    if query_thread or True:
-        result = {
-            "id": str(id),
-            "threadId": str(id),
-            'mailboxIds': {'default': True},
-            "keywords": {
-                "$Seen": True,
-            },
-            "hasAttachment": True,
-            "receivedAt": datetime.datetime.utcnow(),
-            "subject": 'ById: Opera Mail: slick, stylish, sophisticated',
-            "from": [{"name": 'ACME Staff', "email": 'nmjenkins@facebook.com'}],
-            "to": [{"name": 'A.N. Other', "email": 'jimmy@jimjim.ja'},
-                   {"name": 'Imogen Jones', "email": 'immy@jones.com'}],
-            "size": 100,
-            'preview': 'Lorem ipsum dolor sit amet, consectetur adipisicing elit, sed do eiusmod tempor incididunt ut labore et dolore magna aliqua. Ut enim adminim veniam, quis nostrud exercitation ullamco laboris nisi ut aliquip ex ea commodo consequat. Duis aute irure dolor in reprehenderit in voluptate velit esse cillum dolore eu fugiat nulla pariatur.'
-        }
-        return result
-
-    else:
-        result = {
-            "id": str(id),
-            "blobId": 'http://messages/' + str(id),
-            "cc": None,
-            "bcc": None,
-            "replyTo": [{
-                "name": 'Neil Jenkins',
-                "email": 'neil@replyto.com'
-            }],
-            "attachments": [],
-            "sentAt": datetime.datetime.utcnow(),
-            "htmlBody": """<div>asdfasdf<br></div><div>a<br></div><div>sdfasdf<br></div><div><br></div><div>asdf<br></div><div>asdf<br></div><div><br></div><div>asdf</div><div><br></div><div>On Fri, 20 Jan 2012, at 06:14 AM, Marian Hackett wrote:<br></div><blockquote><div><br></div><div><a href=\"https://bugs.opera.com/browse/IRIS-1199 target=\" defang__top\"=\"\" target=\"_blank\">https://bugs.opera.com/browse/IRIS-1199</a target=\"_blank\"><br></div><div><br></div><div><br></div><div>Marian Hackett updated IRIS-1199:<br></div><div>---------------------------------<br></div><div><br></div><div> &nbsp; Priority": P3&nbsp; (was: \u2014)<br></div><div> &nbsp; &nbsp; &nbsp; &nbsp; CC": [johan, marianh, neilj, rjlov, robm]<br></div><div><br></div><div><br></div><div><br></div><div>-- <br></div><div>This message is automatically generated by JIRA.<br></div><div><br></div><div><br></div><div><br></div></blockquote>\n""",
-            "textBody": """On Mon, 14 Mar 2011 13:58:04 +0100, Peter Krefting <peter@opera.com> wrote:\n\n> Conrad Newton <conrad.newton@opera.com>:\n>\n>> the only special item you have to watch out for is the deduction for  \n>> being a foreigner. This deduction is relevant only during your first  \n>> two years in Norway, and it will save you some money.\n>\n> Is it only two years now? Then someone should update  \n> https://wiki.oslo.osa/staffwiki/ExPats/Tax\n>\n\n\"This page was last modified on 12 October 2005, at 11:26.\"\n\nYes, it's been 2 years ever since 2006, in that case, since when I started  \nit was :) 2 years ;) and has stayed the same since. :) ;)\n\nThere's an email address here:\n\nblah@blah.com\n\nAnd a url with space:\n\n<http://somewhere.com/a url\"with spaces.txt>\n\nA regular url here": http://somewhere.com\n\n> Some indented\n> text here\n\nAnd *this* should be bold and _this_ should be underlined\n\nThis is an FTP link"": ftp://foo.example.com.\n\nWhat about _this_and_this_ which should all be underlined, and *all*of*this* should be bold\n\n\n-- \nDevil May Care\n_______________________________________________\nEx-pats mailing list\nEx-pats@list.opera.com\nhttps://list.opera.com/mailman/listinfo/ex-pats\n\n""",
-        }
-        return result
\ No newline at end of file
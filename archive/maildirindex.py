@@ -0,0 +1,318 @@
+"""
+Keeps track of the messages in a Maildir, and their flags.
+
+Scanning a large Maildir - listing the directories, and looking at the names
+of all files - is slow, and we would have to do it for every request. Instead,
+we keep what we found in a cache file, and on every request only look at the
+modification times of the `new/` and `cur/` directories of each folder: only
+the directories which changed are listed again.
+
+A directory changed so recently that a further change might not change its
+modification time - the filesystem's clock would not have moved on - is
+listed again on the next request, until its modification time is old enough
+to be trusted.
+
+The cache also gives every message a uid, which stays the same as long as
+the message is in the folder, even when its flags change, or when it is
+moved from `new/` to `cur/`.
+
+The folders follow the Maildir++ convention: the Maildir itself is the inbox,
+and the subdirectories starting with a dot, such as `.Sent` or `.Lists.python`,
+are further folders.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import NamedTuple, Optional, Dict, List
+
+
+CACHE_VERSION = 1
+
+SUBDIRS = ('new', 'cur')
+
+# The coarsest resolution of modification times we expect from a filesystem
+MTIME_RESOLUTION_NS = 2 * 10 ** 9
+
+# https://cr.yp.to/proto/maildir.html
+FLAG_KEYWORDS = {
+    'D': '$draft',
+    'F': '$flagged',
+    'P': '$forwarded',
+    'R': '$answered',
+    'S': '$seen',
+}
+
+ROLES = {
+    'archive': 'archive',
+    'drafts': 'drafts',
+    'junk': 'junk',
+    'sent': 'sent',
+    'spam': 'junk',
+    'trash': 'trash',
+}
+
+
+class MaildirMessage(NamedTuple):
+    uid: int
+    # "new" or "cur"
+    subdir: str
+    filename: str
+    # The flags from the filename, such as "RS"
+    flags: str
+
+    @property
+    def keywords(self) -> Dict[str, bool]:
+        return {FLAG_KEYWORDS[flag]: True for flag in self.flags if flag in FLAG_KEYWORDS}
+
+    @property
+    def is_unread(self) -> bool:
+        return 'S' not in self.flags
+
+
+def split_filename(filename):
+    """
+    Split a filename into the unique part, which identifies the message, and
+    its flags.
+    """
+    unique, _, info = filename.partition(':')
+    flags = info[2:] if info.startswith('2,') else ''
+    return unique, flags
+
+
+def make_id(name: str) -> str:
+    return hashlib.blake2b(name.encode('utf-8'), digest_size=6).hexdigest()
+
+
+class Folder:
+    """
+    A folder of the Maildir. `name` is the Maildir++ name, such as
+    "Lists.python", or "" for the inbox.
+    """
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.id = make_id(name)
+
+        # What we know about the directories: their modification time, and
+        # the files in them.
+        self.mtimes: Dict[str, int] = {}
+        self.listings: Dict[str, List[str]] = {subdir: [] for subdir in SUBDIRS}
+
+        # By the unique part of the filename
+        self.messages: Dict[str, MaildirMessage] = {}
+        self.next_uid = 1
+
+        self.by_uid: Dict[int, MaildirMessage] = {}
+        self.unread = 0
+
+    @property
+    def display_name(self):
+        return self.name.rsplit('.', 1)[-1] if self.name else 'Inbox'
+
+    @property
+    def parent_id(self) -> Optional[str]:
+        if not self.name:
+            return None
+        return make_id(self.name.rsplit('.', 1)[0]) if '.' in self.name else None
+
+    @property
+    def role(self) -> Optional[str]:
+        if not self.name:
+            return 'inbox'
+        if '.' in self.name:
+            return None
+        return ROLES.get(self.name.lower())
+
+    def scan(self) -> bool:
+        """
+        List the directories which changed since we last looked, and update
+        the messages. Returns `True` if anything changed.
+        """
+        changed_subdirs = []
+        for subdir in SUBDIRS:
+            now = time.time_ns()
+            mtime = os.stat(os.path.join(self.path, subdir)).st_mtime_ns
+            if self.mtimes.get(subdir) != mtime:
+                with os.scandir(os.path.join(self.path, subdir)) as entries:
+                    self.listings[subdir] = [entry.name for entry in entries if not entry.name.startswith('.')]
+                # If it is too recent, a change after we listed the directory
+                # might leave the modification time as it is.
+                self.mtimes[subdir] = mtime if now - mtime >= MTIME_RESOLUTION_NS else None
+                changed_subdirs.append(subdir)
+
+        if not changed_subdirs:
+            return False
+
+        messages = {}
+        for subdir in SUBDIRS:
+            for filename in self.listings[subdir]:
+                unique, flags = split_filename(filename)
+                existing = self.messages.get(unique)
+                if existing is not None:
+                    message = existing._replace(subdir=subdir, filename=filename, flags=flags)
+                else:
+                    message = MaildirMessage(uid=self.next_uid, subdir=subdir, filename=filename, flags=flags)
+                    self.next_uid += 1
+                messages[unique] = message
+
+        changed = messages != self.messages
+        self.messages = messages
+        self.update_lookups()
+        return changed
+
+    def update_lookups(self):
+        self.by_uid = {message.uid: message for message in self.messages.values()}
+        self.unread = sum(1 for message in self.messages.values() if message.is_unread)
+
+    def get_path(self, message: MaildirMessage):
+        return os.path.join(self.path, message.subdir, message.filename)
+
+    def to_json(self):
+        return {
+            'mtimes': self.mtimes,
+            'next_uid': self.next_uid,
+            'messages': [
+                [message.uid, message.subdir, message.filename]
+                for message in self.messages.values()
+            ],
+        }
+
+    def load_json(self, data):
+        self.mtimes = data['mtimes']
+        self.next_uid = data['next_uid']
+        self.listings = {subdir: [] for subdir in SUBDIRS}
+        self.messages = {}
+        for uid, subdir, filename in data['messages']:
+            unique, flags = split_filename(filename)
+            self.listings[subdir].append(filename)
+            self.messages[unique] = MaildirMessage(uid=uid, subdir=subdir, filename=filename, flags=flags)
+        self.update_lookups()
+
+
+class MaildirIndex:
+    """
+    The folders and messages of the Maildir at `root`. The cache is stored
+    in `cache_path`, by default `.jmap-cache.json` inside the Maildir.
+
+    Call `update()` to pick up any changes. Hold `lock` while using the
+    index, if it is shared between threads, or use a `snapshot()`.
+    """
+
+    def __init__(self, root, cache_path=None):
+        self.root = root
+        self.cache_path = cache_path or os.path.join(root, '.jmap-cache.json')
+        self.folders: Dict[str, Folder] = {}
+        # Increases whenever something changed
+        self.state = 0
+        self.lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != CACHE_VERSION:
+            return
+
+        self.state = data['state']
+        for name, folder_data in data['folders'].items():
+            folder = Folder(name, self.get_folder_path(name))
+            folder.load_json(folder_data)
+            self.folders[folder.id] = folder
+
+    def save(self):
+        data = {
+            'version': CACHE_VERSION,
+            'state': self.state,
+            'folders': {folder.name: folder.to_json() for folder in self.folders.values()},
+        }
+        # Other processes might be writing the cache at the same time
+        with tempfile.NamedTemporaryFile(
+                'w', encoding='utf-8', dir=os.path.dirname(self.cache_path),
+                prefix=os.path.basename(self.cache_path), suffix='.tmp', delete=False) as file:
+            try:
+                json.dump(data, file)
+            except BaseException:
+                os.remove(file.name)
+                raise
+        os.replace(file.name, self.cache_path)
+
+    def get_folder_path(self, name):
+        return os.path.join(self.root, f'.{name}') if name else self.root
+
+    def find_folders(self) -> List[str]:
+        names = ['']
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') and entry.is_dir() and \
+                        os.path.isdir(os.path.join(entry.path, 'cur')):
+                    names.append(entry.name[1:])
+        return names
+
+    def update(self) -> bool:
+        """
+        Look for changes; returns `True` if there were any.
+        """
+        with self.lock:
+            return self._update()
+
+    def _update(self):
+        changed = False
+
+        folders = {}
+        for name in self.find_folders():
+            folder_id = make_id(name)
+            folder = self.folders.get(folder_id)
+            if folder is None:
+                folder = Folder(name, self.get_folder_path(name))
+                changed = True
+            if folder.scan():
+                changed = True
+            folders[folder_id] = folder
+
+        if folders.keys() != self.folders.keys():
+            changed = True
+        self.folders = folders
+
+        if changed:
+            self.state += 1
+            self.save()
+        return changed
+
+    def snapshot(self) -> 'MaildirIndex':
+        """
+        A copy of the index as it is now, which can be read without holding
+        `lock`: later updates do not change it. Do not update the copy.
+        """
+        with self.lock:
+            snapshot = copy.copy(self)
+            # `Folder.scan` replaces the messages and their lookups, rather
+            # than changing them, so a shallow copy of each folder will do.
+            snapshot.folders = {folder_id: copy.copy(folder) for folder_id, folder in self.folders.items()}
+            return snapshot
+
+    def get_message(self, email_id):
+        """
+        Returns the folder and the message with the given email id, or
+        `(None, None)`.
+        """
+        folder_id, _, uid = email_id.partition('-')
+        folder = self.folders.get(folder_id)
+        if folder is None or not uid.isdigit():
+            return None, None
+        message = folder.by_uid.get(int(uid))
+        if message is None:
+            return None, None
+        return folder, message
+
+    @staticmethod
+    def get_email_id(folder: Folder, message: MaildirMessage):
+        return f'{folder.id}-{message.uid}'
@@ -0,0 +1,366 @@
+"""
+An index of an mbox file, kept in a sqlite database next to it.
+
+For every message, it stores where in the file the message is, and what we
+need to answer queries without reading the message itself: a stable id, the
+Message-ID, the thread, the date and the size. The index is built once, by
+reading through the whole file.
+
+Each message is also parsed, and the record of its `Email` properties is
+stored with it (see `archive.mimeparse`). This is by far the slowest part of
+building the index, and is spread across several processes.
+
+When the mbox file changed since (as determined by its size and modification
+time), usually new mail was appended to it. If the file grew, and what was
+there before is unchanged, only the new messages are added to the index;
+otherwise, it is rebuilt from scratch.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import NamedTuple, Optional, List, Dict
+
+from archive.mboxreader import MboxReader
+from archive.mimeparse import parse_messages, parse_timestamp
+
+
+INDEX_VERSION = 3
+
+# How much of the start and the end of the file is checksummed, to tell
+# whether new mail was appended to it or it was rewritten.
+CHECKSUM_BLOCK_SIZE = 64 * 1024
+
+
+class IndexEntry(NamedTuple):
+    # The position of the message in the file, starting at 0.
+    seq: int
+    id: str
+    # Where the message starts (with the "From " line), and how many bytes
+    # it takes up, including the "From " line and the empty line after it.
+    offset: int
+    length: int
+    # The size of the message itself, without the "From " line.
+    size: int
+    message_id: Optional[str]
+    thread_id: str
+    # The Date header, as a unix timestamp
+    date: Optional[int]
+
+
+ENTRY_COLUMNS = ', '.join(IndexEntry._fields)
+
+
+def short_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def parse_message_id(value) -> Optional[str]:
+    if value is None:
+        return None
+    # Headers with 8-bit bytes in them are given as `email.header.Header`
+    value = str(value).strip()
+    start = value.find('<')
+    end = value.find('>', start)
+    if start != -1 and end != -1:
+        return value[start + 1:end]
+    return value or None
+
+
+def make_entry(seq: int, offset: int, length: int, reader: MboxReader) -> IndexEntry:
+    """
+    Create the index entry for the message found at `offset`. Only the headers
+    of the message are parsed.
+    """
+    headers = reader.get_headers(offset, length)
+    message_id = parse_message_id(headers.get('Message-ID'))
+
+    # The thread is identified by the first message in it, which is
+    # the first one in References; or the one replied to.
+    references = str(headers.get('References') or '').split()
+    root = parse_message_id(references[0]) if references else \
+        parse_message_id(headers.get('In-Reply-To'))
+    thread_key = root or message_id
+
+    date = parse_timestamp(headers['Date'])
+
+    with memoryview(reader.map) as view:
+        id = short_hash(view[offset:offset + length])
+    start, end = reader.get_bounds(offset, length)
+    return IndexEntry(
+        seq=seq,
+        id=id,
+        offset=offset,
+        length=length,
+        size=end - start,
+        message_id=message_id,
+        thread_id=short_hash(thread_key.encode('utf-8', 'replace')) if thread_key else id,
+        date=date,
+    )
+
+
+def locked(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class MboxIndex:
+    """
+    The index of the mbox file at `mbox_path`. It is stored in `index_path`,
+    by default the mbox path with `.jmapindex` appended. The messages are
+    parsed in `workers` processes; by default, one per CPU.
+
+    Call `update()` before using it, to build the index if necessary.
+
+    It can be shared between threads: its methods hold `lock`, so one
+    thread never uses the database while another rebuilds it. Hold `lock`
+    yourself across several calls to see the same version of the index.
+    """
+
+    def __init__(self, mbox_path, index_path=None, *, workers=None):
+        self.mbox_path = mbox_path
+        self.index_path = index_path or f'{mbox_path}.jmapindex'
+        self.workers = workers
+        self.db = None
+        self.reader = None
+        self.lock = threading.RLock()
+
+    @locked
+    def update(self):
+        """
+        Make sure the index matches the mbox file, building it or adding the
+        messages appended to the file if necessary. Returns `True` if the
+        index changed.
+        """
+        if self.reader is None:
+            self.reader = MboxReader(self.mbox_path)
+        else:
+            self.reader.refresh()
+
+        # What was mapped, which is what we index
+        stat = self.reader.stat
+        if self.db is None and os.path.exists(self.index_path):
+            self.db = self.connect(self.index_path)
+        if self.db is not None and self.get_meta('version') == INDEX_VERSION:
+            if self.is_current(stat):
+                return False
+            if self.is_appended(stat):
+                self.append(stat)
+                return True
+
+        self.build(stat)
+        return True
+
+    def connect(self, path):
+        return sqlite3.connect(path, check_same_thread=False)
+
+    def get_meta(self, key):
+        try:
+            row = self.db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        except sqlite3.DatabaseError:
+            return None
+        return row[0] if row else None
+
+    def set_meta(self, db, stat, state):
+        db.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', [
+            ('version', INDEX_VERSION),
+            ('mbox_size', stat.st_size),
+            ('mbox_mtime', stat.st_mtime_ns),
+            ('checksum', self.checksum(stat.st_size)),
+            ('state', state),
+        ])
+
+    @property
+    @locked
+    def state(self) -> int:
+        """Increases every time the index changes."""
+        return self.get_meta('state') or 0
+
+    def checksum(self, size) -> str:
+        """A checksum of the first `size` bytes of the mbox file. Only the
+        start and the end of it are read: this is to notice the file being
+        rewritten or truncated, not to detect any change whatsoever.
+        """
+        with memoryview(self.reader.map) as view:
+            return short_hash(
+                view[:min(size, CHECKSUM_BLOCK_SIZE)].tobytes() +
+                view[max(0, size - CHECKSUM_BLOCK_SIZE):size].tobytes())
+
+    def is_current(self, stat):
+        return (
+            self.get_meta('mbox_size') == stat.st_size and
+            self.get_meta('mbox_mtime') == stat.st_mtime_ns
+        )
+
+    def is_appended(self, stat):
+        """Whether the mbox file only grew since the index was updated."""
+        size = self.get_meta('mbox_size')
+        return (
+            size is not None and stat.st_size > size and
+            self.get_meta('checksum') == self.checksum(size)
+        )
+
+    def build(self, stat):
+        """
+        Build the index from scratch. It is written to a new file first,
+        which then replaces the existing index.
+        """
+        state = 0
+        if self.db is not None:
+            # The state must keep increasing, even if we start over
+            state = self.get_meta('state') or 0
+            self.db.close()
+            self.db = None
+
+        tmp_path = f'{self.index_path}.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        db = self.connect(tmp_path)
+        with db:
+            db.executescript('''
+                CREATE TABLE meta (key TEXT PRIMARY KEY, value);
+                CREATE TABLE messages (
+                    seq INTEGER PRIMARY KEY,
+                    id TEXT NOT NULL UNIQUE,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    message_id TEXT,
+                    thread_id TEXT NOT NULL,
+                    date INTEGER,
+                    record TEXT
+                );
+                CREATE INDEX messages_thread_id ON messages (thread_id);
+            ''')
+
+            for seq, (offset, length) in enumerate(self.reader.scan()):
+                self.insert(db, make_entry(seq, offset, length, self.reader))
+            self.parse(db, 0)
+
+            self.set_meta(db, stat, state + 1)
+        db.close()
+
+        os.replace(tmp_path, self.index_path)
+        self.db = self.connect(self.index_path)
+
+    def append(self, stat):
+        """
+        Add the messages appended to the mbox file to the index. The last
+        message we knew about is indexed again: it might not have been
+        complete when we last looked, and would then be longer now.
+        """
+        last = self.db.execute(
+            f'SELECT {ENTRY_COLUMNS} FROM messages ORDER BY seq DESC LIMIT 1').fetchone()
+        last = IndexEntry(*last) if last else None
+        start, start_seq = (last.offset, last.seq) if last else (0, 0)
+
+        with self.db:
+            self.db.execute('DELETE FROM messages WHERE seq >= ?', (start_seq,))
+            for seq, (offset, length) in enumerate(self.reader.scan(start), start_seq):
+                self.insert(self.db, make_entry(seq, offset, length, self.reader))
+            self.parse(self.db, start_seq)
+            self.set_meta(self.db, stat, self.state + 1)
+
+    def parse(self, db, start_seq):
+        """Parse the messages from `start_seq` on, and store their records."""
+        ranges = db.execute(
+            'SELECT seq, offset, length FROM messages WHERE seq >= ? ORDER BY seq', (start_seq,)).fetchall()
+        db.executemany('UPDATE messages SET record = ? WHERE seq = ?', (
+            (json.dumps(record), seq)
+            for seq, record in parse_messages(
+                self.mbox_path, ranges, stat=self.reader.stat, workers=self.workers)
+        ))
+
+    def insert(self, db, entry: IndexEntry):
+        # The same message can be in the file more than once
+        id, counter = entry.id, 1
+        while True:
+            try:
+                db.execute(f'INSERT INTO messages ({ENTRY_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', entry)
+                return
+            except sqlite3.IntegrityError:
+                counter += 1
+                entry = entry._replace(id=f'{id}-{counter}')
+
+    @locked
+    def count(self) -> int:
+        return self.db.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+    @locked
+    def get_range(self, position: int, limit: Optional[int]) -> List[IndexEntry]:
+        """The entries of the messages `position` to `position + limit`, in
+        the order they are in the file.
+        """
+        rows = self.db.execute(
+            f'SELECT {ENTRY_COLUMNS} FROM messages WHERE seq >= ? ORDER BY seq LIMIT ?',
+            (position, -1 if limit is None else limit))
+        return [IndexEntry(*row) for row in rows]
+
+    @locked
+    def get_many(self, ids: List[str]) -> List[IndexEntry]:
+        """The entries for the given message ids, in the order of the file.
+        Unknown ids are skipped.
+        """
+        return self._select('id', ids)
+
+    @locked
+    def get_threads(self, thread_ids: List[str]) -> List[IndexEntry]:
+        """The entries of the messages in the given threads, in the order of
+        the file.
+        """
+        return self._select('thread_id', thread_ids)
+
+    @locked
+    def get_records(self, entries: List[IndexEntry]) -> Dict[int, dict]:
+        """The records of the given entries, by their `seq`; see
+        `archive.mimeparse`.
+        """
+        records = {}
+        seqs = [entry.seq for entry in entries]
+        for index in range(0, len(seqs), 500):
+            chunk = seqs[index:index + 500]
+            rows = self.db.execute(
+                f'SELECT seq, record FROM messages WHERE seq IN ({", ".join("?" * len(chunk))})', chunk)
+            records.update((seq, json.loads(record)) for seq, record in rows if record is not None)
+        return records
+
+    def _select(self, column, values):
+        entries = []
+        values = list(values)
+        # Stay below the limit for the number of parameters of a query
+        for index in range(0, len(values), 500):
+            chunk = values[index:index + 500]
+            rows = self.db.execute(
+                f'SELECT {ENTRY_COLUMNS} FROM messages WHERE {column} IN ({", ".join("?" * len(chunk))})',
+                chunk)
+            entries.extend(IndexEntry(*row) for row in rows)
+        entries.sort(key=lambda entry: entry.seq)
+        return entries
+
+    @locked
+    def read(self, entry: IndexEntry) -> memoryview:
+        """The message of `entry` (without the "From " line), as a view of
+        the mapped file; see `MboxReader`.
+        """
+        return self.reader.get(entry.offset, entry.length)
+
+    @locked
+    def read_headers(self, entry: IndexEntry):
+        """Parse only the headers of the message of `entry`."""
+        return self.reader.get_headers(entry.offset, entry.length)
+
+    @locked
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
@@ -0,0 +1,117 @@
+"""
+Reads an mbox file through `mmap`.
+
+Unlike `mailbox.mbox`, this does not read the file to find the messages in
+it, and does not copy a message to access it: the messages are slices of the
+mapped file, and only the pages actually accessed are read from disk.
+"""
+
+import mmap
+import os
+from email.parser import BytesHeaderParser
+from email.policy import compat32
+from typing import Iterator, Tuple
+
+
+class MboxReader:
+    """
+    The mbox file at `path`, mapped into memory. The messages in it are given
+    by their offset and length, including the "From " line, as returned by
+    `scan()`.
+
+    The memoryviews returned by `get()` keep the mapping they were taken from
+    alive, even once the file is mapped again, or the reader closed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = None
+        self.size = 0
+        # Of the file as mapped
+        self.stat = None
+        self.refresh()
+
+    def refresh(self):
+        """
+        Map the file again, if it changed size since it was mapped, or was
+        replaced by another file (say, by being renamed over).
+        """
+        if not os.path.samestat(os.stat(self.path), os.fstat(self.file.fileno())):
+            self.file.close()
+            self.file = open(self.path, 'rb')
+            self.map = None
+
+        # Only what the file held at this point is mapped, even if more
+        # is appended to it in the meantime.
+        self.stat = os.fstat(self.file.fileno())
+        size = self.stat.st_size
+        if size == self.size and self.map is not None:
+            return
+        # The previous mapping is not closed: views of it may still be in
+        # use. It is unmapped once they are released.
+        # An empty file cannot be mapped; an empty bytes is just as good.
+        self.map = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ) if size else b''
+        self.size = size
+
+    def scan(self, start=0) -> Iterator[Tuple[int, int]]:
+        """
+        Find the messages in the file, starting at `start`, which must be
+        at the beginning of a line. Yields the offset and length of each.
+        """
+        map = self.map
+        end = self.size
+
+        if map[start:start + 5] == b'From ':
+            offset = start
+        else:
+            offset = map.find(b'\nFrom ', start, end)
+            if offset == -1:
+                return
+            offset += 1
+
+        while True:
+            next_offset = map.find(b'\nFrom ', offset, end)
+            if next_offset == -1:
+                yield offset, end - offset
+                return
+            next_offset += 1
+            yield offset, next_offset - offset
+            offset = next_offset
+
+    def get_bounds(self, offset, length) -> Tuple[int, int]:
+        """
+        Where the message itself - without the "From " line, and without the
+        empty line separating it from the next one - starts and ends.
+        """
+        end = offset + length
+        start = self.map.find(b'\n', offset, end) + 1 or end
+        if end - start >= 2 and self.map[end - 2:end] == b'\n\n':
+            end -= 1
+        return start, end
+
+    def get(self, offset, length) -> memoryview:
+        """
+        The message at `offset`, without copying it.
+        """
+        start, end = self.get_bounds(offset, length)
+        return memoryview(self.map)[start:end]
+
+    def get_header_bytes(self, offset, length) -> bytes:
+        """
+        The header section of the message at `offset`.
+        """
+        start, end = self.get_bounds(offset, length)
+        header_end = self.map.find(b'\n\n', start, end)
+        return self.map[start:end if header_end == -1 else header_end + 1]
+
+    def get_headers(self, offset, length):
+        """
+        Parse the headers of the message at `offset`, but not its body.
+        """
+        return BytesHeaderParser(policy=compat32).parsebytes(self.get_header_bytes(offset, length))
+
+    def close(self):
+        # As in `refresh()`, the mapping is unmapped once no longer in use.
+        self.map = None
+        self.file.close()
@@ -0,0 +1,376 @@
+"""
+Turns raw messages into the properties of JMAP `Email` objects.
+
+Parsing MIME is CPU-bound, so when a mailbox is indexed, the messages are
+parsed by a pool of worker processes (see `parse_messages`). The workers are
+given where the messages are in the mbox file, rather than the messages
+themselves, and read them from the file on their own. For each message, they
+return a compact record: a dict which can be stored as JSON in the index, and
+which `record_to_email` turns into the properties of an `Email`.
+"""
+
+import email.utils
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from email.header import decode_header, make_header
+from email.parser import BytesParser
+from email.policy import compat32
+from itertools import repeat
+from typing import Iterator, List, Optional, Tuple
+
+from archive.mboxreader import MboxReader
+
+
+PREVIEW_LENGTH = 256
+
+# How many messages a worker parses at once
+BATCH_SIZE = 200
+
+# https://en.wikipedia.org/wiki/Mbox#Modified_mbox
+STATUS_KEYWORDS = {
+    'R': '$seen',
+    'A': '$answered',
+    'F': '$flagged',
+    'T': '$draft',
+}
+
+ADDRESS_HEADERS = {
+    'sender': 'Sender',
+    'from': 'From',
+    'to': 'To',
+    'cc': 'Cc',
+    'bcc': 'Bcc',
+    'replyTo': 'Reply-To',
+}
+
+MESSAGE_ID_HEADERS = {
+    'messageId': 'Message-ID',
+    'inReplyTo': 'In-Reply-To',
+    'references': 'References',
+}
+
+message_id_re = re.compile(r'<([^<>]*)>')
+tag_re = re.compile(r'<[^>]*>')
+whitespace_re = re.compile(r'\s+')
+
+
+def decode_header_value(value) -> Optional[str]:
+    if value is None:
+        return None
+    try:
+        return str(make_header(decode_header(value)))
+    except (LookupError, UnicodeError, ValueError):
+        return str(value)
+
+
+def parse_addresses(values: List[str]) -> Optional[List[dict]]:
+    if not values:
+        return None
+    return [
+        {'name': decode_header_value(name) or None, 'email': address}
+        for name, address in email.utils.getaddresses([str(value) for value in values])
+        if address
+    ]
+
+
+def parse_message_ids(value) -> Optional[List[str]]:
+    if value is None:
+        return None
+    return message_id_re.findall(str(value)) or str(value).split() or None
+
+
+def parse_timestamp(value) -> Optional[int]:
+    if value is None:
+        return None
+    parsed = email.utils.parsedate_tz(str(value))
+    if parsed is None:
+        return None
+    try:
+        return email.utils.mktime_tz(parsed)
+    except (OverflowError, ValueError):
+        return None
+
+
+def get_text(part) -> str:
+    payload = part.get_payload(decode=True) or b''
+    try:
+        return payload.decode(part.get_content_charset() or 'us-ascii', 'replace')
+    except LookupError:
+        return payload.decode('utf-8', 'replace')
+
+
+def get_size(part) -> int:
+    if part.is_multipart():
+        # An attached message (message/rfc822)
+        return sum(len(sub_part.as_bytes()) for sub_part in part.get_payload())
+    return len(part.get_payload(decode=True) or b'')
+
+
+def make_preview(parts) -> str:
+    for part in parts:
+        if part.get_content_type() in ('text/plain', 'text/html'):
+            text = get_text(part)
+            if part.get_content_type() == 'text/html':
+                text = tag_re.sub(' ', text)
+            return whitespace_re.sub(' ', text[:PREVIEW_LENGTH * 4]).strip()[:PREVIEW_LENGTH]
+    return ''
+
+
+class StructureParser:
+    """
+    Builds the `bodyStructure` of a message, and finds its `textBody`,
+    `htmlBody` and `attachments`, following the algorithm in
+    https://jmap.io/spec-mail.html#properties-of-the-email-object.
+    """
+
+    def __init__(self):
+        self.parts = {}
+        self.text_body = []
+        self.html_body = []
+        self.attachments = []
+
+    def get_body_part(self, part) -> dict:
+        result = {'type': part.get_content_type()}
+        if part.get_content_maintype() == 'multipart' and part.is_multipart():
+            result['subParts'] = [self.get_body_part(sub_part) for sub_part in part.get_payload()]
+            return result
+
+        part_id = str(len(self.parts) + 1)
+        self.parts[part_id] = part
+        result.update({
+            'partId': part_id,
+            'size': get_size(part),
+            'name': decode_header_value(part.get_filename()),
+            'charset': part.get_content_charset() or ('us-ascii' if part.get_content_maintype() == 'text' else None),
+            'disposition': part.get_content_disposition(),
+            'cid': parse_message_ids(part.get('Content-ID'))[0] if part.get('Content-ID') else None,
+        })
+        return result
+
+    def parse(self, message) -> dict:
+        structure = self.get_body_part(message)
+        self.parse_structure([structure], 'mixed', False, self.html_body, self.text_body, self.attachments)
+        return structure
+
+    def parse_structure(self, parts, multipart_type, in_alternative, html_body, text_body, attachments):
+        text_length = len(text_body) if text_body is not None else -1
+        html_length = len(html_body) if html_body is not None else -1
+
+        for index, part in enumerate(parts):
+            type = part['type']
+            # Not every multipart/* part has sub parts, if it is broken
+            is_multipart = 'subParts' in part
+            is_inline_media = type.startswith(('image/', 'audio/', 'video/'))
+            is_inline = (
+                part.get('disposition') != 'attachment' and
+                (type in ('text/plain', 'text/html') or is_inline_media) and
+                (index == 0 or (multipart_type != 'related' and (is_inline_media or not part.get('name'))))
+            )
+
+            if is_multipart:
+                sub_type = type.split('/', 1)[1]
+                self.parse_structure(
+                    part['subParts'], sub_type, in_alternative or sub_type == 'alternative',
+                    html_body, text_body, attachments)
+            elif is_inline:
+                if multipart_type == 'alternative':
+                    if type == 'text/plain':
+                        text_body.append(part['partId'])
+                    elif type == 'text/html':
+                        html_body.append(part['partId'])
+                    else:
+                        attachments.append(part['partId'])
+                    continue
+                elif in_alternative:
+                    if type == 'text/plain':
+                        html_body = None
+                    if type == 'text/html':
+                        text_body = None
+                if text_body is not None:
+                    text_body.append(part['partId'])
+                if html_body is not None:
+                    html_body.append(part['partId'])
+                if (text_body is None or html_body is None) and is_inline_media:
+                    attachments.append(part['partId'])
+            else:
+                attachments.append(part['partId'])
+
+        if multipart_type == 'alternative' and text_body is not None and html_body is not None:
+            # Found a text part but no html part, or the other way around
+            if text_length == len(text_body) and html_length != len(html_body):
+                text_body.extend(html_body[html_length:])
+            if html_length == len(html_body) and text_length != len(text_body):
+                html_body.extend(text_body[text_length:])
+
+
+def parse_message(data: bytes) -> dict:
+    """
+    Parse a message, and return its record.
+    """
+    message = BytesParser(policy=compat32).parsebytes(data)
+
+    record = {
+        key: parse_addresses(message.get_all(header)) for key, header in ADDRESS_HEADERS.items()
+    }
+    record.update({
+        key: parse_message_ids(message[header]) for key, header in MESSAGE_ID_HEADERS.items()
+    })
+
+    parser = StructureParser()
+    record.update({
+        'subject': decode_header_value(message['Subject']),
+        'sentAt': parse_timestamp(message['Date']),
+        'keywords': {
+            STATUS_KEYWORDS[flag]: True
+            for flag in f'{message["Status"] or ""}{message["X-Status"] or ""}' if flag in STATUS_KEYWORDS
+        },
+        'bodyStructure': parser.parse(message),
+        'textBody': parser.text_body,
+        'htmlBody': parser.html_body,
+        'attachments': parser.attachments,
+        'preview': make_preview(parser.parts[part_id] for part_id in parser.text_body),
+    })
+    return record
+
+
+def record_to_email(record: dict) -> dict:
+    """
+    The `Email` properties for the record of a message, in their JSON form,
+    except for the dates, which are datetimes.
+    """
+    parts = {}
+
+    def walk(part):
+        if 'subParts' in part:
+            for sub_part in part['subParts']:
+                walk(sub_part)
+        else:
+            parts[part['partId']] = part
+
+    walk(record['bodyStructure'])
+
+    result = dict(record)
+    for key in ('sentAt', 'receivedAt'):
+        if result.get(key) is not None:
+            result[key] = datetime.fromtimestamp(result[key], timezone.utc)
+    result.update({
+        'textBody': [parts[part_id] for part_id in record['textBody']],
+        'htmlBody': [parts[part_id] for part_id in record['htmlBody']],
+        'attachments': [parts[part_id] for part_id in record['attachments']],
+        'hasAttachment': bool(record['attachments']),
+    })
+    return result
+
+
+folding_re = re.compile(r'\r?\n(?=[ \t])')
+
+
+def parse_header_value(value, form: str):
+    """
+    The parsed form of a header value (see 4.1.2 of the JMAP mail spec);
+    `form` is the value of a `HeaderFieldForm`. Dates are datetimes.
+    """
+    value = str(value)
+    if form == 'Raw':
+        return value
+    if form == 'Text':
+        return decode_header_value(folding_re.sub('', value)).strip()
+    if form == 'Addresses':
+        return parse_addresses([value]) or []
+    if form == 'GroupedAddresses':
+        return [{'name': None, 'addresses': parse_addresses([value]) or []}]
+    if form == 'MessageIds':
+        return parse_message_ids(value)
+    if form == 'Date':
+        timestamp = parse_timestamp(value)
+        return None if timestamp is None else datetime.fromtimestamp(timestamp, timezone.utc)
+    if form == 'URLs':
+        return message_id_re.findall(value) or None
+    raise ValueError(form)
+
+
+def parse_headers(data: bytes):
+    """Parse only the headers of the message `data`."""
+    return BytesParser(policy=compat32).parsebytes(data, headersonly=True)
+
+
+def get_header_values(headers, queries) -> dict:
+    """
+    The `header:` properties of an `Email` for the `HeaderFieldQuery` items
+    of the /get `properties`, by their JSON key. `headers` is the parsed
+    message, or only its headers (see `parse_headers`).
+    """
+    result = {}
+    for query in queries:
+        values = [parse_header_value(value, query.form.value) for value in headers.get_all(query.name, [])]
+        # Without `all`, the last instance of the header
+        result[header_key(query)] = values if query.all else (values[-1] if values else None)
+    return result
+
+
+def header_key(query) -> str:
+    """The JSON key of the `header:` property for a `HeaderFieldQuery`."""
+    return query.original or f'header:{query}'
+
+
+class MboxChanged(Exception):
+    """The mbox file is not the one the messages to parse were found in."""
+
+
+def parse_range(path, stat: Optional[os.stat_result],
+                ranges: List[Tuple[int, int, int]]) -> List[Tuple[int, dict]]:
+    """
+    Parse the messages of the mbox file at `path`, given by their sequence
+    number, offset and length. This is what the workers run.
+
+    The file is opened again by its path, so if `stat` is given, it must
+    still be the same file, and not have shrunk since then.
+    """
+    reader = MboxReader(path)
+    try:
+        if stat is not None and (
+                (reader.stat.st_dev, reader.stat.st_ino) != (stat.st_dev, stat.st_ino) or
+                reader.stat.st_size < stat.st_size):
+            raise MboxChanged(path)
+
+        records = []
+        for seq, offset, length in ranges:
+            with reader.get(offset, length) as data:
+                record = parse_message(data.tobytes())
+            # The "From " line gives us the time the message was delivered
+            start, _ = reader.get_bounds(offset, length)
+            from_line = reader.map[offset:start].decode('ascii', 'replace').split(None, 2)
+            record['receivedAt'] = parse_timestamp(from_line[2]) if len(from_line) == 3 else None
+            records.append((seq, record))
+        return records
+    finally:
+        reader.close()
+
+
+def parse_messages(path, ranges: List[Tuple[int, int, int]], *, stat=None, workers=None,
+                   batch_size=BATCH_SIZE) -> Iterator[Tuple[int, dict]]:
+    """
+    Parse the messages of the mbox file at `path`, given by their sequence
+    number, offset and length, in `workers` processes (by default, one per
+    CPU). Yields the sequence number and the record of each message, in
+    order. Raises `MboxChanged` if the file is no longer the one described
+    by `stat`, the `os.stat_result` it had when the messages were found.
+
+    With a single worker, or only a few messages, they are parsed in this
+    process.
+    """
+    batches = [ranges[index:index + batch_size] for index in range(0, len(ranges), batch_size)]
+    if workers == 1 or len(batches) <= 1:
+        for batch in batches:
+            yield from parse_range(path, stat, batch)
+        return
+
+    # The server runs other threads, which forking would copy in whatever
+    # state they are in, locks included.
+    context = multiprocessing.get_context('forkserver')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        for records in executor.map(parse_range, repeat(path), repeat(stat), batches):
+            yield from records
@@ -0,0 +1,63 @@
+"""
+Compare the JSON codecs which are installed, encoding a large /get response,
+and decoding a request.
+
+The response holds models, which each codec serializes via `to_client()`, so
+this also shows how much of the time is spent in our own serialization. The
+same payload, already serialized to plain dicts, is encoded as well.
+
+    python -m benchmarks.json_codecs
+"""
+
+import timeit
+from datetime import datetime, timezone
+
+from jmap.json import CODECS
+from jmap.models.models import JMapResponse, Thread, ThreadGetResponse
+
+
+COUNT = 5000
+NUMBER = 10
+
+
+def make_response():
+    threads = ThreadGetResponse(
+        account_id='a1', state='1', not_found=[],
+        list=[Thread(id=f't{i}', email_ids=[f'e{i}', f'e{i + 1}', 'Grüße']) for i in range(COUNT)])
+    return JMapResponse(method_responses=[
+        ['Thread/get', threads, 'c1'],
+        ['Core/echo', {'date': datetime(2019, 1, 1, tzinfo=timezone.utc)}, 'c2'],
+    ]).to_json()
+
+
+def make_request():
+    return {
+        'using': ['urn:ietf:params:jmap:core', 'urn:ietf:params:jmap:mail'],
+        'methodCalls': [
+            ['Email/get', {'accountId': 'a1', 'ids': [f'e{i}' for i in range(COUNT)],
+                           'properties': ['id', 'threadId', 'subject', 'receivedAt']}, 'c1'],
+        ],
+    }
+
+
+def main():
+    response = make_response()
+    plain = CODECS[-1]().loads(CODECS[-1]().dumps(response))
+    request = CODECS[-1]().dumps(make_request())
+
+    print(f'{"codec":<12}{"models":>12}{"dicts":>12}{"decode":>12}   (ms per call)')
+    for codec_class in CODECS:
+        if not codec_class.is_available():
+            print(f'{codec_class.name:<12}{"not installed":>12}')
+            continue
+        codec = codec_class()
+        results = [
+            timeit.timeit(lambda: codec.dumps(response), number=NUMBER),
+            timeit.timeit(lambda: codec.dumps(plain), number=NUMBER),
+            timeit.timeit(lambda: codec.loads(request), number=NUMBER),
+        ]
+        print(f'{codec.name:<12}' + ''.join(f'{result / NUMBER * 1000:>12.2f}' for result in results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Parse the messages of an mbox file with `parse_messages`, as when it is
+indexed, with different numbers of worker processes.
+
+    python -m benchmarks.mime_parsing
+"""
+
+import os
+import tempfile
+import time
+
+from archive.mboxreader import MboxReader
+from archive.mimeparse import parse_messages
+
+
+COUNT = 5000
+
+
+def make_message(i):
+    return (
+        f'From sender@example.com Sat Jan  3 01:05:34 1996\n'
+        f'From: =?utf-8?q?J=C3=B6rg?= <sender{i}@example.com>\n'
+        f'To: A <a@example.com>, B <b@example.com>\n'
+        f'Subject: Message {i}\n'
+        f'Date: Sat, 3 Jan 1996 01:05:34 +0000\n'
+        f'Message-ID: <m{i}@example.com>\n'
+        f'References: <m0@example.com> <m{i - 1}@example.com>\n'
+        f'Content-Type: multipart/mixed; boundary=X\n'
+        f'\n'
+        f'--X\n'
+        f'Content-Type: multipart/alternative; boundary=Y\n'
+        f'\n'
+        f'--Y\n'
+        f'Content-Type: text/plain; charset=utf-8\n'
+        f'\n'
+        f'{"Lorem ipsum dolor sit amet. " * 40}\n'
+        f'--Y\n'
+        f'Content-Type: text/html; charset=utf-8\n'
+        f'\n'
+        f'<p>{"Lorem ipsum dolor sit amet. " * 40}</p>\n'
+        f'--Y--\n'
+        f'--X\n'
+        f'Content-Type: application/octet-stream\n'
+        f'Content-Disposition: attachment; filename=data.bin\n'
+        f'Content-Transfer-Encoding: base64\n'
+        f'\n'
+        f'{"AAECAwQFBgcICQoLDA0ODxAREhMUFRYXGBkaGxwdHh8gISIjJCUmJygpKissLS4v" * 20}\n'
+        f'--X--\n'
+        f'\n'
+    ).encode('utf-8')
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'mbox')
+        with open(path, 'wb') as file:
+            for i in range(COUNT):
+                file.write(make_message(i))
+
+        reader = MboxReader(path)
+        ranges = [(seq, offset, length) for seq, (offset, length) in enumerate(reader.scan())]
+        reader.close()
+
+        print(f'{os.cpu_count()} CPUs, {COUNT} messages')
+        print(f'{"workers":<12}{"messages/s":>12}')
+        for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+            start = time.perf_counter()
+            for _ in parse_messages(path, ranges, workers=workers):
+                pass
+            print(f'{workers:<12}{COUNT / (time.perf_counter() - start):>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
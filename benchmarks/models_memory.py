@@ -0,0 +1,79 @@
+"""
+Measure how much memory the instances of our models take.
+
+Since the models use `__slots__`, the attribute values are stored in the
+instance itself, rather than in a separate `__dict__`. To see the difference,
+we compare against plain objects holding the same attributes in a `__dict__`,
+which is what the models looked like before.
+
+    python -m benchmarks.models_memory
+"""
+
+import tracemalloc
+from datetime import datetime, timezone
+
+from jmap.attrs import fields
+from jmap.models.models import Email, EmailAddress, EmailBodyPart, EmailHeader
+
+
+COUNT = 10000
+
+
+class Unslotted:
+    pass
+
+
+def make_address(cls):
+    obj = cls.__new__(cls)
+    obj.name = 'Alice'
+    obj.email = 'alice@example.com'
+    return obj
+
+
+def make_body_part(cls):
+    obj = cls.__new__(cls)
+    for field in fields(EmailBodyPart):
+        setattr(obj, field.name, None)
+    obj.part_id = '1'
+    obj.size = 1024
+    obj.type = 'text/plain'
+    obj.headers = [EmailHeader(name='Content-Type', value='text/plain')]
+    return obj
+
+
+def make_email(cls):
+    obj = cls.__new__(cls)
+    for field in fields(Email):
+        setattr(obj, field.name, None)
+    obj.id = 'e1'
+    obj.blob_id = 'b1'
+    obj.thread_id = 't1'
+    obj.size = 2048
+    obj.received_at = datetime(2019, 1, 1, tzinfo=timezone.utc)
+    return obj
+
+
+def measure(factory, cls):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [factory(cls) for i in range(COUNT)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return (after - before) / COUNT
+
+
+def main():
+    print(f'{"model":<16}{"__dict__":>12}{"__slots__":>12}{"saved":>12}   (bytes per object)')
+    for model, factory in [
+        (EmailAddress, make_address),
+        (EmailBodyPart, make_body_part),
+        (Email, make_email),
+    ]:
+        unslotted = measure(factory, Unslotted)
+        slotted = measure(factory, model)
+        print(f'{model.__name__:<16}{unslotted:>12.0f}{slotted:>12.0f}{unslotted - slotted:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Compare parsing and formatting the dates of JMAP (such as an email's
+`receivedAt`) with the fast paths, against the regex based implementation
+they replace, which is still used for the other forms of RFC 3339.
+
+    python -m benchmarks.rfc3339
+"""
+
+import datetime
+import timeit
+
+from jmap.attrs import rfc3339
+from jmap.attrs.fields import serialize_rfc3339, deserialize_rfc3339
+
+
+NUMBER = 100000
+
+
+def regex_parse(s):
+    (y, m, d, hour, min, sec, ignore1, frac_sec, wholetz, ignore2,
+     tzsign, tzhour, tzmin) = rfc3339.datetime_re.match(s).groups()
+    hour, min, sec, microsec, tz = rfc3339._parse_time_components(
+        s, hour, min, sec, frac_sec, wholetz, tzsign, tzhour, tzmin)
+    return datetime.datetime(int(y), int(m), int(d), hour, min, sec, microsec, tz)
+
+
+def regex_serialize(date):
+    is_utc = (date.utcoffset() is None) or (date.utcoffset() == rfc3339.ZERO)
+    if not is_utc:
+        date = date.astimezone(datetime.timezone.utc)
+    return rfc3339.datetimetostr(date.replace(microsecond=0))
+
+
+def main():
+    value = '2019-01-02T03:04:05Z'
+    date = deserialize_rfc3339(value)
+    assert regex_parse(value) == date
+    assert regex_serialize(date) == serialize_rfc3339(date, localtime=False) == value
+
+    print(f'{"":<12}{"regex":>12}{"fast":>12}   (µs per call)')
+    for name, before, after in [
+        ('parse', lambda: regex_parse(value), lambda: deserialize_rfc3339(value)),
+        ('format', lambda: regex_serialize(date), lambda: serialize_rfc3339(date, localtime=False)),
+    ]:
+        results = [timeit.timeit(func, number=NUMBER) / NUMBER * 1000000 for func in (before, after)]
+        print(f'{name:<12}' + ''.join(f'{result:>12.2f}' for result in results))
+
+
+if __name__ == '__main__':
+    main()
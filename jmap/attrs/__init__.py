@@ -112,4 +112,5 @@ Our custom version of `attrs` enables the desired features.
 
 
 from .wrap import model, attrib
-from .attrs import Factory, fields
\ No newline at end of file
+from .attrs import Factory, fields
+from .utils import Lazy
\ No newline at end of file
@@ -782,8 +782,13 @@ class _ClassBuilder(object):
             if not closure_cells:  # Catch None or the empty list.
                 continue
             for cell in closure_cells:
-                if cell.cell_contents is self._cls:
-                    set_closure_cell(cell, cls)
+                try:
+                    match = cell.cell_contents is self._cls
+                except ValueError:  # ValueError: Cell is empty
+                    pass
+                else:
+                    if match:
+                        set_closure_cell(cell, cls)
 
         return cls
 
@@ -1531,6 +1536,43 @@ def validate(inst):
             v(inst, a, getattr(inst, a.name))
 
 
+def instantiate_validated(cls, values):
+    """
+    Create an instance of *cls* from *values*, which have already been
+    validated, without running the validators again.
+
+    This is what ``cls(**values)`` does, except that the validators are
+    skipped, and that attributes with ``init=False`` may be given, too.
+
+    Unlike ``set_run_validators(False)``, this does not touch any global
+    state, so it is safe to use from multiple threads or async tasks.
+
+    :param type cls: The ``attrs`` class to create an instance of.
+    :param dict values: Maps attribute names to their values. As in
+        ``__init__``, attributes which are not given remain unset.
+    """
+    inst = cls.__new__(cls)
+    for a in fields(cls):
+        name = a.name
+        if name in values:
+            value = values[name]
+            if a.converter is not None:
+                value = a.converter(value)
+        elif a.init is False and a.default is not NOTHING:
+            if isinstance(a.default, Factory):
+                value = a.default.factory(inst) if a.default.takes_self else a.default.factory()
+            else:
+                value = a.default
+        else:
+            continue
+        _obj_setattr(inst, name, value)
+
+    post_init = getattr(cls, "__attrs_post_init__", None)
+    if post_init is not None:
+        post_init(inst)
+    return inst
+
+
 def _is_slot_cls(cls):
     return "__slots__" in cls.__dict__
 
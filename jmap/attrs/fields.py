@@ -14,6 +14,12 @@ def serialize_rfc3339(date, localtime=True):
         as is, then output a string that gives the timezone used.
     """
 
+    # The common case, written out directly
+    tz = date.tzinfo
+    if tz is None or tz is rfc3339.UTC_TZ:
+        return '%04d-%02d-%02dT%02d:%02d:%02dZ' % (
+            date.year, date.month, date.day, date.hour, date.minute, date.second)
+
     is_utc = (date.utcoffset() is None) or (date.utcoffset() == rfc3339.ZERO)
 
     # If this is a non-utc date and we are asked to render it in UTC, convert it
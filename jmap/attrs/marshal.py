@@ -43,17 +43,21 @@ Ultimately, the result will be that:
 
 import enum
 import re
+import threading
 from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
-from functools import partial
+from functools import partial, lru_cache
 from inspect import isclass
+from types import MappingProxyType
 from typing import Union, Dict, List, ForwardRef, Tuple, Any, Optional
 import marshmallow
 from marshmallow import ValidationError, post_load, fields, post_dump, Schema, pre_dump
 
-from jmap.attrs.attrs import NOTHING, fields as get_fields, attrs, attrib
+from jmap.attrs.attrs import NOTHING, fields as get_fields, attrs, attrib, instantiate_validated
 from jmap.attrs.fields import JmapDateTime
-from jmap.attrs.utils import get_set_attrs
+from jmap.attrs.utils import get_set_attrs, project
 
 
 NoneType = type(None)
@@ -222,6 +226,10 @@ def make_marshmallow_field(attr_field) -> Optional[fields.Field]:
             try:
                 # TODO: We could get access to the instance if we used a @validates method
                 # in marshmallow.
+                # As in `__init__`, validate the converted value. The model is built
+                # from the unconverted one, see `instantiate_validated`.
+                if attr_field.converter is not None:
+                    value = attr_field.converter(value)
                 attr_field.validator(None, attr_field, value)
             except ValueError as exc:
                 # Assume that attrs validators raise a ValueError. Any other exceptions we
@@ -231,47 +239,238 @@ def make_marshmallow_field(attr_field) -> Optional[fields.Field]:
         assert not 'validate'in field_args
         field_args['validate'] = marshmallow_impl
 
-    # Determine the key in JSON for this field.
-    data_key = attr_field.metadata.get('camelcase', to_camel_case(attr_field.name))
-
     return field_type(
-        data_key=data_key,
+        data_key=json_key(attr_field),
         required=required,
         **field_args
     )
 
 
-def unmarshall_func(cls, input: Dict, *, use_server_fields):
-    schema = cls.__marshmallow_schemas__['server' if use_server_fields else 'client']()
-    schema.context = {
-        'use_server_fields': use_server_fields
-    }
-    return schema.load(input)
+def json_key(attr_field):
+    """Determine the key in JSON for this field."""
+    return attr_field.metadata.get('camelcase', to_camel_case(attr_field.name))
+
+
+def add_key_maps(attrclass):
+    """Store the JSON key of each attribute on the class, and the reverse.
+
+    This way, a list of property names - such as the `properties` argument of
+    a /get call - can be converted with a dict lookup, rather than running
+    `to_camel_case` or `snakecase` on every item.
+    """
+    attrclass.__json_keys__ = {field.name: json_key(field) for field in get_fields(attrclass)}
+    attrclass.__attr_names__ = {key: name for name, key in attrclass.__json_keys__.items()}
+
+
+# Extra, per-call context for the schemas. See `schema_context`.
+_call_context: ContextVar[Optional[Dict]] = ContextVar('jmap_schema_context', default=None)
+
+# Guards the creation of the shared schema instances.
+_schema_cache_lock = threading.Lock()
+
+
+@contextmanager
+def schema_context(**values):
+    """Make `values` available as part of `schema.context` to all schemas
+    (and their fields) used within this block.
+
+    Since the schema instances are shared between threads (see `get_schema`),
+    we cannot store the context on the instance. Instead, it lives in a
+    contextvar, which is both thread- and asyncio-safe.
+    """
+    token = _call_context.set({**(_call_context.get() or {}), **values})
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+class ModelSchema(Schema):
+    """Base class for the schemas we generate for our models.
+
+    The only thing that is fixed for an instance is the direction it works in
+    (`use_server_fields`); the rest of `self.context` is taken from
+    `schema_context`. This allows us to share a single instance.
+    """
+
+    model_class = None
+
+    def __init__(self, *, use_server_fields=False, **kwargs):
+        self.use_server_fields = use_server_fields
+        self._direction_context = MappingProxyType({'use_server_fields': use_server_fields})
+        super().__init__(**kwargs)
+
+    @property
+    def context(self):
+        # Read-only: the instance is shared, so a change would leak into every
+        # later call. Use `schema_context` instead.
+        call_context = _call_context.get()
+        if call_context is None:
+            return self._direction_context
+        return MappingProxyType({**call_context, **self._direction_context})
+
+    @context.setter
+    def context(self, value):
+        # marshmallow assigns an empty dict in `Schema.__init__`. We derive ours,
+        # see above.
+        if value:
+            raise AttributeError(f'The context of {self.__class__.__name__} cannot be set, use schema_context()')
+
+
+def get_schema(model_class, *, use_server_fields, many=False):
+    """Return the schema instance for `model_class`.
+
+    Instantiating a marshmallow schema is expensive (it deep-copies all the
+    declared fields), so we only do this once per class, direction and `many`,
+    and then re-use the instance. This is safe, since marshmallow does not keep
+    any state on the instance while loading or dumping.
+    """
+    cache = model_class.__marshmallow_schema_instances__
+    key = (use_server_fields, many)
+    try:
+        return cache[key]
+    except KeyError:
+        pass
+
+    with _schema_cache_lock:
+        if key not in cache:
+            schema_class = model_class.__marshmallow_schemas__['server' if use_server_fields else 'client']
+            cache[key] = schema_class(use_server_fields=use_server_fields, many=many)
+        return cache[key]
+
+
+def get_schema_for_context(model_class, context, many=False):
+    return get_schema(model_class, use_server_fields=context['use_server_fields'], many=many)
+
+
+# Guards the creation of the dumpers and loaders. Re-entrant, because compiling
+# a function requires the functions of the nested models.
+_compile_lock = threading.RLock()
+_compiling = set()
+
+
+def _get_compiled(model_class, kind, *, use_server_fields):
+    cache = getattr(model_class, f'__{kind}s__')
+    try:
+        return cache[use_server_fields]
+    except KeyError:
+        pass
+
+    with _compile_lock:
+        if use_server_fields in cache:
+            return cache[use_server_fields]
+
+        key = (model_class, kind, use_server_fields)
+        if key in _compiling:
+            # A model nested within itself; the real function is not ready yet.
+            return lambda value: _get_compiled(model_class, kind, use_server_fields=use_server_fields)(value)
+
+        if model_class.__compiled__:
+            from jmap.attrs import compiled
+            _compiling.add(key)
+            try:
+                func = getattr(compiled, f'compile_{kind}')(model_class, use_server_fields=use_server_fields)
+            finally:
+                _compiling.discard(key)
+        else:
+            schema = get_schema(model_class, use_server_fields=use_server_fields)
+            func = schema.dump if kind == 'dumper' else schema.load
+
+        cache[use_server_fields] = func
+        return func
+
+
+def get_dumper(model_class, *, use_server_fields):
+    """Return a function which serializes an instance of `model_class`.
+
+    For models using `@model(compiled=True)`, this is a generated function (see
+    `jmap.attrs.compiled`), otherwise the `dump` method of the schema.
+    """
+    return _get_compiled(model_class, 'dumper', use_server_fields=use_server_fields)
+
+
+def get_loader(model_class, *, use_server_fields):
+    """Return a function which validates incoming data and returns an instance
+    of `model_class`.
+
+    For models using `@model(compiled=True)`, this is a generated function (see
+    `jmap.attrs.compiled`), otherwise the `load` method of the schema.
+    """
+    return _get_compiled(model_class, 'loader', use_server_fields=use_server_fields)
+
+
+@lru_cache(maxsize=256)
+def get_projected_dumper(model_class, *, use_server_fields, properties: frozenset):
+    """Return a function which serializes only the attributes in `properties` of
+    an instance of `model_class`.
+
+    The property sets come from the clients, so we only keep the most recent ones.
+    """
+    unknown = properties - model_class.__json_keys__.keys()
+    if unknown:
+        raise ValueError(f'{model_class.__name__} has no properties {sorted(unknown)}')
+
+    if model_class.__compiled__:
+        from jmap.attrs.compiled import compile_dumper
+        return compile_dumper(model_class, use_server_fields=use_server_fields, properties=properties)
+
+    dump = get_schema(model_class, use_server_fields=use_server_fields).dump
+    def dump_projected(obj):
+        return dump(project(obj, properties))
+    return dump_projected
+
+
+def unmarshall_func(cls, input: Dict, *, use_server_fields, context=None):
+    load = get_loader(cls, use_server_fields=use_server_fields)
+    if context:
+        with schema_context(**context):
+            return load(input)
+    return load(input)
 
 
 def make_marshall_func(*, use_server_fields):
-    def marshall_func(self):
-        schema = self.__marshmallow_schemas__['server' if use_server_fields else 'client']()
-        schema.context = {
-            'use_server_fields': use_server_fields
-        }
-        return schema.dump(self)
+    def marshall_func(self, *, context=None):
+        dump = get_dumper(self.__class__, use_server_fields=use_server_fields)
+        if context:
+            with schema_context(**context):
+                return dump(self)
+        return dump(self)
     return  marshall_func
 
 
-def get_schema_from_model_for_context(model_class, context):
-    schema = model_class.__marshmallow_schemas__
-    if context['use_server_fields']:
-        return schema['server']
-    return schema['client']
+def make_marshall_many_func(*, use_server_fields):
+    def marshall_many_func(cls, objects, *, properties=None, context=None):
+        """Serialize a list of instances.
+
+        If `properties` is given, only those attributes are serialized. The work
+        of figuring out how is done once, rather than for each instance.
+        """
+        if properties is None:
+            dump = get_dumper(cls, use_server_fields=use_server_fields)
+        else:
+            dump = get_projected_dumper(
+                cls, use_server_fields=use_server_fields, properties=frozenset(properties))
+
+        def dump_all():
+            # Like `CustomNested`, pass through dicts as they are.
+            return [obj if obj.__class__ is dict else dump(obj) for obj in objects]
 
+        if context:
+            with schema_context(**context):
+                return dump_all()
+        return dump_all()
+    return classmethod(marshall_many_func)
 
-def marshallable(attrclass):
+
+def marshallable(attrclass, compiled=False):
     """Adds `marshal`  and `unmarshal` classmethods to the attrs class to create the
     class from incoming unstructured data with validation.
 
     To this end, internally constructs a marshmallow schema based on the type
     definitions, and the attrs validators.
+
+    If `compiled` is set, serialization and deserialization do not go through
+    marshmallow, but generated functions, see `jmap.attrs.compiled`.
     """
 
     # If the class itself defines marshal/unmarshal methods, then the model in question
@@ -280,12 +479,18 @@ def marshallable(attrclass):
     # to dump or load this module, so try to provide this interface.
     # NB: We do not use hasattr(), but check the dict directly, since we want such a class
     # to be subclassable; then, we do not want to find the marshal() method of the base class.
+    add_key_maps(attrclass)
+
     if 'marshal' in attrclass.__dict__:
         manual_schema = make_manual_schema(attrclass, attrclass.marshal, attrclass.unmarshal)
         attrclass.__marshmallow_schemas__ = {
             'server': manual_schema,
             'client': manual_schema
         }
+        attrclass.__marshmallow_schema_instances__ = {}
+        attrclass.__dumpers__ = {}
+        attrclass.__loaders__ = {}
+        attrclass.__compiled__ = False
         return attrclass
 
     attr_fields = get_fields(attrclass)
@@ -308,14 +513,10 @@ def marshallable(attrclass):
         # will give us the instance directly. This is easiest as it means that when the class
         # # is used as a relationship, then a marshmallow.fields.Nested() is all we need.
         #
-        # Note: Unfortunately, attr will run the validators again, although we already
-        # we already did so. We can disable validators globally in attr
-        # (attr.set_run_validators(False)) - and then reset it afterwards - but that
-        # would not be thread-safe. Open a attr ticket for this. Options include:
-        # a) Figure out something with __new__, b) Make attr support a thread-local stack,
-        # or contextvar-stack c) a new kind of API they should support to aid marshalling
-        # libraries built on top.
-        return attrclass(**data)
+        # We do not call `attrclass(**data)`, since attr would run the validators again,
+        # although we already did so. This also allows server-set attributes, which
+        # `__init__` does not accept, to be loaded.
+        return instantiate_validated(attrclass, data)
 
     def process_dumped_result(self, data, original):
         # Fields have the ability to provide a hook to customize how they are serialized.
@@ -330,22 +531,41 @@ def marshallable(attrclass):
         fieldset['_internal_post_dump_object'] = post_dump(process_dumped_result, pass_original=True)
         fieldset['_internal_pre_dump'] = pre_dump(only_set_attrs)
 
-    marshmallow_client_schema = type(f'{attrclass}Schema', (marshmallow.Schema,), marshmallow_client_fields)
-    marshmallow_server_schema = type(f'{attrclass}Schema', (marshmallow.Schema,), marshmallow_server_fields)
+    marshmallow_client_schema = type(f'{attrclass}Schema', (ModelSchema,), marshmallow_client_fields)
+    marshmallow_server_schema = type(f'{attrclass}Schema', (ModelSchema,), marshmallow_server_fields)
+    marshmallow_client_schema.model_class = attrclass
+    marshmallow_server_schema.model_class = attrclass
 
     attrclass.__marshmallow_schemas__ = {
         'server': marshmallow_server_schema,
         'client': marshmallow_client_schema,
     }
-
-    attrclass.to_server = make_marshall_func(use_server_fields=False)
-    attrclass.from_server = classmethod(partial(unmarshall_func, use_server_fields=True))
-    attrclass.to_client = make_marshall_func(use_server_fields=True)
-    attrclass.from_client = classmethod(partial(unmarshall_func, use_server_fields=False))
+    attrclass.__marshmallow_schema_instances__ = {}
+    attrclass.__dumpers__ = {}
+    attrclass.__loaders__ = {}
+    attrclass.__compiled__ = compiled
+
+    add_default(attrclass, 'to_server', make_marshall_func(use_server_fields=False))
+    add_default(attrclass, 'from_server', classmethod(partial(unmarshall_func, use_server_fields=True)))
+    add_default(attrclass, 'to_client', make_marshall_func(use_server_fields=True))
+    add_default(attrclass, 'from_client', classmethod(partial(unmarshall_func, use_server_fields=False)))
+    add_default(attrclass, 'to_server_many', make_marshall_many_func(use_server_fields=False))
+    add_default(attrclass, 'to_client_many', make_marshall_many_func(use_server_fields=True))
 
     return attrclass
 
 
+def add_default(attrclass, name, func):
+    """Add one of the marshal helpers to the class, unless the class, or one
+    of its base classes, provides its own implementation.
+    """
+    existing = getattr(attrclass, name, None)
+    if existing is None or getattr(existing, '__jmap_default__', False):
+        setattr(attrclass, name, func)
+        # Functions and classmethods both forward the attribute.
+        (func.__func__ if isinstance(func, classmethod) else func).__jmap_default__ = True
+
+
 def to_camel_case(snake_str):
     components = snake_str.split('_')
     # We capitalize the first letter of each component except the first one
@@ -378,7 +598,8 @@ class CustomNested(fields.Nested):
        We use this to allow developers to skip the model system and instead directly
        include the desired JMAP structures.
 
-    - Second, it picks the right schema to use based on the context.
+    - Second, it picks the right schema to use based on the context, and uses the
+      shared schema instance for it (see `get_schema`).
     """
 
     def __init__(self, nested, **kwargs):
@@ -386,23 +607,31 @@ class CustomNested(fields.Nested):
         self.nested_class = nested
 
     @property
-    def nested(self):
+    def model_class(self):
         # We need to support string references ourselves here, since marshmallow itself
         # only deals in marshmallow schemas.
         if isinstance(self.nested_class, str):
             if self.nested_class == 'self':
-                return self.parent.__class__
+                return self.parent.model_class
             else:
                 raise ValueError('not yet supported')
+        return self.nested_class
 
-        return get_schema_from_model_for_context(self.nested_class, self.parent.context)
+    @property
+    def schema(self):
+        # Rather than having marshmallow create (and cache) a new schema instance
+        # for this field, use the shared one.
+        return get_schema_for_context(self.model_class, self.parent.context, many=self.many)
+
+    @property
+    def nested(self):
+        return self.nested_class
 
     @nested.setter
     def nested(self, value):
         # Parent tries to do that
         pass
 
-
     def _serialize(self, nested_obj, attr, obj, **kwargs):
         dump_dict = False
         if self.many and nested_obj and len(nested_obj) and isinstance(nested_obj[0], dict):
@@ -412,9 +641,38 @@ class CustomNested(fields.Nested):
         if dump_dict:
             return nested_obj
 
+        model_class = self.model_class
+        if model_class.__compiled__ and nested_obj is not None:
+            dump = get_dumper(model_class, use_server_fields=self.parent.context['use_server_fields'])
+            if self.many:
+                return [dump(item) for item in nested_obj]
+            return dump(nested_obj)
+
         # Serialize as normal
         return super()._serialize(nested_obj, attr, obj, **kwargs)
 
+    def _deserialize(self, value, attr, data, partial=None, **kwargs):
+        model_class = self.model_class
+        if not model_class.__compiled__:
+            return super()._deserialize(value, attr, data, partial=partial, **kwargs)
+
+        self._test_collection(value)
+        load = get_loader(model_class, use_server_fields=self.parent.context['use_server_fields'])
+        if not self.many:
+            return load(value)
+
+        # Collect the errors by index, like marshmallow does.
+        results = []
+        errors = {}
+        for idx, item in enumerate(value):
+            try:
+                results.append(load(item))
+            except ValidationError as exc:
+                errors[idx] = exc.messages
+        if errors:
+            raise ValidationError(errors, valid_data=results)
+        return results
+
 
 class CustomUnmarshalField(fields.Field):
     """
@@ -551,6 +809,41 @@ class PolyField(fields.Field):
         self.many = many
         self.union_types = union_types
 
+        # Everything we need to pick the type of a value is worked out once, here.
+        #
+        # Which of the union types a value is an instance of, by the value's class.
+        # Initially, this has the union types themselves; for any other class, such
+        # as a subclass, we search the union types in order, and add the result.
+        self.types_by_class = {}
+        for pytype in union_types:
+            self.types_by_class.setdefault(pytype, self.find_type(pytype))
+
+        # The types with a custom "pick me" helper, see `_deserialize`.
+        self.will_handle_types = [t for t in union_types if hasattr(t, 'will_handle')]
+
+        # Those JSON keys which are unique to a single one of the models.
+        models = [t for t in union_types if hasattr(t, '__marshmallow_schemas__')]
+        counts = Counter([key for model in models for key in model.__attr_names__])
+        self.models_by_key = {
+            key: model
+            for model in models for key in model.__attr_names__
+            if counts[key] == 1
+        }
+
+    def find_type(self, value_class):
+        for pytype in self.union_types:
+            if issubclass(value_class, pytype):
+                return pytype
+        return None
+
+    def get_type(self, value):
+        value_class = value.__class__
+        try:
+            return self.types_by_class[value_class]
+        except KeyError:
+            pytype = self.types_by_class[value_class] = self.find_type(value_class)
+            return pytype
+
     def _serialize(self, value, attr, obj, **kwargs):
         if not self.many:
             value = [value]
@@ -558,22 +851,17 @@ class PolyField(fields.Field):
         results = []
         for v in value:
             # Figure out which type it is
-            for pytype, field_class in self.union_types.items():
-                if isinstance(v, pytype):
-                    if hasattr(pytype, '__marshmallow_schemas__'):
-                        # Indicates that we expect pytype to be a model
-                        schema_class = get_schema_from_model_for_context(pytype, self.parent.context)
-                        schema = schema_class()
-                        schema.context.update(getattr(self, 'context', {}))
-                        data = schema.dump(v)
-                        results.append(data)
-
-                    else:
-                        results.append(field_class._serialize(v, attr, obj))
-                    break
-            else:
+            pytype = self.get_type(v)
+            if pytype is None:
                 raise ValidationError(f'Not a valid value for "{attr}": {v}')
 
+            if hasattr(pytype, '__marshmallow_schemas__'):
+                # Indicates that we expect pytype to be a model
+                schema = get_schema_for_context(pytype, self.parent.context)
+                results.append(schema.dump(v))
+            else:
+                results.append(self.union_types[pytype]._serialize(v, attr, obj))
+
         if self.many:
             return results
         else:
@@ -585,75 +873,51 @@ class PolyField(fields.Field):
 
         results = []
         for v in value:
-            found = False
-
-            # See if any of the given types has a custom "pick me" helper.
-            # This is an escape hatch to allow for the following JMAP scenario:
-            #    `PolyField([str, HeaderFieldQuery])`
-            # Here, both str and HeaderFieldQuery really expect a string, but we
-            # should first ask HeaderFieldQuery if it can "parse" the string.
-            for pytype in self.union_types:
-                if hasattr(pytype, 'will_handle'):
-                    if pytype.will_handle(v):
-                        schema_class = get_schema_from_model_for_context(pytype, self.parent.context)
-                        schema = schema_class()
-                        schema.context.update(getattr(self, 'context', {}))
-                        data = schema.load(v)
-                        results.append(data)
-                        continue
-
-            # Figure out which type it is
-            for pytype, field in self.union_types.items():
-                # This only works with primitives
-                if isinstance(v, pytype):
-                    results.append(field._deserialize(v, attr, data))
-                    found = True
-                    break
-
-            else:
-                if isinstance(v, dict):
-                    # See if we can recognize it by the keys
-                    # Get all the schemas involved
-                    schemas = [
-                        get_schema_from_model_for_context(k, self.parent.context)
-                        for k in self.union_types.keys()
-                        if hasattr(k, '__marshmallow_schemas__')
-                    ]
-
-                    # Figure out those keys which are unique across all schemas
-                    keys_for_schema = [set(s._declared_fields.keys()) for s in schemas]
-                    counts = Counter([key for keys in keys_for_schema for key in keys])
-                    unique_keys = set([k for k, v in counts.items() if v == 1])
-
-                    # Test each schema
-                    for schema_class, keys in zip(schemas, keys_for_schema):
-                        for key in keys:
-                            if key in unique_keys and key in v:
-                                schema = schema_class()
-                                schema.context.update(getattr(self, 'context', {}))
-                                data = schema.load(v)
-                                results.append(data)
-                                found = True
-                                break
-                        if found:
-                            break
-
-            if not found:
-                raise ValidationError(f'Not one of the possible valid types for "{attr}": {v}')
+            results.append(self.deserialize_item(v, attr, data))
 
         if self.many:
             return results
         else:
             return results[0]
 
+    def deserialize_item(self, v, attr, data):
+        # See if any of the given types has a custom "pick me" helper.
+        # This is an escape hatch to allow for the following JMAP scenario:
+        #    `PolyField([str, HeaderFieldQuery])`
+        # Here, both str and HeaderFieldQuery really expect a string, but we
+        # should first ask HeaderFieldQuery if it can "parse" the string.
+        for pytype in self.will_handle_types:
+            if pytype.will_handle(v):
+                schema = get_schema_for_context(pytype, self.parent.context)
+                return schema.load(v)
+
+        # Figure out which type it is. This only works with primitives.
+        pytype = self.get_type(v)
+        if pytype is not None:
+            return self.union_types[pytype]._deserialize(v, attr, data)
+
+        if isinstance(v, dict):
+            # See if we can recognize it by a key unique to one of the models.
+            for key in v:
+                model = self.models_by_key.get(key)
+                if model is not None:
+                    schema = get_schema_for_context(model, self.parent.context)
+                    return schema.load(v)
+
+        raise ValidationError(f'Not one of the possible valid types for "{attr}": {v}')
+
 
 def make_manual_schema(attrclass, marshal_func, unmarshal_func):
-    class ManualSchema(Schema):
+    class ManualSchema(ModelSchema):
 
         def dump(self, obj, many=None):
+            if self.many if many is None else many:
+                return [marshal_func(o) for o in obj]
             return marshal_func(obj)
 
         def load(self, data, many=None, partial=None, unknown=None):
+            if self.many if many is None else many:
+                return [unmarshal_func(d) for d in data]
             return unmarshal_func(data)
 
     return ManualSchema
@@ -0,0 +1,287 @@
+"""
+Test the generated serializers and loaders against marshmallow.
+
+For each case, we define the same set of models twice, once with and once
+without `compiled=True`, and make sure that both serialize the same data to
+the same output, and load the same input to the same objects or errors, in
+both directions.
+"""
+import enum
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Union, Any
+
+import pytest
+from marshmallow import ValidationError
+
+from jmap.attrs import model, attrib, Factory
+from jmap.attrs.compiled import compile_dumper, compile_loader
+from jmap.attrs.marshal import custom_marshal, get_schema, Missing
+from jmap.attrs.utils import get_set_attrs, project
+
+
+class Color(enum.Enum):
+    red = 'red'
+    green = 'green'
+
+
+def flatten_tags(data, instance, field):
+    for tag in getattr(instance, field.name, None) or []:
+        data[f'tag:{tag}'] = True
+    return data
+
+
+def unflatten_tags(data, field):
+    keys = [key for key in data if key.startswith('tag:')]
+    if not keys:
+        return Missing, []
+    return [key[4:] for key in keys], keys
+
+
+def positive(self, attribute, value):
+    if value is not None and value < 0:
+        raise ValueError(f'{attribute.name} must be positive')
+
+
+def upper(value):
+    return value if value is None else value.upper()
+
+
+def sort_tags(tags):
+    return tags if tags is None else sorted(tags)
+
+
+def make_models(compiled):
+
+    @model(compiled=compiled)
+    class Address:
+        name: Optional[str] = None
+        email: str
+
+    @model(compiled=compiled)
+    class Part:
+        part_id: Optional[str] = None
+        size: int = attrib(default=0, validator=positive)
+        headers: List[Address] = attrib(default=Factory(list))
+        sub_parts: Optional[List["self"]] = None
+
+    @model(compiled=compiled)
+    class Message:
+        id: str = attrib(server_set=True)
+        size: int = attrib(validator=positive)
+        ratio: float = 0.0
+        seen: bool = False
+        color: Optional[Color] = None
+        received_at: Optional[datetime] = None
+        from_: Optional[List[Address]] = None
+        sender: Optional[Address] = None
+        keywords: Dict[str, bool] = attrib(default=Factory(dict))
+        values: Dict[str, Part] = attrib(default=Factory(dict))
+        body: Optional[Part] = None
+        names: List[str] = attrib(default=Factory(list))
+        mixed: List[Union[str, Address]] = attrib(default=Factory(list))
+        raw: Any = None
+        fetch_html: bool = attrib(default=False, camelcase='fetchHTML')
+        tags: List[str] = attrib(default=None, converter=sort_tags, metadata={
+            'marshal': custom_marshal(flatten_tags, unflatten_tags)})
+        label: Optional[str] = attrib(default=None, converter=upper)
+        # The validator sees the converted value
+        offset: int = attrib(default=0, converter=abs, validator=positive)
+
+    return Address, Part, Message
+
+
+Compiled = make_models(True)
+Plain = make_models(False)
+
+
+def build(models, **values):
+    """Build a `Message` of the given model set; `values` is a callable
+    which is given the models to construct the values with."""
+    Address, Part, Message = models
+    message = Message(size=1)
+    for key, value in values.items():
+        setattr(message, key, value(*models) if callable(value) else value)
+    return message
+
+
+CASES = [
+    {},
+    {'id': 'm1', 'seen': True, 'ratio': 0.5},
+    {'color': Color.green, 'received_at': datetime(2018, 1, 2, 3, 4, 5, 123, tzinfo=timezone.utc)},
+    {'from_': lambda A, P, M: [A(email='a@b.c'), A(name='X', email='x@y.z')]},
+    {'from_': lambda A, P, M: [{'name': 'As', 'email': 'a dict'}]},
+    {'from_': []},
+    {'from_': None, 'sender': None, 'body': None, 'color': None},
+    {'sender': lambda A, P, M: A(email='a@b.c')},
+    {'sender': {'email': 'direct'}},
+    {'keywords': {'$seen': True, '$draft': False}},
+    {'values': lambda A, P, M: {'1': P(part_id='1', size=3), '2': P()}},
+    {'body': lambda A, P, M: P(sub_parts=[P(part_id='1', sub_parts=[P(size=4)]), P(headers=[A(email='x')])])},
+    {'names': ['a', 'b'], 'mixed': lambda A, P, M: ['x', A(email='y')]},
+    {'raw': {'anything': [1, 2]}},
+    {'fetch_html': True},
+    {'tags': ['a', 'b']},
+    {'size': Missing},
+    # Values marshmallow needs to convert
+    {'size': 3.0, 'seen': 1, 'names': ('a', 'b')},
+]
+
+
+@pytest.mark.parametrize('values', CASES)
+@pytest.mark.parametrize('use_server_fields', [True, False])
+def test_same_output_as_marshmallow(values, use_server_fields):
+    compiled = build(Compiled, **values)
+    plain = build(Plain, **values)
+
+    expected = get_schema(type(plain), use_server_fields=use_server_fields).dump(plain)
+    dumper = compile_dumper(type(compiled), use_server_fields=use_server_fields)
+    assert dumper(compiled) == expected
+
+    if use_server_fields:
+        assert compiled.to_client() == plain.to_client() == expected
+    else:
+        assert compiled.to_server() == plain.to_server() == expected
+
+
+@pytest.mark.parametrize('properties', [
+    None, [], ['id'], ['size', 'from_', 'fetch_html'], ['body', 'tags', 'values'],
+])
+@pytest.mark.parametrize('use_server_fields', [True, False])
+def test_many_same_output_as_marshmallow(properties, use_server_fields):
+    compiled = [build(Compiled, **values) for values in CASES[:-2]]
+    plain = [build(Plain, **values) for values in CASES[:-2]]
+
+    schema = get_schema(type(plain[0]), use_server_fields=use_server_fields)
+    expected = [
+        schema.dump(project(obj, properties) if properties is not None else obj)
+        for obj in plain
+    ]
+
+    for objects in (compiled, plain):
+        model_class = type(objects[0])
+        if use_server_fields:
+            assert model_class.to_client_many(objects, properties=properties) == expected
+        else:
+            assert model_class.to_server_many(objects, properties=properties) == expected
+
+
+def test_many_unknown_properties():
+    Address, Part, Message = Compiled
+    with pytest.raises(ValueError):
+        Message.to_client_many([], properties=['fetchHTML'])
+
+
+def test_properties_constructor():
+    """
+    Only the attributes given are serialized.
+    """
+    Address, Part, Message = Compiled
+    assert Message.Properties(id='1').to_client() == {'id': '1'}
+    assert Message.Properties(id='1').to_server() == {}
+
+
+def test_same_error_as_marshmallow():
+    compiled = build(Compiled, size='not a number')
+    plain = build(Plain, size='not a number')
+
+    with pytest.raises(ValidationError) as plain_exc:
+        plain.to_client()
+    with pytest.raises(ValidationError) as compiled_exc:
+        compiled.to_client()
+    assert compiled_exc.value.messages == plain_exc.value.messages
+
+
+def test_generated_source_is_available():
+    """
+    The generated code can be stepped through in a debugger.
+    """
+    import inspect
+    Address, Part, Message = Compiled
+    dumper = compile_dumper(Address, use_server_fields=True)
+    assert "data['email']" in inspect.getsource(dumper)
+
+
+LOAD_CASES = [
+    {'size': 1},
+    {'size': 1, 'ratio': 1.5, 'seen': True, 'color': 'red', 'receivedAt': '2018-01-02T03:04:05Z'},
+    {'size': 1, 'from': [{'email': 'a'}, {'name': None, 'email': 'b'}], 'sender': {'email': 'c'}},
+    {'size': 1, 'from': None, 'sender': None, 'body': None, 'color': None, 'raw': None},
+    {'size': 1, 'keywords': {'$seen': True}, 'values': {'1': {'partId': '1', 'size': 3}}},
+    {'size': 1, 'body': {'subParts': [{'subParts': [{'size': 1}]}, {'headers': [{'email': 'x'}]}]}},
+    {'size': 1, 'names': ['a', 'b'], 'mixed': ['x', {'email': 'y'}], 'raw': {'any': 1}},
+    {'size': 1, 'fetchHTML': True, 'tag:a': True, 'tag:b': True},
+    # Values marshmallow needs to convert
+    {'size': '1', 'seen': 'true', 'keywords': {'$seen': 1}, 'names': ['a'], 'ratio': 1},
+    # Values the attrs converters change
+    {'size': 1, 'label': 'abc', 'offset': -3, 'tag:b': True, 'tag:a': True},
+    {'size': 1, 'label': None},
+    # Errors
+    {},
+    {'size': None},
+    {'size': 'x', 'seen': 'maybe', 'names': 'a'},
+    {'size': -1},
+    {'size': 1, 'unknown': 1, 'fetchHtml': True},
+    {'size': 1, 'color': 'blue'},
+    {'size': 1, 'from': [{'email': 'a'}, {'email': 1}, {'name': 'x'}]},
+    {'size': 1, 'from': {'email': 'a'}},
+    {'size': 1, 'sender': 'a', 'body': {'size': -1, 'headers': [1]}},
+    {'size': 1, 'body': {'subParts': [{'subParts': [{'size': 'x'}]}]}},
+    {'size': 1, 'keywords': {'$seen': 'maybe'}, 'values': {'1': {'size': 'x'}}},
+    {'size': 1, 'names': ['a', None, 1]},
+]
+
+
+def load(models, data, use_server_fields):
+    Address, Part, Message = models
+    try:
+        if use_server_fields:
+            return Message.from_server(dict(data))
+        return Message.from_client(dict(data))
+    except ValidationError as exc:
+        return exc.messages
+
+
+@pytest.mark.parametrize('data', LOAD_CASES)
+@pytest.mark.parametrize('use_server_fields', [True, False])
+def test_load_same_as_marshmallow(data, use_server_fields):
+    compiled = load(Compiled, data, use_server_fields)
+    plain = load(Plain, data, use_server_fields)
+
+    if isinstance(plain, dict):
+        assert compiled == plain
+    else:
+        assert type(compiled).__name__ == type(plain).__name__
+        assert compiled.to_client() == plain.to_client()
+        assert get_set_attrs(compiled).obj.keys() == get_set_attrs(plain).obj.keys()
+
+
+def test_load_server_set_attributes():
+    """
+    Unlike `__init__`, the loader can set server-side attributes.
+    """
+    Address, Part, Message = Compiled
+    message = Message.from_server({'id': 'm1', 'size': 1})
+    assert message.id == 'm1'
+
+    with pytest.raises(ValidationError):
+        Message.from_client({'id': 'm1', 'size': 1})
+
+
+def test_load_runs_validators_once():
+    calls = []
+
+    def count(self, attribute, value):
+        calls.append(value)
+
+    @model(compiled=True)
+    class Foo:
+        a: int = attrib(validator=count)
+        b: int = attrib(default=1, validator=count)
+
+    loader = compile_loader(Foo, use_server_fields=True)
+    assert loader({'a': 5}) == Foo(a=5)
+    assert calls == [5, 5, 1]
+
+    calls.clear()
+    loader({'a': 5})
+    assert calls == [5]
@@ -110,3 +110,23 @@ def test_can_initialize_with_server_side_properties():
     mailbox = Mailbox.Properties(id='1')
     # So on serialization, out us set
     assert mailbox.to_client() == {'id': '1'}
+
+
+def test_slots_with_subclass_arguments():
+    """
+    Models use `__slots__`, also when a base class takes class arguments.
+    """
+    @model
+    class Base:
+        def __init_subclass__(cls, *, type):
+            cls.__annotations__ = {'item': type}
+
+    @model
+    class Child(Base, type=int):
+        pass
+
+    child = Child(item=1)
+    assert child.to_client() == {'item': 1}
+    with pytest.raises(AttributeError):
+        child.unknown = 1
+    assert not hasattr(child, '__dict__')
@@ -0,0 +1,57 @@
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from jmap.attrs import rfc3339
+from jmap.attrs.fields import serialize_rfc3339, deserialize_rfc3339
+
+
+@pytest.mark.parametrize('value', [
+    '2018-01-02T03:04:05Z',
+    '2018-01-02t03:04:05z',
+    '2018-01-02 03:04:05Z',
+    '0001-01-01T00:00:00Z',
+    '2018-01-02T03:04:05+01:30',
+    '2018-01-02T03:04:05.25Z',
+    '2018-02-30T03:04:05Z',
+    '2018-01-02T24:04:05Z',
+    '2018-01-02X03:04:05Z',
+    '2018-01-02T03:04:0xZ',
+    '+018-01-02T03:04:05Z',
+    '2018-01-02T03:04:05',
+])
+def test_parse_same_as_regex(value):
+    """
+    The fast path gives the same result as the regex, which we can force by
+    adding whitespace.
+    """
+    def parse(value):
+        try:
+            return deserialize_rfc3339(value)
+        except ValueError:
+            return ValueError
+
+    assert parse(value) == parse(f' {value} ')
+
+
+def test_tzinfo_is_shared():
+    a = deserialize_rfc3339('2018-01-02T03:04:05+01:30')
+    b = deserialize_rfc3339('2019-01-02T03:04:05+01:30')
+    assert a.tzinfo is b.tzinfo
+    assert deserialize_rfc3339('2018-01-02T03:04:05Z').tzinfo is rfc3339.UTC_TZ
+
+
+@pytest.mark.parametrize('value', [
+    datetime(2018, 1, 2, 3, 4, 5, 123),
+    datetime(2018, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+    datetime(5, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+    datetime(2018, 1, 2, 3, 4, 5, tzinfo=timezone(timedelta(hours=-2))),
+    datetime(2018, 1, 2, 3, 4, 5, tzinfo=rfc3339.tzinfo(0)),
+])
+@pytest.mark.parametrize('localtime', [True, False])
+def test_serialize(value, localtime):
+    if localtime or value.utcoffset() in (None, timedelta(0)):
+        expected = rfc3339.datetimetostr(value.replace(microsecond=0))
+    else:
+        expected = rfc3339.datetimetostr(value.astimezone(timezone.utc).replace(microsecond=0))
+    assert serialize_rfc3339(value, localtime=localtime) == expected
@@ -4,8 +4,8 @@ Test our custom marshmallow based system to validate input.
 import enum
 import pytest
 from marshmallow import ValidationError, fields, Schema
-from jmap.attrs import model, attrib
-from ..marshal import custom_marshal, PolyField
+from jmap.attrs import model, attrib, Lazy
+from ..marshal import custom_marshal, PolyField, get_schema, schema_context
 from typing import Optional, List, Dict, Union
 
 
@@ -67,6 +67,27 @@ def test_validators():
     Bar.from_server({'foo': 42})
 
 
+def test_validators_run_once():
+    """
+    The instance is created without running the validators a second time.
+    """
+
+    calls = []
+
+    def count(self, attribute, value):
+        calls.append(value)
+
+    @model
+    class Bar:
+        id: str = attrib(server_set=True)
+        foo: int = attrib(validator=count)
+
+    bar = Bar.from_server({'id': '1', 'foo': 42})
+    assert (bar.id, bar.foo) == ('1', 42)
+    Bar.from_client({'foo': 42})
+    assert calls == [42, 42]
+
+
 def test_nested_objects():
     """
     Ensure that we can nest objects.
@@ -268,6 +289,38 @@ class TestPolyfield:
         with pytest.raises(ValidationError):
             assert f.deserialize(1) == {}
 
+    def test_dispatch_order(self):
+        """
+        The first matching type wins (`bool` is an `int`), and `will_handle`
+        is asked before that.
+        """
+
+        @model
+        class Query:
+            value: str
+
+            @classmethod
+            def will_handle(cls, value):
+                return isinstance(value, str) and value.startswith('q:')
+
+            @classmethod
+            def unmarshal(cls, value):
+                return Query(value=value[2:])
+
+            def marshal(self):
+                return f'q:{self.value}'
+
+        f = PolyField({
+            Query: None,
+            bool: fields.Boolean(),
+            int: fields.Integer(),
+            str: fields.String(),
+        }, many=True)
+        f.parent = Schema(context={'use_server_fields': True})
+
+        assert f.deserialize(['q:a', 'b', True, 1]) == [Query(value='a'), 'b', True, 1]
+        assert f.serialize('x', {'x': [Query(value='a'), 'b', 1]}) == ['q:a', 'b', 1]
+
 
 def test_partial_serialize():
     """
@@ -288,4 +341,90 @@ def test_partial_serialize():
         # Ensure type is passed through properly
         Foo.from_server({'role': True})
 
-    assert Foo.from_server({'role': 5}) == Foo(role=5)
\ No newline at end of file
+    assert Foo.from_server({'role': 5}) == Foo(role=5)
+
+
+def test_schema_instances_are_shared():
+    """
+    The schema instances are created once per class and direction, and the
+    context can be given per call.
+    """
+
+    seen_context = []
+
+    def dump(data, instance, field):
+        seen_context.append(dict(get_schema(Foo, use_server_fields=True).context))
+        return data
+
+    @model
+    class Foo:
+        v: int = attrib(metadata={'marshal': custom_marshal(dump, None)})
+
+    assert get_schema(Foo, use_server_fields=True) is get_schema(Foo, use_server_fields=True)
+    assert get_schema(Foo, use_server_fields=True) is not get_schema(Foo, use_server_fields=False)
+
+    Foo(v=1).to_client()
+    Foo(v=1).to_client(context={'extra': 1})
+    with schema_context(other=2):
+        Foo(v=1).to_client()
+
+    assert seen_context == [
+        {'use_server_fields': True},
+        {'use_server_fields': True, 'extra': 1},
+        {'use_server_fields': True, 'other': 2},
+    ]
+
+    # The shared instances cannot be changed
+    schema = get_schema(Foo, use_server_fields=False)
+    with pytest.raises(TypeError):
+        schema.context['use_server_fields'] = True
+    with pytest.raises(AttributeError):
+        schema.context = {'a': 1}
+    assert schema.context == {'use_server_fields': False}
+
+
+def test_key_maps():
+    @model
+    class Foo:
+        mailbox_ids: str
+        from_: str
+        fetch_html: bool = attrib(camelcase='fetchHTML')
+
+    assert Foo.__json_keys__ == {'mailbox_ids': 'mailboxIds', 'from_': 'from', 'fetch_html': 'fetchHTML'}
+    assert Foo.__attr_names__ == {'mailboxIds': 'mailbox_ids', 'from': 'from_', 'fetchHTML': 'fetch_html'}
+
+
+@pytest.mark.parametrize('compiled', [True, False])
+def test_lazy_attributes(compiled):
+    """
+    A `Lazy` value is computed on access, or when serialized, and only once.
+    """
+    calls = []
+
+    def loader(value):
+        def load():
+            calls.append(value)
+            return value
+        return Lazy(load)
+
+    @model(compiled=compiled)
+    class Foo:
+        id: str
+        preview: str = attrib(lazy=True)
+        size: Optional[int] = attrib(lazy=True, default=None)
+
+    foo = Foo(id='1', preview=loader('text'))
+    assert calls == []
+    assert Foo.to_client_many([foo], properties=['id']) == [{'id': '1'}]
+    assert calls == []
+
+    assert foo.to_client() == {'id': '1', 'preview': 'text'}
+    assert foo.preview == 'text'
+    assert calls == ['text']
+
+    # Unset lazy attributes still give the default, and are not serialized
+    assert foo.size is None
+    foo.size = loader(3)
+    assert foo.size == 3
+    assert foo.to_client() == {'id': '1', 'preview': 'text', 'size': 3}
+    assert calls == ['text', 3]
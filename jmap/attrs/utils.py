@@ -2,14 +2,78 @@ from jmap.attrs import attrs
 
 
 class AsObject:
-    def __init__(self, obj):
+    def __init__(self, obj, instance=None):
         self.obj = obj
+        self.instance = instance
 
     def __getattr__(self, item):
         try:
-            return self.obj[item]
+            value = self.obj[item]
         except KeyError:
             raise AttributeError(item)
+        if value.__class__ is Lazy:
+            # Only now that it is needed, compute the value.
+            value = getattr(self.instance, item)
+        return value
+
+
+class Lazy:
+    """
+    A value which is only computed when needed. Can be given for attributes
+    defined with `attrib(lazy=True)`:
+
+        email.preview = Lazy(lambda: make_preview(message))
+
+    On first access, `loader` is called, and the value it returns replaces
+    the `Lazy`. As far as serialization is concerned, the attribute is set,
+    but if it is not serialized (say, it was not requested by the client),
+    `loader` never runs.
+    """
+
+    __slots__ = ('loader',)
+
+    def __init__(self, loader):
+        self.loader = loader
+
+    def __repr__(self):
+        return f'Lazy({self.loader!r})'
+
+
+class LazyAttribute:
+    """
+    Replaces the slot of an attribute defined with `attrib(lazy=True)`, to
+    compute a `Lazy` value on access. Other attributes are unaffected.
+    """
+
+    def __init__(self, slot):
+        self.slot = slot
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = self.slot.__get__(instance, owner)
+        if value.__class__ is Lazy:
+            value = value.loader()
+            self.slot.__set__(instance, value)
+        return value
+
+    def __set__(self, instance, value):
+        self.slot.__set__(instance, value)
+
+    def __delete__(self, instance):
+        self.slot.__delete__(instance)
+
+
+def get_stored_value(instance, name):
+    """
+    Return the value of the attribute `name` as it is stored: without the
+    default from `__getattr__` if it was never set (raises `AttributeError`
+    instead), and without computing a `Lazy` value.
+    """
+    lazy_attribute = instance.__class__.__lazy_attributes__.get(name)
+    if lazy_attribute is not None:
+        return lazy_attribute.slot.__get__(instance)
+    return object.__getattribute__(instance, name)
 
 
 def get_set_attrs(instance):
@@ -19,18 +83,18 @@ def get_set_attrs(instance):
     """
     klass = instance.__class__
 
-    if getattr(klass, '__slots__', None):
+    if getattr(klass, '__slots__', None) is not None:
+        # `__slots__` only lists the attributes not defined by a base class.
+        # We skip `__getattr__`, which would give us the defaults.
         values = {}
-        for slot_name in klass.__slots__:
-            if slot_name.startswith('__'):
-                continue
+        for field in attrs.fields(klass):
             try:
-                value = getattr(klass, slot_name).__get__(instance)
-            except AttributeError as e:
+                values[field.name] = get_stored_value(instance, field.name)
+            except AttributeError:
                 pass
-            else:
-                values[slot_name] = value
-        return values
+        # Not a dict: marshmallow would fall back to the dict's own attributes
+        # for missing keys, as in `values.items`.
+        return AsObject(values, instance)
 
     else:
         # marshmallow can handle both, but our custom code should have a
@@ -38,5 +102,21 @@ def get_set_attrs(instance):
         return AsObject(instance.__dict__)
 
 
+def project(instance, names):
+    """
+    Return a copy of `instance` which has only those of its attributes set
+    which are listed in `names`.
+    """
+    klass = instance.__class__
+    copy = klass.__new__(klass)
+    for name in names:
+        try:
+            value = get_stored_value(instance, name)
+        except AttributeError:
+            continue
+        object.__setattr__(copy, name, value)
+    return copy
+
+
 def properties(instance):
     return attrs.fields_dict(instance).keys()
\ No newline at end of file
@@ -2,17 +2,42 @@
 We wrap attrs. It is just flexible enough to support what we need.
 """
 
+from contextvars import ContextVar
+from functools import wraps
+
 from . import attrs
 from .marshal import marshallable
+from .utils import LazyAttribute
+
+
+# To add `__slots__`, attrs has to create a new class, which runs the
+# `__init_subclass__` hooks of the base classes again - this time without the
+# class arguments, say, `type=Mailbox`. The hooks have already been run for the
+# original class, whose namespace the new class copies, so we skip them then.
+_copying_class = ContextVar('_copying_class', default=False)
+
 
+def skip_when_copying(hook):
+    @wraps(hook)
+    def __init_subclass__(cls, **kwargs):
+        if _copying_class.get():
+            return
+        return hook(cls, **kwargs)
+    return classmethod(__init_subclass__)
 
-def attrib(*, server_set=False, camelcase=None, **kwargs):
+
+def attrib(*, server_set=False, camelcase=None, lazy=False, **kwargs):
     our_args = {}
     if server_set:
         metadata = our_args.setdefault('metadata', {})
         metadata['server_set'] = True
         our_args['init'] = False
 
+    # The attribute can be given a `Lazy` value.
+    if lazy:
+        metadata = our_args.setdefault('metadata', {})
+        metadata['lazy'] = True
+
     if camelcase:
         metadata = our_args.setdefault('metadata', {})
         metadata['camelcase'] = camelcase
@@ -20,28 +45,40 @@ def attrib(*, server_set=False, camelcase=None, **kwargs):
     return attrs.attrib(**kwargs, **our_args)
 
 
-def model(maybe_cls):
+def model(maybe_cls=None, *, compiled=False):
+    """Turn `maybe_cls` into a model.
+
+    With `compiled=True`, a specialised function is generated to serialize
+    the model, rather than going through marshmallow (see `jmap.attrs.compiled`).
+    """
     def wrap(cls):
-        attr_class = attrs.attrs(
-            # Using slots automatically gives us attribute-validation
-            # on set, because no new attributes are allowed, in addition
-            # to performance improvements when dealing with a lot of
-            # email objects, for example.
-            #
-            # TODO: Renable slots. It currently breaks __init_subclass__
-            # with type arguments.
-            slots=False,
-
-            auto_attribs=True,
-            kw_only=True
-        )(cls)
+        hook = cls.__dict__.get('__init_subclass__')
+        if hook is not None:
+            cls.__init_subclass__ = skip_when_copying(hook.__func__)
+
+        token = _copying_class.set(True)
+        try:
+            attr_class = attrs.attrs(
+                # Using slots automatically gives us attribute-validation
+                # on set, because no new attributes are allowed, in addition
+                # to performance improvements when dealing with a lot of
+                # email objects, for example.
+                slots=True,
+
+                auto_attribs=True,
+                kw_only=True
+            )(cls)
+        finally:
+            _copying_class.reset(token)
+
+        add_lazy_attributes(attr_class)
 
         # `attr_class` now has an `__init__` as we designed
         # it for client-side use. cls.properties is for the server.
         attr_class.Properties = make_properties_loader(attr_class)
 
         # Add the marshal helpers.
-        attr_class = marshallable(attr_class)
+        attr_class = marshallable(attr_class, compiled=compiled)
 
         return attr_class
 
@@ -51,6 +88,22 @@ def model(maybe_cls):
         return wrap(maybe_cls)
 
 
+def add_lazy_attributes(cls):
+    lazy_attributes = {}
+    for field in attrs.fields(cls):
+        if not field.metadata.get('lazy'):
+            continue
+        descriptor = cls.__dict__.get(field.name)
+        if descriptor is None:
+            # Defined by a base class
+            descriptor = getattr(cls, field.name)
+        elif not isinstance(descriptor, LazyAttribute):
+            descriptor = LazyAttribute(descriptor)
+            setattr(cls, field.name, descriptor)
+        lazy_attributes[field.name] = descriptor
+    cls.__lazy_attributes__ = lazy_attributes
+
+
 def make_properties_loader(cls):
     @classmethod
     def properties(self, **kwargs):
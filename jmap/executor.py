@@ -2,11 +2,17 @@
 Knows how to execute a JMAP request.
 """
 
+import inspect
+import threading
 from collections import defaultdict
+from concurrent import futures
+from types import MappingProxyType
 from typing import List, Dict, Any
 
 from marshmallow import ValidationError
 
+from jmap.attrs.marshal import CustomNested, CustomUnmarshalField, get_schema
+from jmap.attrs.utils import Lazy, get_stored_value
 from jmap.modules.core import JmapModuleInterface
 from jmap.models.errors import JMapError, JMapMethodError, JMapUnknownMethod, JMapInvalidResultReference, \
     JMapNotRequest
@@ -33,11 +39,112 @@ def resolve_reference(ref: ResultReference, db: Dict[str, Dict[str, Any]]):
     response = responses[ref.name]
 
     try:
-        return resolve_pointer(response.to_client(), ref.path)
+        return serialize_result(resolve_pointer(wrap_models(response), ref.path))
     except JsonPointerException as exc:
         raise JMapInvalidResultReference('{}'.format(exc))
 
 
+class ModelView:
+    """Lets a JSON pointer walk a model as if it had been serialized with
+    `to_client()`, but only serializes what it walks through.
+
+    A reference such as `/list/*/threadId` thus only serializes the thread
+    ids, not the complete list of emails.
+
+    `properties` are the attributes which are serialized, if not all of them,
+    as for the objects of a /get response, if the client asked for only some
+    of their properties.
+    """
+
+    __slots__ = ('model', 'properties')
+
+    def __init__(self, model, properties=None):
+        self.model = model
+        self.properties = properties
+
+    def __getitem__(self, key):
+        model = self.model
+        attr_name = model.__attr_names__.get(key)
+        field = get_schema(model.__class__, use_server_fields=True).fields.get(attr_name)
+
+        # Keys which are not simply an attribute, such as those output by a custom
+        # marshal function, require us to serialize the model. We assume that such
+        # a function only outputs keys of its own.
+        if field is None or isinstance(field, CustomUnmarshalField):
+            return wrap_models(self.to_client()[key])
+
+        if field.load_only or (self.properties is not None and attr_name not in self.properties):
+            raise KeyError(key)
+        try:
+            value = get_stored_value(model, attr_name)
+        except AttributeError:
+            # Not set, so not serialized
+            raise KeyError(key)
+        if value.__class__ is Lazy:
+            # Only now that it is needed, compute the value.
+            value = getattr(model, attr_name)
+
+        if isinstance(field, CustomNested):
+            return wrap_models(value, get_nested_properties(model, attr_name))
+        return field._serialize(value, attr_name, model)
+
+    def to_client(self):
+        if self.properties is None:
+            return self.model.to_client()
+        return self.model.to_client_many([self.model], properties=self.properties)[0]
+
+
+def get_nested_properties(model, attr_name):
+    """The attributes serialized of the models in `attr_name`, if not all of
+    them: see `StandardGetResponse.to_client`.
+    """
+    properties = getattr(model, 'requested_properties', None)
+    if attr_name != 'list' or properties is None:
+        return None
+    return frozenset(model.get_property_names(properties))
+
+
+def wrap_models(value, properties=None):
+    if isinstance(value, list):
+        return [wrap_models(item, properties) for item in value]
+    if hasattr(value, '__marshmallow_schemas__'):
+        return ModelView(value, properties)
+    return value
+
+
+def serialize_result(value):
+    if isinstance(value, list):
+        return [serialize_result(item) for item in value]
+    if isinstance(value, ModelView):
+        return value.to_client()
+    return value
+
+
+class Responses:
+    """The responses to the method calls of a request: in the order of the
+    calls, and indexed by client id, so that references can be resolved.
+    """
+
+    __slots__ = ('method_responses', 'by_client_id')
+
+    def __init__(self):
+        self.method_responses = []
+        self.by_client_id = defaultdict(lambda: {})
+
+    def add(self, method_call, response_name, response_data):
+        self.by_client_id[method_call.client_id][response_name] = response_data
+        self.method_responses.append([response_name, response_data, method_call.client_id])
+
+    def add_result(self, method_call, result):
+        self.add(method_call, method_call.name, result)
+
+    def add_error(self, method_call, exc: JMapMethodError):
+        self.add(method_call, 'error', exc.to_json())
+
+    def to_response(self) -> JMapResponse:
+        return JMapResponse(method_responses=self.method_responses)
+
+
 class Executor:
     """You can pass this a `JMapRequest`.
 
@@ -48,53 +155,70 @@ class Executor:
     request to each module's `execute()`. The validation logic must be handled by the
     module. The `JMapModule` base class implements this logic in a re-usable way.
 
-    TODO: We might convert this into a stateless function, to make it clear there is
-    no need to instantiate this only once.
+    Create it once and use it for all requests; it can be shared between threads,
+    since it keeps no state for a request. If the modules, or the methods they
+    provide, change, call `invalidate()`.
+
+    If a `pool` (a `concurrent.futures.Executor`) is given, method calls which do not
+    depend on each other run concurrently, see `execute_concurrently()`.
     """
 
-    def __init__(self, modules: List[JmapModuleInterface]):
-        # Map all method names to modules
-        self.available_methods = {method: m for m in modules for method in m.get_methods()}
+    # Methods with these suffixes only read data, and can run at the same time as
+    # others. Anything else, such as a /set, runs after all the method calls before
+    # it have finished, and before any after it start.
+    concurrent_methods = ('/get', '/changes', '/query', '/queryChanges', 'Core/echo')
+
+    def __init__(self, modules: List[JmapModuleInterface], *, pool: futures.Executor = None):
+        self.modules = modules
+        self.pool = pool
+        self._lock = threading.Lock()
+        self.invalidate()
+
+    def invalidate(self):
+        """Rebuild the registry of methods from `self.modules`.
+        """
+        with self._lock:
+            # Map all method names to modules. A request in progress keeps
+            # using the registry it started with.
+            self.available_methods = MappingProxyType(
+                {method: m for m in self.modules for method in m.get_methods()})
 
     def execute(self, request: JMapRequest, *, context):
-        method_responses = []
+        if self.pool is not None and len(request.method_calls) > 1:
+            return self.execute_concurrently(request, context=context)
 
-        # Keep previous responses to allow references
-        responses_by_client_id = defaultdict(lambda: {})
+        available_methods = self.available_methods
+        responses = Responses()
 
         for method_call in request.method_calls:
             try:
                 result = self.execute_method(
                     method_call,
-                    responses_by_client_id=responses_by_client_id,
-                    context=context
+                    responses_by_client_id=responses.by_client_id,
+                    context=context,
+                    available_methods=available_methods
                 )
             except JMapMethodError as exc:
-                response_name = 'error'
-                response_data = exc.to_json()
+                responses.add_error(method_call, exc)
             else:
-                response_name = method_call.name
-                response_data = result
+                responses.add_result(method_call, result)
 
-            # Index it
-            responses_by_client_id[method_call.client_id][response_name] = response_data
+        return responses.to_response()
 
-            method_responses.append(
-                [
-                    response_name,
-                    response_data,
-                    method_call.client_id
-                ]
-            )
+    def execute_method(self, method_call, *, responses_by_client_id, context, available_methods=None):
+        module = self.get_module(method_call, available_methods)
+        args = self.resolve_references(method_call, responses_by_client_id)
+        return self.call_module(module, method_call, args, context=context)
 
-        return JMapResponse(method_responses=method_responses)
-
-    def execute_method(self, method_call, *, responses_by_client_id, context):
+    def get_module(self, method_call, available_methods=None):
         # Find the right module
-        if not method_call.name in self.available_methods:
+        if available_methods is None:
+            available_methods = self.available_methods
+        if not method_call.name in available_methods:
             raise MethodNotFound(method_call.name)
-        module = self.available_methods[method_call.name]
+        return available_methods[method_call.name]
 
+    def resolve_references(self, method_call, responses_by_client_id):
         # Resolve any references to previous responses
         args = method_call.args
         if isinstance(args, dict):
@@ -108,9 +232,191 @@ class Executor:
                     new_value = resolve_reference(ref, responses_by_client_id)
                     args[arg_name[1:]] = new_value
                     del args[arg_name]
+        return args
 
+    def call_module(self, module, method_call, args, *, context):
         # Execute the call
         try:
-            return module.execute(method_call.name, args, context=context)
+            result = module.execute(method_call.name, args, context=context)
         except NotImplementedError:
-            raise JMapUnknownMethod("This method is not implemented.")
\ No newline at end of file
+            raise JMapUnknownMethod("This method is not implemented.")
+        if inspect.isawaitable(result):
+            # Say, an `async def` handler. We have no event loop to run it in.
+            close = getattr(result, 'close', None)
+            if close is not None:
+                close()
+            raise TypeError(f'{module!r} returned an awaitable for {method_call.name}; '
+                            f'async modules require the AsyncExecutor.')
+        return result
+
+    def get_dependencies(self, method_calls):
+        """For each method call, return the indices of the calls which need to
+        have finished before it can run.
+
+        A call depends on the earlier calls with a client id it refers to. A call
+        which is not one of `concurrent_methods`, or has a reference we cannot
+        read, depends on all the calls before it, and all the calls after it
+        depend on it.
+        """
+        dependencies = []
+        barrier = None
+        for index, method_call in enumerate(method_calls):
+            referenced_ids = get_referenced_ids(method_call)
+            if referenced_ids is None or not method_call.name.endswith(self.concurrent_methods):
+                dependencies.append(set(range(index)))
+                barrier = index
+                continue
+
+            depends_on = {j for j in range(index) if method_calls[j].client_id in referenced_ids}
+            if barrier is not None:
+                depends_on.add(barrier)
+            dependencies.append(depends_on)
+        return dependencies
+
+    def execute_concurrently(self, request: JMapRequest, *, context):
+        """Like `execute`, but runs the method calls on `self.pool`, each as soon
+        as the calls it depends on (see `get_dependencies`) have finished.
+
+        The result is the same as if they ran in order: the responses are in the
+        order of the calls, and a reference sees the responses of all the calls
+        before it. If a call fails with an error which is not a method error, the
+        calls before it are still completed, and the error of the first such call
+        is raised.
+        """
+        available_methods = self.available_methods
+        method_calls = request.method_calls
+        dependencies = self.get_dependencies(method_calls)
+
+        # For each call, (response name, response data), once done.
+        results = [None] * len(method_calls)
+        finished = set()
+        errors = {}
+
+        def record(index, response_name, response_data):
+            results[index] = (response_name, response_data)
+            finished.add(index)
+
+        pending = list(range(len(method_calls)))
+        running = {}
+        while True:
+            # Once a call failed, we only complete the ones before it.
+            limit = min(errors) if errors else len(method_calls)
+
+            # Start all calls which are ready. References are resolved here, in
+            # this thread, once the calls they refer to have finished.
+            for index in list(pending):
+                if index >= limit or not dependencies[index] <= finished:
+                    continue
+                pending.remove(index)
+                method_call = method_calls[index]
+                try:
+                    module = self.get_module(method_call, available_methods)
+                    args = self.resolve_references(
+                        method_call, collect_responses(method_calls, results, before=index))
+                except JMapMethodError as exc:
+                    record(index, 'error', exc.to_json())
+                except Exception as exc:
+                    errors[index] = exc
+                    limit = min(limit, index)
+                else:
+                    future = self.pool.submit(self.call_module, module, method_call, args, context=context)
+                    running[future] = index
+
+            if not running:
+                if any(index < limit for index in pending):
+                    # Calls recorded as errors above may have made others ready.
+                    continue
+                break
+
+            done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                index = running.pop(future)
+                try:
+                    result = future.result()
+                except JMapMethodError as exc:
+                    record(index, 'error', exc.to_json())
+                except Exception as exc:
+                    errors[index] = exc
+                else:
+                    record(index, method_calls[index].name, result)
+
+        if errors:
+            raise errors[min(errors)]
+
+        responses = Responses()
+        for method_call, (response_name, response_data) in zip(method_calls, results):
+            responses.add(method_call, response_name, response_data)
+        return responses.to_response()
+
+
+class AsyncExecutor(Executor):
+    """Like `Executor`, but `execute` is a coroutine.
+
+    The modules can be async - an `AsyncJmapBaseModule`, or any module returning
+    an awaitable from `execute()`, such as a `JmapBaseModule` with `async def`
+    handlers. Synchronous modules work as well, but block the event loop while
+    they run.
+    """
+
+    def __init__(self, modules: List[JmapModuleInterface]):
+        super().__init__(modules)
+
+    async def execute(self, request: JMapRequest, *, context):
+        available_methods = self.available_methods
+        responses = Responses()
+
+        # The same as `Executor.execute`, but awaiting each call.
+        for method_call in request.method_calls:
+            try:
+                result = await self.execute_method(
+                    method_call,
+                    responses_by_client_id=responses.by_client_id,
+                    context=context,
+                    available_methods=available_methods
+                )
+            except JMapMethodError as exc:
+                responses.add_error(method_call, exc)
+            else:
+                responses.add_result(method_call, result)
+
+        return responses.to_response()
+
+    async def execute_method(self, method_call, *, responses_by_client_id, context, available_methods=None):
+        module = self.get_module(method_call, available_methods)
+        args = self.resolve_references(method_call, responses_by_client_id)
+        return await self.call_module(module, method_call, args, context=context)
+
+    async def call_module(self, module, method_call, args, *, context):
+        # Execute the call
+        try:
+            result = module.execute(method_call.name, args, context=context)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+        except NotImplementedError:
+            raise JMapUnknownMethod("This method is not implemented.")
+
+
+def get_referenced_ids(method_call):
+    """Return the client ids of the calls `method_call` refers to, or None if
+    a reference is invalid.
+    """
+    referenced_ids = set()
+    if isinstance(method_call.args, dict):
+        for arg_name, value in method_call.args.items():
+            if arg_name.startswith('#'):
+                if not isinstance(value, dict) or not isinstance(value.get('resultOf'), str):
+                    return None
+                referenced_ids.add(value['resultOf'])
+    return referenced_ids
+
+
+def collect_responses(method_calls, results, *, before):
+    """Index the responses of the calls before the call at index `before` by client
+    id, as `Executor.execute` does while going along.
+    """
+    responses = Responses()
+    for method_call, result in zip(method_calls[:before], results):
+        if result is not None:
+            responses.add(method_call, *result)
+    return responses.by_client_id
@@ -1,14 +1,274 @@
+"""
+Encoding and decoding JSON.
+
+The standard library's `json` module always works, but if one of the faster
+JSON libraries is installed - `orjson`, `ujson` or `rapidjson` - we use that
+instead; see `get_codec()`.
+"""
+
+import json
+from datetime import datetime
+from itertools import islice
 from json import JSONEncoder
+
 from jmap.attrs import attrs
+from jmap.attrs.fields import serialize_rfc3339
+from jmap.attrs.utils import get_stored_value, project
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import rapidjson
+except ImportError:
+    rapidjson = None
+
+
+def default(obj):
+    """Serialize the values the JSON libraries do not know about: our models,
+    and datetimes, in the RFC 3339 form JMAP uses. Raises a `TypeError` for
+    anything else.
+    """
+    if attrs.has(type(obj)):
+        if getattr(obj, 'to_client', None):
+            return obj.to_client()
+        return attrs.asdict(obj)
+    if isinstance(obj, datetime):
+        return serialize_rfc3339(obj, localtime=False)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
 
 
 class JmapJSONEncoder(JSONEncoder):
 
     def default(self, obj):
-        if attrs.has(type(obj)):
-            if getattr(obj, 'to_client'):
-                return obj.to_client()
-            return attrs.asdict(obj)
-        return JSONEncoder.default(self, obj)
+        try:
+            return default(obj)
+        except TypeError:
+            return JSONEncoder.default(self, obj)
+
+
+_encoder = JmapJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+class JSONCodec:
+    """Encodes to and decodes from JSON, using the standard library.
+
+    The subclasses use one of the faster libraries instead; they give the same
+    results, but for the formatting of floats, and how non-ascii characters
+    are escaped.
+    """
+
+    name = 'json'
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def dumps(self, obj) -> bytes:
+        return _encoder.encode(obj).encode('utf-8')
+
+    def loads(self, data):
+        """Decode `data`, `bytes` or `str`. Raises a `ValueError` if it is
+        not valid JSON.
+        """
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    name = 'orjson'
+
+    @classmethod
+    def is_available(cls):
+        return orjson is not None
+
+    def dumps(self, obj) -> bytes:
+        # orjson knows datetimes, but does not write them the way JMAP wants.
+        # Also, like the json module, allow keys which are not strings.
+        return orjson.dumps(obj, default=default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class UJSONCodec(JSONCodec):
+    name = 'ujson'
+
+    @classmethod
+    def is_available(cls):
+        return ujson is not None
+
+    def dumps(self, obj) -> bytes:
+        return ujson.dumps(obj, default=default, ensure_ascii=False).encode('utf-8')
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+
+class RapidJSONCodec(JSONCodec):
+    name = 'rapidjson'
+
+    @classmethod
+    def is_available(cls):
+        return rapidjson is not None
+
+    def dumps(self, obj) -> bytes:
+        return rapidjson.dumps(obj, default=default, ensure_ascii=False).encode('utf-8')
+
+    def loads(self, data):
+        return rapidjson.loads(data)
+
+
+# In order of preference
+CODECS = [OrjsonCodec, UJSONCodec, RapidJSONCodec, JSONCodec]
+
+_default_codec = None
+
+
+def get_codec(name=None) -> JSONCodec:
+    """Return the codec called `name`, or if not given, the fastest one
+    available. Raises a `ValueError` if the codec asked for is not available.
+    """
+    global _default_codec
+
+    if name is None:
+        if _default_codec is None:
+            _default_codec = next(codec for codec in CODECS if codec.is_available())()
+        return _default_codec
+
+    for codec in CODECS:
+        if codec.name == name:
+            if not codec.is_available():
+                raise ValueError(f'The JSON codec "{name}" is not installed')
+            return codec()
+    raise ValueError(f'There is no JSON codec called "{name}"')
+
+
+def iter_json(obj, *, codec=None, chunk_size=64 * 1024):
+    """Encode `obj` like `codec.dumps()` does, but return an iterator of
+    chunks of about `chunk_size` bytes.
+
+    Models are only serialized when the encoder gets to them, and those
+    attributes of a model which are listed in its `__streamed_attributes__` -
+    such as the `list` of a /get response - a batch of items at a time. This
+    way, the serialized form of a large response never needs to be in memory at
+    once. Everything else, such as the arguments of a method response which
+    is a plain dict, is encoded by a single `codec.dumps()` call.
+
+    The iterator can be used as the body of a WSGI response, or be sent by an
+    ASGI app chunk by chunk:
+
+        return Response(iter_json(server.handle_request_from_json(data, context=context)))
+    """
+    codec = codec or get_codec()
+
+    buffer = []
+    size = 0
+    for part in _iter_parts(obj, codec):
+        buffer.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _iter_parts(obj, codec):
+    # Only the envelope is taken apart, down to each method response; anything
+    # else is encoded in one go, which is much faster than going item by item.
+    if isinstance(obj, dict) and isinstance(obj.get('methodResponses'), (list, tuple)):
+        yield from _iter_object(
+            ((key, _iter_method_responses(value, codec) if key == 'methodResponses' else None, value)
+             for key, value in obj.items()), codec)
+    else:
+        yield from _iter_value(obj, codec)
+
+
+def _iter_method_responses(method_responses, codec):
+    yield b'['
+    for index, method_response in enumerate(method_responses):
+        if index:
+            yield b','
+        if isinstance(method_response, (list, tuple)):
+            yield from _iter_array(method_response, codec)
+        else:
+            yield codec.dumps(method_response)
+    yield b']'
+
+
+def _iter_value(obj, codec):
+    """Encode `obj`, streaming the `__streamed_attributes__` of a model."""
+    klass = type(obj)
+    if not getattr(klass, '__streamed_attributes__', None) or not attrs.has(klass):
+        yield codec.dumps(obj)
+        return
+
+    streamed = klass.__streamed_attributes__
+    data = default(project(obj, [a.name for a in attrs.fields(klass) if a.name not in streamed]))
+
+    items = [(key, None, value) for key, value in data.items()]
+    for name in streamed:
+        try:
+            value = get_stored_value(obj, name)
+        except AttributeError:
+            continue
+        # The model can decide how the items are serialized, say, only some
+        # of their properties.
+        dump_item = obj.get_streamed_dumper(name) if hasattr(obj, 'get_streamed_dumper') else None
+        items.append((klass.__json_keys__[name],
+                      _iter_batches(value if dump_item is None else map(dump_item, value), codec), None))
+    yield from _iter_object(items, codec)
+
+
+def _iter_array(items, codec):
+    yield b'['
+    for index, item in enumerate(items):
+        if index:
+            yield b','
+        yield from _iter_value(item, codec)
+    yield b']'
+
+
+def _iter_batches(items, codec, batch_size=100):
+    """Encode the list `items`, `batch_size` items at a time."""
+    items = iter(items)
+    yield b'['
+    first = True
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            break
+        if not first:
+            yield b','
+        first = False
+        # Encode the batch as a list, without the brackets.
+        yield codec.dumps(batch)[1:-1]
+    yield b']'
 
 
+def _iter_object(items, codec):
+    """`items` are (key, parts, value): `parts` is an iterator of the encoded
+    value, or if None, `value` is encoded.
+    """
+    yield b'{'
+    for index, (key, parts, value) in enumerate(items):
+        if not isinstance(key, str):
+            # As the json module does for int, float, bool and None keys
+            key = json.dumps(key)
+        if index:
+            yield b','
+        yield codec.dumps(key)
+        yield b':'
+        if parts is None:
+            yield codec.dumps(value)
+        else:
+            yield from parts
+    yield b'}'
@@ -5,6 +5,7 @@
 #
 # Modified for jmap-python to:
 # - Handle the * array accessor required by the JMAP spec.
+# - Compile pointers into step functions, and cache them.
 #
 # Copyright (c) 2011 Stefan Kögl <stefan@skoegl.net>
 # All rights reserved.
@@ -43,6 +44,7 @@ try:
 except ImportError:  # Python 3
     from collections import Mapping, Sequence
 
+from functools import lru_cache
 from itertools import tee
 import re
 import copy
@@ -113,10 +115,20 @@ def resolve_pointer(doc, pointer, default=_nothing):
     True
     """
 
-    pointer = JsonPointer(pointer)
+    pointer = compile_pointer(pointer)
     return pointer.resolve(doc, default)
 
 
+@lru_cache(maxsize=256)
+def compile_pointer(pointer):
+    """Returns a `JsonPointer` for the given string, reusing a previous one
+    if possible; clients tend to send the same few paths over and over.
+
+    The pointer returned is shared, and must not be modified.
+    """
+    return JsonPointer(pointer)
+
+
 def pairwise(iterable):
     """ Transforms a list to a list of tuples of adjacent items
 
@@ -180,6 +192,44 @@ class JsonPointer(object):
 
         parts = [unescape(part) for part in parts]
         self.parts = parts
+        self.steps = [self.compile_step(part) for part in parts]
+
+    def compile_step(self, part):
+        """Returns a function which walks one step in a document.
+
+        What a part means depends on the document it is applied to, so this
+        can only do the work up front which is the same for every document.
+        The common cases - dicts and lists - are handled directly, anything
+        else by `walk`.
+        """
+        walk = self.walk
+
+        if part == '*':
+            def step(doc):
+                if type(doc) is list:
+                    return FullList(doc)
+                return walk(doc, part)
+            return step
+
+        if self._RE_ARRAY_INDEX.match(part):
+            index = int(part)
+        else:
+            index = None
+
+        def step(doc):
+            doc_type = type(doc)
+            if doc_type is dict:
+                try:
+                    return doc[part]
+                except KeyError:
+                    raise JsonPointerException("member '%s' not found in %s" % (part, doc))
+            if doc_type is list and index is not None:
+                try:
+                    return doc[index]
+                except IndexError:
+                    raise JsonPointerException("index '%s' is out of bounds" % (index, ))
+            return walk(doc, part)
+        return step
 
     def to_last(self, doc):
         """Resolves ptr until the last step, returns (sub-doc, last-step)"""
@@ -198,21 +248,16 @@ class JsonPointer(object):
         # Once we encounter a *, this happens
         doc_is_list = False
 
-        for part in self.parts:
+        for step in self.steps:
             try:
                 # If there was already a * index, we now need to process all
                 # subsequent parts for every item in the wildcard array.
                 if doc_is_list:
-                    new_doc_list = []
-                    for item in doc:
-                        new_doc_list.append(self.walk(item, part))
-
                     # TODO: Any FullList in the result, flatten
-
-                    doc = new_doc_list
+                    doc = [step(item) for item in doc]
 
                 else:
-                    doc = self.walk(doc, part)
+                    doc = step(doc)
                     if isinstance(doc, FullList):
                         doc_is_list = True
                         doc = doc.list
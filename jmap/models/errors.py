@@ -72,6 +72,35 @@ class JMapNotRequest(JMapRequestError):
     detail = 'This was not a valid request structure'
 
 
+class JMapNotJSON(JMapRequestError):
+    """
+    urn:ietf:params:jmap:error:notJSON
+    The content type of the request was not application/json or the request did
+    not parse as I-JSON.
+    """
+    typename = 'notJSON'
+    statuscode = 400
+
+
+class JMapLimit(JMapRequestError):
+    """
+    urn:ietf:params:jmap:error:limit
+    The request was not processed as it would have exceeded one of the request
+    limits defined on the capability object. `limit` is the name of the limit.
+    """
+    typename = 'limit'
+    statuscode = 400
+
+    def __init__(self, limit, detail=None):
+        super().__init__(detail)
+        self.limit = limit
+
+    def to_json(self):
+        result = super().to_json()
+        result['limit'] = self.limit
+        return result
+
+
 class SetError(Exception):
     pass
 
@@ -25,8 +25,10 @@ from marshmallow import ValidationError
 from jmap.attrs import model, attrib, Factory, fields
 from jmap.attrs.utils import properties
 from jmap.models.errors import JMapNotRequest
-from jmap.attrs.marshal import custom_marshal, snakecase, \
-    make_marshmallow_field_from_python_type, to_camel_case, Missing
+from jmap.attrs.marshal import custom_marshal, make_marshmallow_field_from_python_type, \
+    to_camel_case, Missing, get_dumper, get_projected_dumper, schema_context
+from jmap.attrs.utils import project
+from jmap.json import get_codec
 
 
 MAIL_URN = 'urn:ietf:params:jmap:mail'
@@ -65,7 +67,9 @@ def ModelPropertyWithHeader(model, with_headers=False, **kwargs):
     validation logic and a default.
     """
 
-    all_attrs = [a.name for a in fields(model)]
+    # Maps the attribute names to the JSON keys, and the reverse.
+    all_attrs = model.__json_keys__
+    all_keys = model.__attr_names__
 
     def valid_property(self, attribute, value):
         if value is marshmallow.missing:
@@ -73,7 +77,7 @@ def ModelPropertyWithHeader(model, with_headers=False, **kwargs):
 
         # This runs when instantiating a model, as well as on umarshal.
         for item in value:
-            if item in all_attrs:
+            if isinstance(item, str) and item in all_attrs:
                 continue
 
             if isinstance(item, HeaderFieldQuery) and with_headers:
@@ -88,7 +92,7 @@ def ModelPropertyWithHeader(model, with_headers=False, **kwargs):
                 else:
                     continue
 
-            raise ValueError(f'{self.__class__.__name__}.{attribute.name} was given "{item}", which is not an allowed value: {all_attrs}')
+            raise ValueError(f'{self.__class__.__name__}.{attribute.name} was given "{item}", which is not an allowed value: {list(all_attrs)}')
 
     def marshal(data, instance, field):
         """This manually serializes the property to `data`. It:
@@ -103,7 +107,8 @@ def ModelPropertyWithHeader(model, with_headers=False, **kwargs):
             if isinstance(item, HeaderFieldQuery) and with_headers:
                 result.append(str(item))
             else:
-                result.append(to_camel_case(item))
+                # An unknown name can only have been set without validation.
+                result.append(all_attrs.get(item) or to_camel_case(item))
 
         data[field.name] = result
         return data
@@ -127,8 +132,10 @@ def ModelPropertyWithHeader(model, with_headers=False, **kwargs):
         for item in data:
             if with_headers and HeaderFieldQuery.will_handle(item):
                 result.append(HeaderFieldQuery.unmarshal(item))
+            elif item in all_keys:
+                result.append(all_keys[item])
             else:
-                result.append(snakecase(item))
+                raise ValidationError(f'"{item}" is not an allowed value: {list(all_keys)}')
 
         return result, []
 
@@ -264,7 +271,9 @@ def unflatten_headers(data, field):
 def FlattenedHeaderQueries(**kwargs):
     return attrib(
         metadata={
-            'marshal': custom_marshal(marshal=flatten_headers, unmarshal=unflatten_headers)
+            'marshal': custom_marshal(marshal=flatten_headers, unmarshal=unflatten_headers),
+            # Requested via `HeaderFieldQuery` items in the /get `properties`.
+            'header_queries': True,
         }
     )
 
@@ -286,14 +295,14 @@ class MailboxRole(enum.Enum):
     Trash = 'trash'
 
 
-@model
+@model(compiled=True)
 class Comparator:
     property: str
     is_ascending: bool = True
     collation: str = ''
 
 
-@model
+@model(compiled=True)
 class MailboxRights:
     may_read_items: bool
     may_add_items: bool
@@ -306,7 +315,7 @@ class MailboxRights:
     may_submit: bool
 
 
-@model
+@model(compiled=True)
 class Mailbox:
     id: str = attrib(server_set=True)
     name: str
@@ -322,7 +331,7 @@ class Mailbox:
     is_subscribed: bool
 
 
-@model
+@model(compiled=True)
 class Thread:
     """
     3. Threads (https://jmap.io/spec-mail.html#threads)
@@ -364,22 +373,88 @@ class StandardGetArgs:
         return cls
 
 
+class RequestedProperties:
+    """
+    Gives a response a slot for the `properties` the client asked for. It is
+    not an attribute of the model, so it is not serialized itself.
+    """
+    __slots__ = ('requested_properties',)
+
+
 @model
-class StandardGetResponse:
+class StandardGetResponse(RequestedProperties):
     """
     "5.1 /get" (https://jmap.io/spec-core.html#/get)
+
+    When returned by a module, `requested_properties` is set to the
+    `properties` argument of the call, and only those properties of the
+    objects in `list` are serialized (see `jmap.modules.core.MethodHandler`).
     """
     account_id: str
     state: str
     not_found: List[str]
 
+    # See `jmap.json.iter_json`.
+    __streamed_attributes__ = ('list',)
+
     def __init_subclass__(cls, *, type):
         if not '__annotations__' in cls.__dict__:
             cls.__annotations__ = {}
 
         cls.__annotations__['list'] = List[type]
+        cls.object_type = type
         return cls
 
+    def to_client(self, *, context=None, properties=None):
+        """
+        Serialize the response. `properties` can be the `properties` argument of
+        the /get call, and defaults to `requested_properties`; then, only those
+        properties of the objects in `list` are serialized, and the others are
+        not even read. `HeaderFieldQuery` items select the attributes holding
+        the queried headers.
+        """
+        if properties is None:
+            properties = getattr(self, 'requested_properties', None)
+
+        dump = get_dumper(self.__class__, use_server_fields=True)
+        with schema_context(**(context or {})):
+            if properties is None:
+                return dump(self)
+
+            names = self.get_property_names(properties)
+            data = dump(project(self, [a.name for a in fields(self.__class__) if a.name != 'list']))
+            try:
+                objects = object.__getattribute__(self, 'list')
+            except AttributeError:
+                pass
+            else:
+                data['list'] = self.object_type.to_client_many(objects, properties=names)
+            return data
+
+    def get_property_names(self, properties):
+        """The attributes of `object_type` to serialize for `properties`."""
+        names = {'id'} if 'id' in self.object_type.__json_keys__ else set()
+        for item in properties:
+            if isinstance(item, HeaderFieldQuery):
+                names.update(
+                    a.name for a in fields(self.object_type) if a.metadata.get('header_queries'))
+            else:
+                names.add(item)
+        return names
+
+    def get_streamed_dumper(self, name):
+        """For `jmap.json.iter_json`: the function serializing the items of
+        `list`, one at a time, like `to_client` does. `None` if they are
+        serialized in full.
+        """
+        properties = getattr(self, 'requested_properties', None)
+        if name != 'list' or properties is None:
+            return None
+        dump = get_projected_dumper(
+            self.object_type, use_server_fields=True, properties=frozenset(self.get_property_names(properties)))
+        # Like `to_client_many`, pass through dicts as they are.
+        return lambda obj: obj if obj.__class__ is dict else dump(obj)
+
 
 @model
 class StandardQueryArgs:
@@ -502,7 +577,7 @@ class StandardSetResponse:
 ####### Mailbox/get
 
 
-@model
+@model(compiled=True)
 class MailboxGetArgs(StandardGetArgs, type=Mailbox, default_props=properties(Mailbox)):
     pass
 
@@ -512,7 +587,7 @@ class MailboxGetResponse(StandardGetResponse, type=Mailbox):
     pass
 
 
-@model
+@model(compiled=True)
 class MailboxChangesArgs(StandardChangesArgs):
     pass
 
@@ -526,7 +601,7 @@ class MailboxChangesResponse(StandardChangesResponse):
 ####### Mailbox/query
 
 
-@model
+@model(compiled=True)
 class MailboxQueryFilterCondition:
     """2.3 Filter Conditions (https://jmap.io/spec-mail.html#mailbox/query)."""
     parent_id: Optional[str] = Missing
@@ -536,7 +611,7 @@ class MailboxQueryFilterCondition:
     is_subscribed: Optional[bool] = None
 
 
-@model
+@model(compiled=True)
 class MailboxQueryArgs(StandardQueryArgs, filter=MailboxQueryFilterCondition):
     pass
 
@@ -549,7 +624,7 @@ class MailboxQueryResponse(StandardQueryResponse):
 ###### Mailbox/set
 
 
-@model
+@model(compiled=True)
 class MailboxSetArgs(StandardSetArgs, type=Mailbox):
     """
     "2.5 Mailbox/set" (https://jmap.io/spec-mail.html#mailbox/set)
@@ -568,26 +643,26 @@ class MailboxSetResponse(StandardSetResponse, type=Mailbox):
 ####### Email
 
 
-@model
+@model(compiled=True)
 class EmailAddress:
     name: Optional[str] = None
     email: str
 
 
-@model
+@model(compiled=True)
 class EmailHeader:
     name: str
     value: str
 
 
-@model
+@model(compiled=True)
 class EmailBodyValue:
     value: str
     is_encoding_problem: bool = False
     is_truncated = False
 
 
-@model
+@model(compiled=True)
 class EmailBodyPart:
     # 4.1.4 Body Parts
     part_id: Optional[str] = None
@@ -606,7 +681,7 @@ class EmailBodyPart:
     # TODO: header: {header - field - name} #:asForm:all
 
 
-@model
+@model(compiled=True)
 class Email:
     # https://jmap.io/spec-mail.html#properties-of-the-email-object
     # 4.1.1 Metadata
@@ -648,33 +723,30 @@ class Email:
     sent_at: Optional[datetime] = None
 
     # 4.1.4 Body Parts
-    body_structure: EmailBodyPart
-    body_values: Dict[str, EmailBodyValue]
-    text_body: List[EmailBodyPart]
-    html_body: List[EmailBodyPart]
-    attachments: List[EmailBodyPart]
-    has_attachment: bool
-    preview: str
+    #
+    # These are expensive to compute from the MIME message, so can be given as
+    # `Lazy` values, which are only computed if the client requested them.
+    body_structure: EmailBodyPart = attrib(lazy=True)
+    body_values: Dict[str, EmailBodyValue] = attrib(lazy=True)
+    text_body: List[EmailBodyPart] = attrib(lazy=True)
+    html_body: List[EmailBodyPart] = attrib(lazy=True)
+    attachments: List[EmailBodyPart] = attrib(lazy=True)
+    has_attachment: bool = attrib(lazy=True)
+    preview: str = attrib(lazy=True)
 
 
 ####### Email/get
 
 
-def safe(x):
-    if x == 'from':
-        return f'{x}_'
-    return x
-
-
-DEFAULT_EMAIL_GET_PROPERTIES = list(map(lambda x: safe(snakecase(x)), [
+DEFAULT_EMAIL_GET_PROPERTIES = [Email.__attr_names__[key] for key in [
     "id", "blobId", "threadId", "mailboxIds", "keywords", "size",
     "receivedAt", "messageId", "inReplyTo", "references", "sender", "from",
     "to", "cc", "bcc", "replyTo", "subject", "sentAt", "hasAttachment",
     "preview", "bodyValues", "textBody", "htmlBody", "attachments"
-]))
+]]
 
 
-@model
+@model(compiled=True)
 class EmailGetArgs(StandardGetArgs, type=Email, default_props=DEFAULT_EMAIL_GET_PROPERTIES, with_headers=True):
     body_properties: Optional[List[str]] = None
     fetch_text_body_values: bool = False
@@ -690,7 +762,7 @@ class EmailGetResponse(StandardGetResponse, type=Email):
 
 ###### Email/query
 
-@model
+@model(compiled=True)
 class EmailQueryFilterCondition:
     """4.4.1 Filtering (https://jmap.io/spec-mail.html#mailbox/query)."""
     in_mailbox: Optional[str] = None
@@ -700,7 +772,7 @@ class EmailQueryFilterCondition:
     max_size: Optional[int] = PositiveInt(default=None)
 
 
-@model
+@model(compiled=True)
 class EmailQueryArgs(StandardQueryArgs, filter=EmailQueryFilterCondition):
     """
     "4.4 /query" (https://jmap.io/spec-mail.html#email/query)
@@ -719,7 +791,7 @@ class EmailQueryResponse(StandardQueryResponse):
 ###### Email/set
 
 
-@model
+@model(compiled=True)
 class EmailSetArgs(StandardSetArgs, type=Email):
     """
     "4.6 Email/set" (https://jmap.io/spec-mail.html#email/set)
@@ -736,8 +808,8 @@ class EmailSetResponse(StandardSetResponse, type=Email):
 ###### Thread/get
 
 
-@model
-class ThreadGetArgs(StandardGetArgs, type=Thread, default_props=[]):
+@model(compiled=True)
+class ThreadGetArgs(StandardGetArgs, type=Thread, default_props=properties(Thread)):
     pass
 
 
@@ -749,7 +821,7 @@ class ThreadGetResponse(StandardGetResponse, type=Thread):
 ###### Thread/changes
 
 
-@model
+@model(compiled=True)
 class ThreadChangesArgs(StandardChangesArgs):
     pass
 
@@ -815,8 +887,14 @@ class JMapResponse:
             'methodResponses': self.method_responses
         }
 
+    def to_bytes(self, codec=None) -> bytes:
+        """The response encoded as JSON; by default with the fastest codec
+        available (see `jmap.json.get_codec`).
+        """
+        return (codec or get_codec()).dumps(self.to_json())
+
 
-@model
+@model(compiled=True)
 class ResultReference:
     result_of: str
     name: str
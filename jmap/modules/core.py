@@ -4,6 +4,7 @@ from typing import Any, Dict
 from marshmallow import ValidationError
 
 from jmap.models.errors import JMapError, JMapInvalidArguments
+from jmap.models.models import RequestedProperties
 
 
 class JmapModuleInterface:
@@ -25,17 +26,106 @@ class JmapModuleInterface:
         raise NotImplementedError()
 
 
+class MethodHandler:
+    """
+    A method of a module, ready to be called: `model` is the type the JMAP
+    method args are loaded into, or `Any`, in which case the args are passed
+    through as given.
+    """
+
+    __slots__ = ('handler', 'model', 'load')
+
+    def __init__(self, handler):
+        # Figure out the arguments to the method
+        spec = inspect.getfullargspec(handler)
+        if len(spec.args) != 3:
+            raise TypeError(f'The method {handler} is expected to have exactly two '
+                            f'arguments. The expected signature is (context, args).')
+
+        arg_name_for_methog_args = spec.args[2]
+        if not arg_name_for_methog_args in spec.annotations:
+            raise TypeError(f'The second argument to {handler} is expected to represent '
+                            f'the JMAP method args. It must be annotated with a '
+                            f'marshallable type.')
+
+        self.handler = handler
+        self.model = spec.annotations[arg_name_for_methog_args]
+        # We special case "Any". If this is the type, we just pass the
+        # input data through.
+        self.load = None if self.model is Any else self.model.from_client
+
+    def load_args(self, input):
+        if self.load is not None and isinstance(input, dict):
+            try:
+                return self.load(input)
+            except ValidationError as exc:
+                raise JMapInvalidArguments(str(exc))
+        return input
+
+    def __call__(self, input, *, context):
+        args = self.load_args(input)
+        result = self.handler(context, args)
+        if inspect.isawaitable(result):
+            return AwaitedResult(result, args)
+        return set_requested_properties(result, args)
+
+
+class AwaitedResult:
+    """
+    The result of an `async def` handler: awaiting this awaits the handler.
+    Unlike a coroutine wrapping it, `close()` closes the handler's coroutine
+    too, if it is never awaited.
+    """
+
+    __slots__ = ('result', 'args')
+
+    def __init__(self, result, args):
+        self.result = result
+        self.args = args
+
+    def __await__(self):
+        return set_requested_properties((yield from self.result.__await__()), self.args)
+
+    def close(self):
+        close = getattr(self.result, 'close', None)
+        if close is not None:
+            close()
+
+
+def set_requested_properties(result, args):
+    """Let the response of a /get call know which properties the client asked
+    for, so only those are serialized.
+    """
+    if isinstance(result, RequestedProperties):
+        properties = getattr(args, 'properties', None)
+        if properties is not None:
+            result.requested_properties = properties
+    return result
+
+
 class JmapBaseModule(JmapModuleInterface):
 
     """
     This defines a certain way of defining module subclasses. Helps with validating
     arguments, permission checks.
+
+    Subclasses assign the handlers to `self.methods`. They are inspected right then,
+    so a handler with the wrong signature fails when the module is created.
     """
 
     def __init__(self, *, auth_backend: Any = None):
         self.methods = {}
         self.auth_backend = auth_backend
 
+    @property
+    def methods(self):
+        return self._methods
+
+    @methods.setter
+    def methods(self, methods):
+        self._methods = methods
+        self.handlers = {name: MethodHandler(method) for name, method in methods.items()}
+
     def get_state_for(self, type: str):
         """
         Return the state for the given data type.
@@ -45,36 +135,30 @@ class JmapBaseModule(JmapModuleInterface):
     def get_methods(self):
         return set(self.methods.keys())
 
-    def execute(self, method_name, input: Dict, *, context=None):
+    def get_handler(self, method_name):
+        handler = self.handlers.get(method_name)
         method = self.methods[method_name]
+        # In case `self.methods` was changed in place.
+        if handler is None or handler.handler is not method:
+            handler = self.handlers[method_name] = MethodHandler(method)
+        return handler
 
-        # Figure out the arguments to the method
-        spec = inspect.getfullargspec(method)
-        if len(spec.args) != 3:
-            raise TypeError(f'The method {method} is expected to have exactly two '
-                            f'arguments. The expected signature is (context, args).')
+    def execute(self, method_name, input: Dict, *, context=None):
+        return self.get_handler(method_name)(input, context=context)
 
-        arg_name_for_methog_args = spec.args[2]
-        if not arg_name_for_methog_args in spec.annotations:
-            raise TypeError(f'The second argument to {method} is expected to represent '
-                            f'the JMAP method args. It must be annotated with a '
-                            f'marshallable type.')
-        type = spec.annotations[arg_name_for_methog_args]
 
-        # We special case "Any". If this is the type, we just pass the
-        # input data through.
-        if type is Any:
-            arg_object = input
-        else:
-            if isinstance(input, dict):
-                try:
-                    arg_object = type.from_client(input)
-                except ValidationError as exc:
-                    raise JMapInvalidArguments(str(exc))
-            else:
-                arg_object = input
+class AsyncJmapBaseModule(JmapBaseModule):
+
+    """
+    Like `JmapBaseModule`, but the handlers can be `async def` methods, and
+    `execute` is a coroutine. Use it with the `AsyncExecutor`.
+    """
 
-        return self.methods[method_name](context, arg_object)
+    async def execute(self, method_name, input: Dict, *, context=None):
+        result = self.get_handler(method_name)(input, context=context)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
 
 
 class CoreModule(JmapBaseModule):
@@ -84,18 +168,14 @@ class CoreModule(JmapBaseModule):
 
         self.methods = {
             'Core/echo': self.handle_echo,
-            'Blog/copy': self.handle_blob_copy,
             'getAccounts': self.handle_get_accounts,
         }
 
     def handle_echo(self, context, args: Any):
         return args
 
-    def handle_get_accounts(self, context, args):
+    def handle_get_accounts(self, context, args: Any):
         # No longer exists:
         # https://groups.google.com/forum/#!topic/jmap-discuss/9XKdZrp2mBE
         # https://github.com/linagora/jmap-client/commit/966c4e787f69c5def82273b8f677d28f264f9e0f
-        raise JMapError('Old method')
-
-    def handle_blob_copy(self, args):
-        pass
\ No newline at end of file
+        raise JMapError('Old method')
\ No newline at end of file
@@ -19,3 +19,18 @@ class AccountBackend:
     def can_read(self, context, objecttype, objectid):
         # Deny by default
         return False
+
+
+class SingleUser(AccountBackend):
+    """Every request is made by the same user, who has access to `accounts`,
+    and can read everything.
+    """
+
+    def __init__(self, accounts: Dict[str, Account]):
+        self.accounts = accounts
+
+    def get_accounts_for(self, context) -> Dict[str, Account]:
+        return self.accounts
+
+    def can_read(self, context, objecttype, objectid):
+        return True
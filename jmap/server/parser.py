@@ -0,0 +1,231 @@
+"""
+Parses the body posted to the JMAP API endpoint as it arrives.
+"""
+
+import json
+import re
+
+from jmap.json import get_codec
+from jmap.models.errors import JMapLimit, JMapNotJSON, JMapNotRequest
+from jmap.models.models import JMapRequest
+
+
+# Outside of strings, the characters which change the structure, and the
+# start of any other token (numbers, true, false, null).
+TOKEN = re.compile(rb'[\[\]{}",:]|[^\s\[\]{}",:]+')
+# Within a string, the characters we need to look at.
+STRING_SPECIAL = re.compile(rb'["\\]')
+
+
+class Container:
+    """An array or object the scanner is currently in."""
+
+    __slots__ = ('is_object', 'role', 'count', 'key', 'in_value', 'expecting')
+
+    def __init__(self, is_object, role):
+        self.is_object = is_object
+        # What this container is in the request, if it matters to us:
+        # "request", "calls", "call", "args" or "objects".
+        self.role = role
+        # The number of items/members so far
+        self.count = 0
+        # For objects, the current key, if we need to know it.
+        self.key = None
+        # For objects, whether we are past the ":" of a member.
+        self.in_value = False
+        # For arrays, whether a new item may start.
+        self.expecting = True
+
+
+class RequestParser:
+    """A sans-IO parser for JMAP requests: `feed()` it the body of the HTTP
+    request as it arrives, then `close()` it to get the `JMapRequest`:
+
+        parser = RequestParser()
+        for chunk in body:
+            parser.feed(chunk)
+        request = parser.close()
+
+    Both raise a `JMapRequestError` if the request is not valid. The limits
+    are checked while the body comes in, so a request which is too large is
+    rejected as soon as possible, without it being in memory completely:
+
+    - The size of the body (`maxSizeRequest`).
+    - The number of method calls (`maxCallsInRequest`).
+    - The number of ids given to a /get call (`maxObjectsInGet`), and the number
+      of objects to create, update and destroy in a /set call (`maxObjectsInSet`).
+
+    The defaults are the minimums suggested by the spec. The body is only
+    scanned for the structure of the request here; it is still decoded by
+    `codec` (see `jmap.json.get_codec`) at the end.
+    """
+
+    def __init__(self, *, max_size_request=10_000_000, max_calls_in_request=16,
+                 max_objects_in_get=500, max_objects_in_set=500, codec=None):
+        self.codec = codec or get_codec()
+        self.max_size_request = max_size_request
+        self.max_calls_in_request = max_calls_in_request
+        self.max_objects_in_get = max_objects_in_get
+        self.max_objects_in_set = max_objects_in_set
+
+        self.buffer = bytearray()
+        self.pos = 0
+        self.stack = []
+        self.string_start = None
+
+        # For the method call we are in
+        self.method_name = None
+        self.objects_in_call = 0
+
+    def feed(self, data: bytes):
+        if len(self.buffer) + len(data) > self.max_size_request:
+            raise JMapLimit('maxSizeRequest', f'The request is larger than {self.max_size_request} bytes')
+        self.buffer += data
+        self.scan()
+
+    def close(self) -> JMapRequest:
+        try:
+            data = self.codec.loads(bytes(self.buffer))
+        except (ValueError, RecursionError):
+            raise JMapNotJSON('The request did not parse as JSON')
+        finally:
+            self.buffer = bytearray()
+
+        try:
+            return JMapRequest.from_json(data)
+        except (ValueError, TypeError):
+            raise JMapNotRequest('This was not a valid request structure')
+
+    def scan(self):
+        """Scan what we got so far. If a token is incomplete, stop before it,
+        and continue there once there is more data.
+        """
+        buffer = self.buffer
+        end = len(buffer)
+
+        while True:
+            if self.string_start is not None:
+                match = STRING_SPECIAL.search(buffer, self.pos)
+                if match is None:
+                    self.pos = end
+                    return
+                if match.group() == b'\\':
+                    if match.end() == end:
+                        # We need to see the escaped character
+                        self.pos = match.start()
+                        return
+                    self.pos = match.end() + 1
+                    continue
+                self.pos = match.end()
+                start, self.string_start = self.string_start, None
+                self.on_string(start)
+                continue
+
+            match = TOKEN.search(buffer, self.pos)
+            if match is None:
+                self.pos = end
+                return
+            token = match.group()
+            if match.end() == end and token[:1] not in b'[]{}",:':
+                # A number or a literal may be continued in the next chunk
+                self.pos = match.start()
+                return
+            self.pos = match.end()
+
+            if token == b'"':
+                self.string_start = match.start()
+            elif token == b'[' or token == b'{':
+                self.on_container(token == b'{')
+            elif token == b']' or token == b'}':
+                if self.stack:
+                    self.stack.pop()
+            elif token == b',':
+                if self.stack:
+                    top = self.stack[-1]
+                    top.in_value = False
+                    top.expecting = True
+            elif token == b':':
+                if self.stack:
+                    self.stack[-1].in_value = True
+            else:
+                self.on_value()
+
+    def on_value(self):
+        """A value starts. Returns the container it is in, and whether it
+        is a key of that container, or `(None, False)` at the top level.
+        """
+        if not self.stack:
+            return None, False
+
+        top = self.stack[-1]
+        if top.is_object:
+            if top.in_value:
+                return top, False
+            is_key = True
+        else:
+            if not top.expecting:
+                return top, False
+            top.expecting = False
+            is_key = False
+
+        top.count += 1
+        if top.role == 'calls':
+            if top.count > self.max_calls_in_request:
+                raise JMapLimit(
+                    'maxCallsInRequest', f'The request has more than {self.max_calls_in_request} method calls')
+        elif top.role == 'objects':
+            self.objects_in_call += 1
+            if self.method_name.endswith('/get'):
+                if self.objects_in_call > self.max_objects_in_get:
+                    raise JMapLimit(
+                        'maxObjectsInGet', f'{self.method_name} has more than {self.max_objects_in_get} ids')
+            elif self.objects_in_call > self.max_objects_in_set:
+                raise JMapLimit(
+                    'maxObjectsInSet', f'{self.method_name} has more than {self.max_objects_in_set} objects')
+        return top, is_key
+
+    def on_string(self, start):
+        parent, is_key = self.on_value()
+        if parent is None:
+            return
+
+        if is_key:
+            if parent.role in ('request', 'args'):
+                parent.key = self.decode(start)
+        elif parent.role == 'call' and parent.count == 1:
+            name = self.decode(start)
+            self.method_name = name if isinstance(name, str) else ''
+
+    def on_container(self, is_object):
+        parent, _ = self.on_value()
+
+        role = None
+        if parent is None:
+            role = 'request' if is_object else 'calls'
+        elif parent.role == 'request':
+            if parent.key == 'methodCalls' and not is_object:
+                role = 'calls'
+        elif parent.role == 'calls':
+            if not is_object:
+                role = 'call'
+                self.method_name = ''
+                self.objects_in_call = 0
+        elif parent.role == 'call':
+            if parent.count == 2 and is_object:
+                role = 'args'
+        elif parent.role == 'args':
+            if self.method_name.endswith('/get'):
+                if parent.key == 'ids' and not is_object:
+                    role = 'objects'
+            elif self.method_name.endswith('/set'):
+                if parent.key in ('create', 'update') and is_object or \
+                        parent.key == 'destroy' and not is_object:
+                    role = 'objects'
+
+        self.stack.append(Container(is_object, role))
+
+    def decode(self, start):
+        try:
+            return json.loads(self.buffer[start:self.pos])
+        except ValueError:
+            raise JMapNotJSON('The request did not parse as JSON')
@@ -1,17 +1,38 @@
-from typing import Dict
+from typing import Dict, Iterator, Iterable, AsyncIterable
 from jmap.models.errors import JMapRequestError, JMapError
-from jmap.executor import Executor
+from jmap.executor import Executor, AsyncExecutor
+from jmap.json import iter_json, get_codec
 from jmap.models.models import JMapRequest
+from jmap.server.parser import RequestParser
 
 
 SESSION_URL_PATH = '/.well-known/jmap'
 
 
 class Server:
-    def __init__(self, *, modules, api_url, auth_backend):
+    def __init__(self, *, modules, api_url, auth_backend, pool=None, codec=None):
+        """`pool` is passed to the `Executor`, to run method calls concurrently.
+
+        `codec` encodes and decodes JSON; by default, the fastest one available
+        (see `jmap.json.get_codec`).
+        """
+        self.codec = codec or get_codec()
         self.modules = modules
         self.api_url = api_url
         self.auth_backend = auth_backend
+        self.executor = self.make_executor(pool=pool)
+
+    def make_executor(self, *, pool):
+        return Executor(modules=self.modules, pool=pool)
+
+    def make_request_parser(self):
+        """Override to change the request limits, see `RequestParser`."""
+        return RequestParser(codec=self.codec)
+
+    def modules_changed(self):
+        """Call this if `self.modules`, or the methods they provide, were changed.
+        """
+        self.executor.invalidate()
 
     def get_session_response(self, context):
         accounts = self.auth_backend.get_accounts_for(context)
@@ -43,11 +64,79 @@ class Server:
         except JMapRequestError as exc:
             return exc.to_json()
 
-        executor = Executor(modules=self.modules)
+        return self.handle_request(jmap_request, context=context)
+
+    def handle_request_from_stream(self, chunks: Iterable[bytes], *, context) -> Dict:
+        """Like `handle_request_from_json`, but give it the body of the HTTP
+        request, in chunks. It is parsed as it arrives, and rejected as soon as
+        it exceeds one of the limits (see `RequestParser`).
+        """
+        parser = self.make_request_parser()
+        try:
+            for chunk in chunks:
+                parser.feed(chunk)
+            jmap_request = parser.close()
+        except JMapRequestError as exc:
+            return exc.to_json()
+
+        return self.handle_request(jmap_request, context=context)
+
+    def handle_request(self, jmap_request: JMapRequest, *, context) -> Dict:
+        try:
+            jmap_response = self.executor.execute(jmap_request, context=context)
+        except JMapError as exc:
+            return exc.to_json()
+
+        return jmap_response.to_json()
+
+    def stream_request_from_json(self, request_json: Dict, *, context) -> Iterator[bytes]:
+        """Like `handle_request_from_json`, but returns the response as an
+        iterator of encoded JSON chunks (see `jmap.json.iter_json`), which
+        can be used as a streaming response body.
+        """
+        return iter_json(self.handle_request_from_json(request_json, context=context), codec=self.codec)
+
+
+class AsyncServer(Server):
+    """A `Server` for asyncio: `handle_request_from_json` is a coroutine, and
+    the modules can be async (see `AsyncExecutor`).
+    """
+
+    def __init__(self, *, modules, api_url, auth_backend, codec=None):
+        super().__init__(modules=modules, api_url=api_url, auth_backend=auth_backend, codec=codec)
+
+    def make_executor(self, *, pool):
+        return AsyncExecutor(modules=self.modules)
+
+    async def handle_request_from_json(self, request_json: Dict, *, context) -> Dict:
+        """Give a JMAP request structure, such as would be posted to the JMAP
+        API endpoint.
+        """
+        try:
+            jmap_request = JMapRequest.from_json(request_json)
+        except JMapRequestError as exc:
+            return exc.to_json()
+
+        return await self.handle_request(jmap_request, context=context)
 
+    async def handle_request_from_stream(self, chunks: AsyncIterable[bytes], *, context) -> Dict:
+        parser = self.make_request_parser()
         try:
-            jmap_response = executor.execute(jmap_request, context=context)
+            async for chunk in chunks:
+                parser.feed(chunk)
+            jmap_request = parser.close()
+        except JMapRequestError as exc:
+            return exc.to_json()
+
+        return await self.handle_request(jmap_request, context=context)
+
+    async def handle_request(self, jmap_request: JMapRequest, *, context) -> Dict:
+        try:
+            jmap_response = await self.executor.execute(jmap_request, context=context)
         except JMapError as exc:
             return exc.to_json()
 
-        return jmap_response.to_json()
\ No newline at end of file
+        return jmap_response.to_json()
+
+    async def stream_request_from_json(self, request_json: Dict, *, context) -> Iterator[bytes]:
+        return iter_json(await self.handle_request_from_json(request_json, context=context), codec=self.codec)
@@ -6,7 +6,7 @@ setup(
     name='jmap-python',
     packages=find_packages(),
     install_requires=[
-      'marshmallow>=3.0.0b19'
+      'marshmallow>=3.0.0rc3'
     ],
     version='0.1.0',
     description='JMAP library for Python',
@@ -17,3 +17,16 @@ def test_email():
         Module().execute('Mailbox/get', {})
 
     Module(auth_backend=SingleUser(accounts={})).execute('Mailbox/get', {'accountId': 'test'})
+
+
+def test_invalid_signature():
+    """
+    A handler with the wrong signature fails when the module is created.
+    """
+
+    class Module(EmailModule):
+        def handle_mailbox_get(self, context, args):
+            return {}
+
+    with pytest.raises(TypeError):
+        Module()
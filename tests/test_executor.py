@@ -0,0 +1,246 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, List, Optional
+
+import pytest
+
+from jmap.attrs import model, attrib, Lazy
+from jmap.attrs.marshal import custom_marshal, Missing
+from jmap.executor import Executor, AsyncExecutor, resolve_reference
+from jmap.models.errors import JMapInvalidArguments, JMapInvalidResultReference
+from jmap.models.models import JMapRequest, ResultReference, StandardGetResponse
+from jmap.modules.core import CoreModule, JmapBaseModule, AsyncJmapBaseModule
+from jmap.server.sansio import Server, AsyncServer
+
+
+class EchoModule(JmapBaseModule):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.methods = {'Test/echo': self.handle_echo}
+
+    def handle_echo(self, context, args: Any):
+        return args
+
+
+def test_execute():
+    executor = Executor(modules=[CoreModule()])
+    request = JMapRequest.from_json([['Core/echo', {'a': 1}, 'c1']])
+    assert executor.execute(request, context=None).to_json() == {
+        'methodResponses': [['Core/echo', {'a': 1}, 'c1']]
+    }
+
+
+def test_server_reuses_executor():
+    server = Server(modules=[CoreModule()], api_url='/api', auth_backend=None)
+    executor = server.executor
+
+    server.modules.append(EchoModule())
+    assert 'Test/echo' not in executor.available_methods
+
+    server.modules_changed()
+    assert server.executor is executor
+    request = [['Test/echo', {}, 'c1']]
+    assert server.handle_request_from_json(request, context=None) == {
+        'methodResponses': [['Test/echo', {}, 'c1']]
+    }
+
+
+@model
+class IdsResponse:
+    ids: Optional[List[str]] = None
+
+
+def flatten_tags(data, instance, field):
+    for tag in getattr(instance, field.name, None) or []:
+        data[f'tag:{tag}'] = True
+    return data
+
+
+@model
+class Item:
+    id: str
+    thread_id: Optional[str] = None
+    received_at: Optional[datetime] = None
+    tags: List[str] = attrib(default=None, metadata={
+        'marshal': custom_marshal(flatten_tags, lambda data, field: (Missing, []))})
+
+
+@model
+class ItemsResponse:
+    list: List[Item]
+    not_found: Optional[List[str]] = None
+
+
+def resolve(response, path):
+    ref = ResultReference(result_of='c', name='Foo/get', path=path)
+    try:
+        return resolve_reference(ref, {'c': {'Foo/get': response}})
+    except JMapInvalidResultReference:
+        return JMapInvalidResultReference
+
+
+@pytest.mark.parametrize('path', [
+    '/list', '/list/*/threadId', '/list/*/receivedAt', '/list/0/receivedAt', '/list/0/tag:a',
+    '/list/1', '/list/1/tag:a', '/list/0/unknown', '/notFound',
+])
+def test_resolve_reference(path):
+    """
+    Walking the models gives the same result as walking the serialized response.
+    """
+    response = ItemsResponse(list=[
+        Item(id='1', thread_id='t1', received_at=datetime(2018, 1, 2, tzinfo=timezone.utc), tags=['a']),
+        Item(id='2', thread_id='t2'),
+    ])
+    assert resolve(response, path) == resolve(response.to_client(), path)
+
+
+@model
+class ItemGetResponse(StandardGetResponse, type=Item):
+    pass
+
+
+@pytest.mark.parametrize('path', [
+    '/list', '/list/*/id', '/list/*/threadId', '/list/0/receivedAt', '/list/0/tag:a', '/notFound',
+])
+def test_resolve_reference_requested_properties(path):
+    """
+    Only the properties the client asked for can be referenced.
+    """
+    response = ItemGetResponse(account_id='a', state='1', not_found=[], list=[
+        Item(id='1', thread_id='t1', received_at=datetime(2018, 1, 2, tzinfo=timezone.utc), tags=['a']),
+    ])
+    response.requested_properties = ['thread_id']
+    assert resolve(response, path) == resolve(response.to_client(), path)
+    if path in ('/list/0/receivedAt', '/list/0/tag:a'):
+        assert resolve(response, path) is JMapInvalidResultReference
+
+
+@model
+class LazyItem:
+    id: str
+    preview: Optional[str] = attrib(default=None, lazy=True)
+    body: Optional[Item] = attrib(default=None, lazy=True)
+
+
+@model
+class LazyItemsResponse:
+    list: List[LazyItem]
+
+
+@pytest.mark.parametrize('path', ['/list/*/preview', '/list/0/preview', '/list/0/body', '/list/*/body/threadId'])
+def test_resolve_reference_lazy(path):
+    """
+    A reference through a lazy attribute gives its computed value.
+    """
+    def make_response():
+        return LazyItemsResponse(list=[
+            LazyItem(id='1', preview=Lazy(lambda: 'Hello'), body=Lazy(lambda: Item(id='b1', thread_id='t1'))),
+        ])
+    assert resolve(make_response(), path) == resolve(make_response().to_client(), path)
+
+
+class SlowModule(JmapBaseModule):
+    """The /get calls wait until two of them run at the same time."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.barrier = threading.Barrier(2, timeout=5)
+        self.calls = []
+        self.methods = {
+            'Foo/get': self.handle_get,
+            'Bar/get': self.handle_get,
+            'Foo/set': self.handle_set,
+            'Foo/query': self.handle_query,
+        }
+
+    def handle_get(self, context, args: Any):
+        self.barrier.wait()
+        self.calls.append(args)
+        return IdsResponse(ids=args.get('ids'))
+
+    def handle_set(self, context, args: Any):
+        self.calls.append('set')
+        return {}
+
+    def handle_query(self, context, args: Any):
+        raise JMapInvalidArguments('nope')
+
+
+@pytest.mark.parametrize('pool', [None, ThreadPoolExecutor(4)])
+def test_execute_concurrently(pool):
+    module = SlowModule()
+    executor = Executor(modules=[module], pool=pool)
+    if pool is None:
+        module.barrier = threading.Barrier(1)
+
+    request = JMapRequest.from_json([
+        ['Foo/query', {}, 'q'],
+        ['Foo/get', {'ids': ['1']}, 'a'],
+        ['Bar/get', {'ids': ['2']}, 'b'],
+        ['Foo/set', {}, 's'],
+        ['Foo/get', {'#ids': {'resultOf': 'a', 'name': 'Foo/get', 'path': '/ids'}}, 'c'],
+        ['Bar/get', {'#ids': {'resultOf': 'q', 'name': 'Foo/query', 'path': '/ids'}}, 'd'],
+        ['Bar/get', {'ids': ['3']}, 'e'],
+    ])
+    response = executor.execute(request, context=None).to_json()
+    response['methodResponses'] = [
+        [name, data.to_client() if isinstance(data, IdsResponse) else data, client_id]
+        for name, data, client_id in response['methodResponses']
+    ]
+    assert response == {'methodResponses': [
+        ['error', {'type': 'invalidArguments', 'description': 'nope'}, 'q'],
+        ['Foo/get', {'ids': ['1']}, 'a'],
+        ['Bar/get', {'ids': ['2']}, 'b'],
+        ['Foo/set', {}, 's'],
+        ['Foo/get', {'ids': ['1']}, 'c'],
+        ['error', {'type': 'invalidResultReference',
+                   'description': 'Previous method call with id "q" has no response named "Foo/query", '
+                                  'possible names are: error'}, 'd'],
+        ['Bar/get', {'ids': ['3']}, 'e'],
+    ]}
+    # The set runs after all calls before it, and before all calls after it.
+    assert module.calls.index('set') == 2
+
+
+def test_async_server():
+    class AsyncModule(AsyncJmapBaseModule):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.methods = {'Foo/get': self.handle_get, 'Foo/query': self.handle_query}
+
+        async def handle_query(self, context, args: Any):
+            await asyncio.sleep(0)
+            return IdsResponse(ids=['1', '2'])
+
+        def handle_get(self, context, args: Any):
+            return args
+
+    server = AsyncServer(modules=[AsyncModule(), CoreModule()], api_url='/api', auth_backend=None)
+    response = asyncio.run(server.handle_request_from_json([
+        ['Foo/query', {}, 'a'],
+        ['Foo/get', {'#ids': {'resultOf': 'a', 'name': 'Foo/query', 'path': '/ids'}}, 'b'],
+        ['Core/echo', {'x': 1}, 'c'],
+    ], context=None))
+    assert response['methodResponses'][1:] == [
+        ['Foo/get', {'ids': ['1', '2']}, 'b'],
+        ['Core/echo', {'x': 1}, 'c'],
+    ]
+
+
+def test_async_handler_needs_async_executor():
+    class AsyncModule(JmapBaseModule):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.methods = {'Foo/query': self.handle_query}
+
+        async def handle_query(self, context, args: Any):
+            return IdsResponse(ids=['1'])
+
+    request = JMapRequest.from_json([['Foo/query', {}, 'a']])
+    with pytest.raises(TypeError, match='AsyncExecutor'):
+        Executor(modules=[AsyncModule()]).execute(request, context=None)
+    response = asyncio.run(AsyncExecutor(modules=[AsyncModule()]).execute(request, context=None))
+    assert response.method_responses[0][1].ids == ['1']
@@ -0,0 +1,129 @@
+import json
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from jmap.attrs import Lazy, attrs
+from jmap.json import JmapJSONEncoder, iter_json, get_codec, CODECS
+from jmap.models.models import JMapResponse, Thread, ThreadGetResponse, Email, EmailGetArgs, EmailGetResponse
+from jmap.server.sansio import Server
+from jmap.modules.core import CoreModule
+from jmap.modules.mail import EmailModule
+
+
+def make_response(count):
+    threads = ThreadGetResponse(
+        account_id='a1', state='1', not_found=[],
+        list=[Thread(id=str(i), email_ids=[f'e{i}', 'ö']) for i in range(count)])
+    return JMapResponse(method_responses=[
+        ['Thread/get', threads, 'c1'],
+        ['Thread/get', ThreadGetResponse.Properties(account_id='a1', not_found=['x']), 'c2'],
+        ['Core/echo', {1: None, 'x': (True, 1.5)}, 'c3'],
+    ]).to_json()
+
+
+AVAILABLE_CODECS = [codec.name for codec in CODECS if codec.is_available()]
+
+
+@pytest.mark.parametrize('codec', AVAILABLE_CODECS)
+def test_codec(codec):
+    codec = get_codec(codec)
+    response = make_response(3)
+    response['methodResponses'].append(['Foo/get', {
+        'date': datetime(2018, 1, 2, 3, 4, 5, 6, tzinfo=timezone(timedelta(hours=2))),
+        'text': 'ö"\\',
+    }, 'c4'])
+
+    data = codec.dumps(response)
+    assert isinstance(data, bytes)
+    assert codec.loads(data) == json.loads(json.dumps(response, cls=JmapJSONEncoder))
+    assert codec.loads(data)['methodResponses'][3][1]['date'] == '2018-01-02T01:04:05Z'
+
+
+@pytest.mark.parametrize('codec', AVAILABLE_CODECS)
+def test_codec_plain_attrs_class(codec):
+    """
+    A class which is not a model is serialized with `attrs.asdict`; anything
+    unknown is a `TypeError`, whatever the codec.
+    """
+    @attrs.attrs
+    class Point:
+        x = attrs.attrib()
+        y = attrs.attrib()
+
+    codec = get_codec(codec)
+    assert codec.loads(codec.dumps({'p': Point(1, 2)})) == {'p': {'x': 1, 'y': 2}}
+    with pytest.raises(TypeError):
+        codec.dumps({'p': object()})
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        get_codec('yaml')
+
+
+@pytest.mark.parametrize('codec', AVAILABLE_CODECS)
+@pytest.mark.parametrize('chunk_size', [1, 1024])
+def test_iter_json(chunk_size, codec):
+    response = make_response(100)
+    chunks = list(iter_json(response, chunk_size=chunk_size, codec=get_codec(codec)))
+    assert all(isinstance(chunk, bytes) for chunk in chunks)
+    if chunk_size > 1:
+        assert 1 < len(chunks) < 10
+
+    expected = json.loads(json.dumps(response, cls=JmapJSONEncoder))
+    assert json.loads(b''.join(chunks)) == expected
+    assert expected['methodResponses'][0][1]['list'][1] == {'id': '1', 'emailIds': ['e1', 'ö']}
+
+
+@pytest.mark.parametrize('codec', AVAILABLE_CODECS)
+def test_iter_json_same_as_dumps(codec):
+    codec = get_codec(codec)
+    response = make_response(250)
+    assert codec.loads(b''.join(iter_json(response, codec=codec))) == codec.loads(codec.dumps(response))
+
+
+def test_stream_request_from_json():
+    server = Server(modules=[CoreModule()], api_url='/api', auth_backend=None)
+    request = [['Core/echo', {'a': 1}, 'c1']]
+    assert json.loads(b''.join(server.stream_request_from_json(request, context=None))) == {
+        'methodResponses': [['Core/echo', {'a': 1}, 'c1']]
+    }
+
+
+def test_get_properties_end_to_end():
+    """
+    A /get response only serializes the properties requested, buffered or
+    streamed; properties which are not requested are not even computed.
+    """
+    computed = []
+
+    def preview():
+        computed.append('preview')
+        return 'Hello'
+
+    class Module(EmailModule):
+        def handle_email_get(self, context, args: EmailGetArgs):
+            return EmailGetResponse(account_id=args.account_id, state='1', not_found=[], list=[
+                Email.Properties(id='e1', thread_id='t1', subject='Hi', preview=Lazy(preview)),
+            ])
+
+    server = Server(modules=[Module()], api_url='/api', auth_backend=None)
+    request = [['Email/get', {'accountId': 'a', 'properties': ['threadId', 'subject']}, 'c1']]
+
+    expected = {'methodResponses': [['Email/get', {
+        'accountId': 'a', 'state': '1', 'notFound': [],
+        'list': [{'id': 'e1', 'threadId': 't1', 'subject': 'Hi'}],
+    }, 'c1']]}
+    codec = get_codec()
+    assert codec.loads(codec.dumps(server.handle_request_from_json(request, context=None))) == expected
+    assert json.loads(b''.join(server.stream_request_from_json(request, context=None))) == expected
+    assert computed == []
+
+    request = [['Email/get', {'accountId': 'a', 'properties': ['preview']}, 'c1']]
+    assert json.loads(b''.join(server.stream_request_from_json(request, context=None))) == {
+        'methodResponses': [['Email/get', {
+            'accountId': 'a', 'state': '1', 'notFound': [], 'list': [{'id': 'e1', 'preview': 'Hello'}],
+        }, 'c1']]
+    }
+    assert computed == ['preview']
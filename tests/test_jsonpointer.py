@@ -1,4 +1,6 @@
-from jmap.jsonpointer import resolve_pointer
+import pytest
+
+from jmap.jsonpointer import resolve_pointer, compile_pointer, JsonPointerException
 
 
 def test_wildcard_to_int():
@@ -20,4 +22,44 @@ def test_wildcard_to_array():
         ]
     }, '/foo/*/id')
 
-    assert result == [1, 2, 12]
\ No newline at end of file
+    assert result == [1, 2, 12]
+
+
+def test_pointer_is_cached():
+    assert compile_pointer('/list/*/threadId') is compile_pointer('/list/*/threadId')
+
+
+class Indexable:
+    def __getitem__(self, key):
+        if key == 'x':
+            return {'y': [1]}
+        raise KeyError(key)
+
+
+DOC = {'a': [{'b': 1}, {'b': [2, 3]}], 'c': Indexable(), '*': 4}
+
+
+@pytest.mark.parametrize('pointer, expected', [
+    ('/a/1/b/0', 2),
+    ('/a/01/b', [2, 3]),
+    ('/a/*/b', [1, 2, 3]),
+    ('/*', 4),
+    ('/c/x/y/0', 1),
+    ('/a/2', None),
+    ('/a/b', None),
+    ('/a/-1', None),
+    ('/d', None),
+    ('/c/z', None),
+    ('/a/0/b/0', None),
+])
+def test_resolve(pointer, expected):
+    assert resolve_pointer(DOC, pointer, None) == expected
+    if expected is None:
+        with pytest.raises(JsonPointerException):
+            resolve_pointer(DOC, pointer)
+
+
+def test_invalid_pointer():
+    assert resolve_pointer(DOC, '') is DOC
+    with pytest.raises(JsonPointerException):
+        resolve_pointer(DOC, 'a')
@@ -0,0 +1,216 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from archive import maildir as maildir_module
+from archive.maildir import MailboxEmailModule
+from archive.maildirindex import MaildirIndex, make_id, SUBDIRS
+from jmap.server.sansio import Server
+
+
+def make_old(path):
+    """Set the modification time of `path` back far enough for it to be trusted."""
+    mtime = time.time_ns() - 60 * 10 ** 9
+    os.utime(path, ns=(mtime, mtime))
+
+
+def make_maildir(root, folders):
+    for name, files in folders.items():
+        path = os.path.join(root, f'.{name}' if name else '')
+        for subdir in ('new', 'cur', 'tmp'):
+            os.makedirs(os.path.join(path, subdir), exist_ok=True)
+        for subdir, filename in files:
+            with open(os.path.join(path, subdir, filename), 'wb') as file:
+                file.write(f'Subject: {filename}\n\nbody\n'.encode('utf-8'))
+        for subdir in SUBDIRS:
+            make_old(os.path.join(path, subdir))
+
+
+@pytest.fixture
+def maildir(tmp_path):
+    root = str(tmp_path / 'Maildir')
+    make_maildir(root, {
+        '': [('new', '1.a.host'), ('cur', '2.b.host:2,S'), ('cur', '3.c.host:2,FS')],
+        'Sent': [('cur', '4.d.host:2,S')],
+        'Lists.python': [('new', '5.e.host')],
+    })
+    return root
+
+
+def rename(root, old, new):
+    os.rename(os.path.join(root, old), os.path.join(root, new))
+    for path in (os.path.dirname(old), os.path.dirname(new)):
+        make_old(os.path.join(root, path))
+
+
+def test_index(maildir):
+    index = MaildirIndex(maildir)
+    assert index.update() is True
+    assert index.update() is False
+    assert index.state == 1
+
+    inbox = index.folders[make_id('')]
+    assert inbox.role == 'inbox' and inbox.unread == 1
+    assert {message.filename: message.keywords for message in inbox.messages.values()} == {
+        '1.a.host': {}, '2.b.host:2,S': {'$seen': True}, '3.c.host:2,FS': {'$flagged': True, '$seen': True},
+    }
+    python = index.folders[make_id('Lists.python')]
+    assert (python.display_name, python.parent_id, python.role) == ('python', make_id('Lists'), None)
+    assert index.folders[make_id('Sent')].role == 'sent'
+
+    uids = {message.filename.split(':')[0]: message.uid for message in inbox.messages.values()}
+
+    # The message is read, and so moved to cur/; it keeps its uid.
+    rename(maildir, 'new/1.a.host', 'cur/1.a.host:2,S')
+    assert index.update() is True
+    assert index.state == 2
+    message = inbox.messages['1.a.host']
+    assert (message.uid, message.subdir, message.flags) == (uids['1.a.host'], 'cur', 'S')
+    assert inbox.unread == 0
+
+    # Only the folder which changed is listed again.
+    os.rename(os.path.join(maildir, '.Sent', 'cur'), os.path.join(maildir, '.Sent', 'cur-moved'))
+    os.makedirs(os.path.join(maildir, '.Sent', 'cur'))
+    os.utime(os.path.join(maildir, '.Sent', 'cur'), ns=(0, index.folders[make_id('Sent')].mtimes['cur']))
+    assert index.update() is False
+    assert len(index.folders[make_id('Sent')].messages) == 1
+
+    # A new index starts with the cache
+    other = MaildirIndex(maildir)
+    assert other.state == 2
+    assert other.update() is False
+    assert other.folders[make_id('')].messages == inbox.messages
+
+
+def test_module(maildir):
+    module = MailboxEmailModule(maildir)
+    server = Server(modules=[module], api_url='/api', auth_backend=None)
+    inbox = make_id('')
+    response = server.handle_request_from_json([
+        ['Mailbox/get', {'accountId': 'a', 'ids': [inbox, 'unknown']}, 'm'],
+        ['Email/query', {'accountId': 'a', 'filter': {'inMailbox': inbox}, 'position': 1}, 'q'],
+        ['Email/get', {'accountId': 'a', '#ids': {'resultOf': 'q', 'name': 'Email/query', 'path': '/ids'},
+                       'properties': ['id', 'keywords', 'mailboxIds']}, 'g'],
+    ], context=None)['methodResponses']
+
+    mailbox, = response[0][1].list
+    assert response[0][1].not_found == ['unknown']
+    assert (mailbox.name, mailbox.role, mailbox.total_emails, mailbox.unread_emails) == ('Inbox', 'inbox', 3, 1)
+
+    assert response[1][1].total == 3
+    assert response[1][1].ids == [f'{inbox}-2', f'{inbox}-3']
+    assert [(email['id'], email['keywords'], email['mailboxIds']) for email in response[2][1].list] == [
+        (f'{inbox}-2', {'$seen': True}, {inbox: True}),
+        (f'{inbox}-3', {'$flagged': True, '$seen': True}, {inbox: True}),
+    ]
+
+
+def test_module_email_get_properties(maildir, monkeypatch):
+    module = MailboxEmailModule(maildir)
+    server = Server(modules=[module], api_url='/api', auth_backend=None)
+    inbox = make_id('')
+
+    parsed = []
+    original_parse_message = maildir_module.parse_message
+
+    def is_locked():
+        if not module.index.lock.acquire(blocking=False):
+            return True
+        module.index.lock.release()
+        return False
+
+    def parse_message(data):
+        # The index is not locked while the messages are read
+        with ThreadPoolExecutor(1) as other:
+            assert other.submit(is_locked).result() is False
+        parsed.append(data)
+        return original_parse_message(data)
+
+    monkeypatch.setattr('archive.maildir.parse_message', parse_message)
+
+    def get(properties):
+        del parsed[:]
+        response = server.handle_request_from_json([
+            ['Email/get', {'accountId': 'a', 'ids': [f'{inbox}-1'], 'properties': properties}, 'g'],
+        ], context=None)['methodResponses']
+        email, = response[0][1].list
+        return email
+
+    # Known from the index
+    assert get(['id', 'keywords', 'mailboxIds'])['keywords'] == {}
+    assert parsed == []
+    email = get(['id', 'size', 'receivedAt'])
+    assert email['size'] == len(b'Subject: 1.a.host\n\nbody\n')
+    assert parsed == []
+
+    # Only what was asked for is returned
+    assert get(['subject']) == {'id': f'{inbox}-1', 'subject': '1.a.host'}
+    assert len(parsed) == 1
+    assert get(['threadId']) == {'id': f'{inbox}-1', 'threadId': f'{inbox}-1'}
+    assert parsed == []
+
+    # Headers are read from the message, without parsing all of it
+    assert get(['header:Subject', 'header:Subject:asText', 'header:X-Unknown']) == {
+        'id': f'{inbox}-1', 'header:Subject': '1.a.host', 'header:Subject:asText': '1.a.host',
+        'header:X-Unknown': None}
+    assert parsed == []
+
+
+def test_index_snapshot(maildir):
+    index = MaildirIndex(maildir)
+    index.update()
+    snapshot = index.snapshot()
+
+    os.remove(os.path.join(maildir, 'new', '1.a.host'))
+    make_old(os.path.join(maildir, 'new'))
+    assert index.update() is True
+    assert len(index.folders[make_id('')].messages) == 2
+    assert len(snapshot.folders[make_id('')].messages) == 3
+    assert snapshot.get_message(f'{make_id("")}-1')[1].filename == '1.a.host'
+    assert snapshot.state == index.state - 1
+
+
+def test_index_recent_change(maildir):
+    index = MaildirIndex(maildir)
+    index.update()
+
+    # A message is delivered, and another one right after, so fast that the
+    # modification time of the directory does not change.
+    new = os.path.join(maildir, 'new')
+    with open(os.path.join(new, '6.f.host'), 'wb'):
+        pass
+    assert index.update() is True
+    mtime = os.stat(new).st_mtime_ns
+    with open(os.path.join(new, '7.g.host'), 'wb'):
+        pass
+    os.utime(new, ns=(mtime, mtime))
+
+    assert index.update() is True
+    assert {'6.f.host', '7.g.host'} <= set(index.folders[make_id('')].messages)
+
+
+def test_module_concurrent_requests(maildir):
+    module = MailboxEmailModule(maildir)
+    pool = ThreadPoolExecutor(8)
+    server = Server(modules=[module], api_url='/api', auth_backend=None, pool=pool)
+
+    def request(i):
+        with open(os.path.join(maildir, 'new', f'{100 + i}.x.host'), 'wb') as file:
+            file.write(b'Subject: New\n\nbody\n')
+        return server.handle_request_from_json([
+            ['Mailbox/get', {'accountId': 'a'}, 'm'],
+            ['Email/query', {'accountId': 'a'}, 'q'],
+            ['Email/get', {'accountId': 'a', '#ids': {'resultOf': 'q', 'name': 'Email/query', 'path': '/ids'},
+                           'properties': ['subject']}, 'g'],
+        ], context=None)['methodResponses']
+
+    with ThreadPoolExecutor(8) as requests:
+        responses = list(requests.map(request, range(20)))
+    pool.shutdown()
+
+    for response in responses:
+        assert [name for name, data, client_id in response] == ['Mailbox/get', 'Email/query', 'Email/get']
+    assert MaildirIndex(maildir).update() is False
+    assert len(MaildirIndex(maildir).folders[make_id('')].messages) == 23
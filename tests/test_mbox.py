@@ -0,0 +1,460 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pytest
+
+from archive import maildir as maildir_module
+from archive.maildir import MboxModule
+from archive.mboxindex import MboxIndex, short_hash
+from archive.mboxreader import MboxReader
+from archive.mimeparse import BATCH_SIZE, MboxChanged, parse_message, parse_messages, record_to_email
+from jmap.server.sansio import Server
+
+
+def make_message(i, *, reply_to=None):
+    references = f'References: <m{reply_to}@example.com>\n' if reply_to is not None else ''
+    return (
+        f'From sender@example.com Sat Jan  3 01:05:34 1996\n'
+        f'Message-ID: <m{i}@example.com>\n'
+        f'{references}'
+        f'Date: Sat, 3 Jan 1996 01:05:{i:02d} +0000\n'
+        f'Subject: Message {i}\n'
+        f'\n'
+        f'Body {i}\n'
+        f'>From the body\n'
+        f'\n'
+    ).encode('utf-8')
+
+
+@pytest.fixture
+def mbox_path(tmp_path):
+    path = tmp_path / 'mbox'
+    path.write_bytes(b''.join([
+        make_message(0), make_message(1, reply_to=0), make_message(2), make_message(3, reply_to=0),
+    ]))
+    return str(path)
+
+
+def test_index(mbox_path):
+    index = MboxIndex(mbox_path)
+    assert index.update() is True
+    assert index.update() is False
+
+    entries = index.get_range(0, None)
+    assert [entry.message_id for entry in entries] == [f'm{i}@example.com' for i in range(4)]
+    assert entries[1].date == 820631101
+    assert entries[0].thread_id == entries[1].thread_id == entries[3].thread_id != entries[2].thread_id
+    assert bytes(index.read(entries[2])) == make_message(2).split(b'\n', 1)[1][:-1]
+    assert entries[2].size == len(index.read(entries[2]))
+    assert index.read_headers(entries[2])['Subject'] == 'Message 2'
+
+    assert index.get_range(1, 2) == entries[1:3]
+    assert index.get_many([entries[3].id, 'unknown', entries[0].id]) == [entries[0], entries[3]]
+    assert index.get_threads([entries[0].thread_id]) == [entries[0], entries[1], entries[3]]
+
+    # Opened again, the existing index is used
+    index.close()
+    index = MboxIndex(mbox_path)
+    assert index.update() is False
+    assert index.get_range(0, None) == entries
+
+
+def test_index_rebuilt_when_changed(mbox_path):
+    index = MboxIndex(mbox_path)
+    index.update()
+    ids = [entry.id for entry in index.get_range(0, None)]
+
+    # Rewrite the file with the first message twice
+    with open(mbox_path, 'r+b') as file:
+        data = file.read()
+        file.seek(0)
+        file.write(make_message(0) + data)
+    os.utime(mbox_path, ns=(0, 0))
+
+    assert index.update() is True
+    new_ids = [entry.id for entry in index.get_range(0, None)]
+    assert new_ids[1:] == [f'{ids[0]}-2'] + ids[1:]
+    assert new_ids[0] == ids[0]
+
+
+def test_module(mbox_path):
+    module = MboxModule(mbox_path)
+    server = Server(modules=[module], api_url='/api', auth_backend=None)
+    response = server.handle_request_from_json([
+        ['Email/query', {'accountId': 'a', 'position': 1, 'limit': 2}, 'q'],
+        ['Thread/get', {'accountId': 'a', 'ids': ['unknown']}, 't'],
+    ], context=None)['methodResponses']
+
+    entries = module.index.get_range(0, None)
+    assert response[0][1].ids == [entries[1].id, entries[2].id]
+    assert response[0][1].total == 4
+    assert response[0][1].query_state == str(module.index.state)
+    assert response[1][1].not_found == ['unknown']
+
+    # An empty list of ids is not the same as none
+    response = server.handle_request_from_json([
+        ['Email/get', {'accountId': 'a', 'ids': []}, 'g'],
+        ['Thread/get', {'accountId': 'a', 'ids': []}, 't'],
+    ], context=None)['methodResponses']
+    assert response[0][1].list == response[1][1].list == []
+
+    response = server.handle_request_from_json([
+        ['Thread/get', {'accountId': 'a', 'ids': [entries[0].thread_id]}, 't'],
+    ], context=None)['methodResponses']
+    assert response[0][1].to_client()['list'] == [
+        {'id': entries[0].thread_id, 'emailIds': [entries[0].id, entries[1].id, entries[3].id]}
+    ]
+
+
+def test_reader(tmp_path):
+    path = tmp_path / 'mbox'
+    path.write_bytes(b'garbage\nFrom a\nX: 1\n\nFrom b\nFrom c\nY: 2\n\nbody\n\nFrom d\nZ: 3')
+    reader = MboxReader(str(path))
+    messages = list(reader.scan())
+    assert [bytes(reader.get(*message)) for message in messages] == [
+        b'X: 1\n', b'', b'Y: 2\n\nbody\n', b'Z: 3']
+    assert reader.get_header_bytes(*messages[2]) == b'Y: 2\n'
+    assert reader.get_headers(*messages[3])['Z'] == '3'
+
+    with open(path, 'ab') as file:
+        file.write(b'\n\nFrom e\nW: 4\n')
+    reader.refresh()
+    assert [bytes(reader.get(*message)) for message in reader.scan(messages[-1][0])] == [
+        b'Z: 3\n', b'W: 4\n']
+    reader.close()
+
+
+def test_reader_empty_file(tmp_path):
+    path = tmp_path / 'mbox'
+    path.write_bytes(b'')
+    reader = MboxReader(str(path))
+    assert list(reader.scan()) == []
+    reader.close()
+
+
+def test_index_appended(mbox_path):
+    index = MboxIndex(mbox_path)
+    index.update()
+    entries = index.get_range(0, None)
+    state = index.state
+
+    with open(mbox_path, 'ab') as file:
+        file.write(make_message(4, reply_to=2))
+    assert index.update() is True
+    assert index.state == state + 1
+    new_entries = index.get_range(0, None)
+    assert new_entries[:4] == entries
+    assert new_entries[4].message_id == 'm4@example.com'
+    assert new_entries[4].thread_id == entries[2].thread_id
+
+    # The last message was still being written
+    data = make_message(5)
+    with open(mbox_path, 'ab') as file:
+        file.write(data[:60])
+    index.update()
+    with open(mbox_path, 'ab') as file:
+        file.write(data[60:])
+    index.update()
+    assert index.get_range(0, None)[:5] == new_entries
+    assert bytes(index.read(index.get_range(5, 1)[0])) == data.split(b'\n', 1)[1][:-1]
+
+    # Truncated, the index is rebuilt, and the state still increases
+    state = index.state
+    with open(mbox_path, 'r+b') as file:
+        file.truncate(entries[2].offset)
+    assert index.update() is True
+    assert index.get_range(0, None) == entries[:2]
+    assert index.state > state
+
+
+def test_index_appended_rewritten(mbox_path):
+    index = MboxIndex(mbox_path)
+    index.update()
+
+    # Grown, but not by appending to the file
+    with open(mbox_path, 'r+b') as file:
+        data = file.read()
+        file.seek(0)
+        file.write(data.replace(b'Subject: Message 0', b'Subject: Message 00') + make_message(4))
+    index.update()
+    assert index.read_headers(index.get_range(0, 1)[0])['Subject'] == 'Message 00'
+    assert index.count() == 5
+
+
+MULTIPART_MESSAGE = b'''From: =?utf-8?q?J=C3=B6rg?= <j@example.com>, b@example.com
+Subject: =?utf-8?q?Gr=C3=BC=C3=9Fe?=
+Date: Sat, 3 Jan 1996 01:05:34 +0100
+Message-ID: <a@example.com>
+Status: RO
+Content-Type: multipart/mixed; boundary=X
+
+--X
+Content-Type: multipart/alternative; boundary=Y
+
+--Y
+Content-Type: text/plain; charset=utf-8
+
+Hello,
+  world
+--Y
+Content-Type: text/html
+
+<p>Hello</p>
+--Y--
+--X
+Content-Type: application/pdf
+Content-Disposition: attachment; filename=a.pdf
+Content-Transfer-Encoding: base64
+
+aGVsbG8=
+--X--
+'''
+
+
+def test_parse_message():
+    email = record_to_email(parse_message(MULTIPART_MESSAGE))
+    assert email['from'] == [{'name': 'Jörg', 'email': 'j@example.com'}, {'name': None, 'email': 'b@example.com'}]
+    assert email['to'] is None
+    assert email['subject'] == 'Grüße'
+    assert email['messageId'] == ['a@example.com']
+    assert email['sentAt'] == datetime(1996, 1, 3, 0, 5, 34, tzinfo=timezone.utc)
+    assert email['keywords'] == {'$seen': True}
+    assert email['preview'] == 'Hello, world'
+    assert email['hasAttachment'] is True
+
+    assert [part['type'] for part in email['bodyStructure']['subParts']] == ['multipart/alternative', 'application/pdf']
+    assert [part['type'] for part in email['textBody']] == ['text/plain']
+    assert [part['type'] for part in email['htmlBody']] == ['text/html']
+    attachment, = email['attachments']
+    assert (attachment['name'], attachment['size'], attachment['disposition']) == ('a.pdf', 5, 'attachment')
+
+    # Without an html part, the text part is used for both
+    email = record_to_email(parse_message(b'Subject: Plain\n\n<b>Body</b>'))
+    assert email['textBody'] == email['htmlBody'] == [email['bodyStructure']]
+    assert email['preview'] == '<b>Body</b>'
+    assert email['hasAttachment'] is False
+
+
+def test_parse_messages(mbox_path):
+    reader = MboxReader(mbox_path)
+    ranges = [(seq, offset, length) for seq, (offset, length) in enumerate(reader.scan())]
+    reader.close()
+
+    records = list(parse_messages(mbox_path, ranges, workers=2, batch_size=1))
+    assert records == list(parse_messages(mbox_path, ranges, workers=1))
+    assert [seq for seq, record in records] == [0, 1, 2, 3]
+    assert [record['subject'] for seq, record in records] == [f'Message {i}' for i in range(4)]
+    assert records[1][1]['references'] == ['m0@example.com']
+    assert records[1][1]['receivedAt'] == 820631134
+
+
+def test_parse_messages_changed(mbox_path, tmp_path):
+    reader = MboxReader(mbox_path)
+    ranges = [(seq, offset, length) for seq, (offset, length) in enumerate(reader.scan())]
+    stat = reader.stat
+    reader.close()
+
+    # Replaced by another file between finding the messages and parsing them
+    other = tmp_path / 'other'
+    other.write_bytes(open(mbox_path, 'rb').read())
+    os.replace(other, mbox_path)
+    for workers in (1, 2):
+        with pytest.raises(MboxChanged):
+            list(parse_messages(mbox_path, ranges, stat=stat, workers=workers, batch_size=1))
+
+
+def test_index_workers(tmp_path):
+    # Enough messages for more than one batch, to be parsed by the workers
+    path = tmp_path / 'mbox'
+    path.write_bytes(b''.join(make_message(i, reply_to=0 if i else None) for i in range(BATCH_SIZE + 1)))
+    index = MboxIndex(str(path), str(tmp_path / 'index'), workers=2)
+    index.update()
+    reference = MboxIndex(str(path), str(tmp_path / 'reference'), workers=1)
+    reference.update()
+
+    entries = index.get_range(0, None)
+    assert len(entries) == BATCH_SIZE + 1
+    assert index.get_records(entries) == reference.get_records(reference.get_range(0, None))
+    assert index.get_records(entries[-1:])[BATCH_SIZE]['subject'] == f'Message {BATCH_SIZE}'
+
+
+def test_module_email_get(mbox_path):
+    module = MboxModule(mbox_path, workers=1)
+    server = Server(modules=[module], api_url='/api', auth_backend=None)
+    entries = module.index.get_range(0, None)
+    response = server.handle_request_from_json([
+        ['Email/get', {'accountId': 'a', 'ids': [entries[1].id, 'unknown']}, 'g'],
+    ], context=None)['methodResponses']
+
+    email, = response[0][1].list
+    assert response[0][1].not_found == ['unknown']
+    assert (email['id'], email['threadId'], email['size']) == (entries[1].id, entries[1].thread_id, entries[1].size)
+    assert email['subject'] == 'Message 1'
+    assert email['preview'] == 'Body 1 >From the body'
+    assert email['receivedAt'] == datetime(1996, 1, 3, 1, 5, 34, tzinfo=timezone.utc)
+
+
+def test_module_email_get_properties(mbox_path, monkeypatch):
+    module = MboxModule(mbox_path, workers=1)
+    server = Server(modules=[module], api_url='/api', auth_backend=None)
+    entry = module.index.get_range(0, None)[1]
+
+    loaded = []
+    original_get_records = module.index.get_records
+
+    def get_records(entries):
+        loaded.append(entries)
+        return original_get_records(entries)
+
+    monkeypatch.setattr(module.index, 'get_records', get_records)
+
+    def get(properties):
+        del loaded[:]
+        response = server.handle_request_from_json([
+            ['Email/get', {'accountId': 'a', 'ids': [entry.id], 'properties': properties}, 'g'],
+        ], context=None)['methodResponses']
+        email, = response[0][1].list
+        return email
+
+    # Known from the index
+    assert get(['threadId', 'size']) == {'id': entry.id, 'threadId': entry.thread_id, 'size': entry.size}
+    assert loaded == []
+    assert get(['header:Subject', 'header:Message-ID:asMessageIds']) == {
+        'id': entry.id, 'header:Subject': 'Message 1', 'header:Message-ID:asMessageIds': ['m1@example.com']}
+    assert loaded == []
+
+    assert get(['subject']) == {'id': entry.id, 'subject': 'Message 1'}
+    assert len(loaded) == 1
+
+
+def test_reader_file_replaced(tmp_path):
+    path = tmp_path / 'mbox'
+    path.write_bytes(make_message(0))
+    reader = MboxReader(str(path))
+    view = reader.get(*next(reader.scan()))
+
+    # Written to a new file, which is then renamed over the old one
+    new_path = tmp_path / 'mbox.new'
+    new_path.write_bytes(make_message(1) + make_message(2))
+    os.replace(new_path, path)
+
+    reader.refresh()
+    assert len(list(reader.scan())) == 2
+    # Views of the previous mapping remain usable
+    assert bytes(view).startswith(b'Message-ID: <m0@example.com>')
+    view.release()
+    reader.close()
+
+
+def test_index_file_replaced(mbox_path):
+    index = MboxIndex(mbox_path)
+    index.update()
+
+    new_path = f'{mbox_path}.new'
+    with open(new_path, 'wb') as file:
+        file.write(make_message(5) + make_message(6))
+    os.replace(new_path, mbox_path)
+
+    assert index.update() is True
+    assert [entry.message_id for entry in index.get_range(0, None)] == ['m5@example.com', 'm6@example.com']
+    assert index.update() is False
+
+
+def test_index_appended_while_updating(mbox_path, monkeypatch):
+    index = MboxIndex(mbox_path)
+    index.update()
+
+    # Mail arrives right after the file was mapped, before it is indexed
+    refresh = MboxReader.refresh
+
+    def refresh_then_append(reader):
+        refresh(reader)
+        monkeypatch.setattr(MboxReader, 'refresh', refresh)
+        with open(mbox_path, 'ab') as file:
+            file.write(make_message(5))
+
+    monkeypatch.setattr(MboxReader, 'refresh', refresh_then_append)
+    with open(mbox_path, 'ab') as file:
+        file.write(make_message(4))
+    index.update()
+    assert index.count() == 5
+
+    assert index.update() is True
+    assert [entry.message_id for entry in index.get_range(4, None)] == ['m4@example.com', 'm5@example.com']
+
+
+def test_module_concurrent_requests(mbox_path):
+    module = MboxModule(mbox_path, workers=1)
+    pool = ThreadPoolExecutor(8)
+    server = Server(modules=[module], api_url='/api', auth_backend=None, pool=pool)
+
+    def request(i):
+        # Rewrite the file now and then, to have the index rebuilt
+        if i % 5 == 0:
+            with open(mbox_path, 'r+b') as file:
+                data = file.read()
+                file.seek(0)
+                file.write(make_message(100 + i) + data)
+        else:
+            with open(mbox_path, 'ab') as file:
+                file.write(make_message(100 + i))
+        return server.handle_request_from_json([
+            ['Email/query', {'accountId': 'a'}, 'q'],
+            ['Email/get', {'accountId': 'a', '#ids': {'resultOf': 'q', 'name': 'Email/query', 'path': '/ids'},
+                           'properties': ['subject']}, 'g'],
+            ['Thread/get', {'accountId': 'a', 'ids': None}, 't'],
+        ], context=None)['methodResponses']
+
+    with ThreadPoolExecutor(8) as requests:
+        responses = list(requests.map(request, range(20)))
+    pool.shutdown()
+
+    for response in responses:
+        assert [name for name, data, client_id in response] == ['Email/query', 'Email/get', 'Thread/get']
+
+
+def test_module_does_not_lock_index_while_building_response(mbox_path, monkeypatch):
+    module = MboxModule(mbox_path, workers=1)
+    server = Server(modules=[module], api_url='/api', auth_backend=None)
+
+    def is_locked():
+        if not module.index.lock.acquire(blocking=False):
+            return True
+        module.index.lock.release()
+        return False
+
+    locked = []
+    original_record_to_email = maildir_module.record_to_email
+
+    def record_to_email(record):
+        with ThreadPoolExecutor(1) as other:
+            locked.append(other.submit(is_locked).result())
+        return original_record_to_email(record)
+
+    monkeypatch.setattr('archive.maildir.record_to_email', record_to_email)
+    response = server.handle_request_from_json([
+        ['Email/get', {'accountId': 'a', 'properties': ['subject']}, 'g'],
+    ], context=None)['methodResponses']
+    assert [email['subject'] for email in response[0][1].list] == [f'Message {i}' for i in range(4)]
+    assert locked == [False] * 4
+
+
+def test_index_8bit_headers(tmp_path):
+    path = tmp_path / 'mbox'
+    path.write_bytes(
+        b'From sender@example.com Sat Jan  3 01:05:34 1996\n'
+        b'Message-ID: <m\xe9@example.com>\n'
+        b'References: <r\xe9@example.com> <m0@example.com>\n'
+        b'Date: Sat, 3 Jan 1996 01:05:34 -0000 \xe9\n'
+        b'Subject: Caf\xe9\n'
+        b'\n'
+        b'Body\n')
+    index = MboxIndex(str(path))
+    index.update()
+
+    entry, = index.get_range(0, None)
+    assert entry.message_id == 'm�@example.com'
+    assert entry.thread_id == short_hash('r�@example.com'.encode('utf-8'))
+    # -0000 is UTC, not local time
+    assert entry.date == 820631134
@@ -5,7 +5,8 @@ import pytest
 from marshmallow import ValidationError
 
 from jmap.models.models import Email, HeaderFieldQuery, EmailBodyPart, \
-    EmailGetArgs, HeaderFieldForm, QueriedHeaderField
+    EmailGetArgs, HeaderFieldForm, QueriedHeaderField, Mailbox, MailboxGetArgs, \
+    MailboxGetResponse, EmailGetResponse
 
 
 
@@ -75,6 +76,15 @@ def test_from_property():
     })
 
 
+def test_unknown_property():
+    # The JSON keys are required, not the Python names.
+    with pytest.raises(ValidationError):
+        EmailGetArgs.from_client({
+            'accountId': '1',
+            'properties': ['blob_id']
+        })
+
+
 def test_email_header():
     # This is testing we can use the header:** property when parsing an email
     em = Email(
@@ -126,4 +136,28 @@ def test_email_header():
       "receivedAt": "2014-12-22T03:12:58.019077+00:00",
       "size": 1,
       "header:From:asRaw": "1"
-    })
\ No newline at end of file
+    })
+
+
+def test_get_response_properties():
+    """
+    The response to /get only includes the properties requested.
+    """
+    mailbox = Mailbox.Properties(id='1', name='Inbox', role='inbox', is_subscribed=True)
+    response = MailboxGetResponse(account_id='a', state='1', not_found=[], list=[mailbox])
+
+    args = MailboxGetArgs.from_client({'accountId': 'a', 'properties': ['name', 'isSubscribed']})
+    assert response.to_client(properties=args.properties) == {
+        'accountId': 'a', 'state': '1', 'notFound': [],
+        'list': [{'id': '1', 'name': 'Inbox', 'isSubscribed': True}]
+    }
+    assert response.to_client()['list'] == [
+        {'id': '1', 'name': 'Inbox', 'role': 'inbox', 'isSubscribed': True}]
+
+    email = Email.Properties(
+        id='1', subject='Hi', size=10,
+        header_fields=[QueriedHeaderField(name='From', value='x')])
+    response = EmailGetResponse(account_id='a', state='1', not_found=[], list=[email])
+    args = EmailGetArgs.from_client({'accountId': 'a', 'properties': ['subject', 'header:From:asRaw']})
+    assert response.to_client(properties=args.properties)['list'] == [
+        {'id': '1', 'subject': 'Hi', 'header:From:asRaw': 'x'}]
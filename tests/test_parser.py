@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from jmap.models.errors import JMapLimit, JMapNotJSON, JMapNotRequest
+from jmap.models.models import JMapRequest
+from jmap.modules.core import CoreModule
+from jmap.server.parser import RequestParser
+from jmap.server.sansio import Server
+
+
+def parse(body, chunk_size=1, **limits):
+    parser = RequestParser(**limits)
+    for index in range(0, len(body), chunk_size):
+        parser.feed(body[index:index + chunk_size])
+    return parser.close()
+
+
+REQUEST = {
+    'using': ['urn:ietf:params:jmap:core'],
+    'methodCalls': [
+        ['Core/echo', {'ids': ['a', 'b', 'c'], 'x': '[{"\\\\\\"ids'}, 'c1'],
+        ['Email/get', {'ids': ['1', '2'], 'properties': ['id', 'keywords'], 'n': [1.5e3, -2, True, None]}, 'c2'],
+        ['Email/get', {'#ids': {'resultOf': 'c2', 'name': 'Email/get', 'path': '/ids'}}, 'c3'],
+        ['Email/set', {'create': {'k1': {}}, 'update': {'1': {'a': [1, 2, 3]}}, 'destroy': ['2', '3']}, 'c4'],
+    ],
+}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1024])
+@pytest.mark.parametrize('request_json', [REQUEST, REQUEST['methodCalls']])
+def test_parse(request_json, chunk_size):
+    body = json.dumps(request_json, indent=1).encode('utf-8')
+    request = parse(body, chunk_size, max_calls_in_request=4, max_objects_in_get=2, max_objects_in_set=4)
+    assert request == JMapRequest.from_json(request_json)
+
+
+@pytest.mark.parametrize('limits, limit', [
+    ({'max_size_request': 100}, 'maxSizeRequest'),
+    ({'max_calls_in_request': 3}, 'maxCallsInRequest'),
+    ({'max_objects_in_get': 1}, 'maxObjectsInGet'),
+    ({'max_objects_in_set': 3}, 'maxObjectsInSet'),
+])
+def test_limits(limits, limit):
+    body = json.dumps(REQUEST).encode('utf-8')
+    with pytest.raises(JMapLimit) as exc:
+        parse(body, **limits)
+    assert exc.value.to_json()['limit'] == limit
+
+
+def test_limit_before_end():
+    """
+    The request is rejected as soon as it has too many method calls.
+    """
+    parser = RequestParser(max_calls_in_request=2)
+    parser.feed(b'[["Core/echo", {}, "1"], ["Core/echo", {}, "2"], ')
+    with pytest.raises(JMapLimit):
+        parser.feed(b'[')
+
+
+@pytest.mark.parametrize('body, error', [
+    (b'{"methodCalls": [', JMapNotJSON),
+    (b'\xff', JMapNotJSON),
+    (b'{"methodCalls": [["Core/echo", {}]]}', JMapNotRequest),
+    (b'"Core/echo"', JMapNotRequest),
+    (b'{"using": []}', JMapNotRequest),
+])
+def test_invalid(body, error):
+    with pytest.raises(error):
+        parse(body)
+
+
+def test_handle_request_from_stream():
+    server = Server(modules=[CoreModule()], api_url='/api', auth_backend=None)
+    body = [b'[["Core/echo", {"a": 1}, ', b'"c1"]]']
+    assert server.handle_request_from_stream(body, context=None) == {
+        'methodResponses': [['Core/echo', {'a': 1}, 'c1']]
+    }
+    body = [b'['] + [b'["Core/echo", {}, "c1"],'] * 20
+    assert server.handle_request_from_stream(body, context=None)['limit'] == 'maxCallsInRequest'
+    assert server.handle_request_from_stream([b'['] * 2000, context=None)['type'] == \
+        'urn:ietf:params:jmap:error:notJSON'